@@ -0,0 +1,69 @@
+"""
+Measures how many float datapoints per second are stored by FloatDataRepository.save_entity, which merges and commits
+every datapoint, by bulk_insert, which uses one executemany per table, and by bulk_copy, which uses COPY. Runs against
+the test database, which is dropped and recreated.
+
+Usage: python -m benchmark.bulk_insert [datapoints per method]
+"""
+
+from database.database import DatabaseConnector, DatabaseTools
+from benchmark.interval_query import set_up, BEGIN, BATCH_SIZE
+from repositories.repositories import FloatDataRepository
+from model.data_access_objects import FloatData
+from datetime import timedelta
+from util.mode import Mode
+import random
+import time
+import sys
+
+
+def create_rows(count, dataSource_id, run_id):
+    return [{"data_source_id": dataSource_id, "run_id": run_id, "receiving_start": BEGIN + timedelta(seconds=i),
+             "receiving_done": None, "data": random.random(), "packets": 1, "packets_received": 1,
+             "message_id": i, "size": 4} for i in range(count)]
+
+
+def save_entity(repository, session, rows, tumblebase_id):
+    for row in rows:
+        repository.save_entity(FloatData(**row), session)
+
+
+def bulk_insert(repository, session, rows, tumblebase_id):
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        for row, datapoint_id in zip(batch, repository.reserve_ids(len(batch), session)):
+            row["id"] = datapoint_id
+        repository.bulk_insert(batch, tumblebase_id, session)
+        session.commit()
+
+
+def bulk_copy(repository, session, rows, tumblebase_id):
+    for start in range(0, len(rows), BATCH_SIZE):
+        repository.bulk_copy(rows[start:start + BATCH_SIZE], tumblebase_id, session)
+        session.commit()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    database_connector = DatabaseConnector()
+    database_connector.connection_string = DatabaseConnector.get_connection_string(mode=Mode.test)
+    database_connector.pool_size = DatabaseConnector.get_pool_size(mode=Mode.test)
+    database_tools = DatabaseTools(database_connector)
+    database_tools.drop_database()
+    database_tools.create_database()
+
+    repository = FloatDataRepository.get_repository(Mode.test)
+    session = database_connector.session
+    tumblebase_id, dataSource_ids, run_ids = set_up(session)
+
+    print(f"{'method':>12} {'datapoints/s':>14}")
+    for i, method in enumerate([save_entity, bulk_insert, bulk_copy]):
+        # a run per method, datapoints with a message id already stored for the data source and run are skipped
+        rows = create_rows(count, dataSource_ids[0], run_ids[i])
+        begin = time.perf_counter()
+        method(repository, session, rows, tumblebase_id)
+        print(f"{method.__name__:>12} {count / (time.perf_counter() - begin):>14.0f}")
+
+    session.close()
+    database_tools.drop_database()
+    database_connector.engine.dispose()
@@ -0,0 +1,109 @@
+"""
+Measures the latency of FloatDataRepository.get_by_dataSource_id_and_run_id_interval against the size of the floatdata
+table, once with and once without the (data_source_id, run_id, receiving_start) index. The table is filled with
+datapoints of several data sources and runs, the queried interval always contains the same number of datapoints.
+Runs against the test database, which is dropped and recreated.
+
+Usage: python -m benchmark.interval_query [table sizes ...]
+"""
+
+from database.database import DatabaseConnector, DatabaseTools
+from model.data_access_objects import Tumbleweed, TumbleBase, DataSource, Run, FloatData
+from repositories.repositories import FloatDataRepository
+from model.enums import DType
+from datetime import datetime, timedelta, timezone
+from util.mode import Mode
+import random
+import time
+import sys
+
+
+DATA_SOURCES = 10
+RUNS = 10
+INTERVAL_POINTS = 1000
+REPETITIONS = 5
+BATCH_SIZE = 10000
+BEGIN = datetime(2019, 1, 1, tzinfo=timezone.utc)
+
+
+def set_up(session):
+    now = datetime.now(timezone.utc)
+    tumbleweed = Tumbleweed(address="1234567890123456", created_at=now, name="Benchmark Tumbleweed")
+    tumblebase = TumbleBase(address="Benchmark", created_at=now, name="Benchmark TumbleBase", host="localhost")
+    session.add_all([tumbleweed, tumblebase])
+    session.flush()
+    dataSources = [DataSource(tumbleweed_id=tumbleweed.id, created_at=now, short_key=f"T{i}", dtype=DType.Float,
+                              name=f"Temperature {i}") for i in range(DATA_SOURCES)]
+    runs = [Run(tumbleweed_id=tumbleweed.id, created_at=now, ended_at=now, name=f"Run {i}") for i in range(RUNS)]
+    session.add_all(dataSources + runs)
+    session.commit()
+    return tumblebase.id, [dataSource.id for dataSource in dataSources], [run.id for run in runs]
+
+
+def fill(repository, session, count, tumblebase_id, dataSource_ids, run_ids, start):
+    """Append count datapoints, one per second for every combination of data source and run."""
+    while count > 0:
+        batch_size = min(count, BATCH_SIZE)
+        ids = repository.reserve_ids(batch_size, session)
+        rows = list()
+        for i, datapoint_id in enumerate(ids):
+            position = start + i
+            combination = position % (DATA_SOURCES * RUNS)
+            rows.append({"id": datapoint_id, "data_source_id": dataSource_ids[combination % DATA_SOURCES],
+                         "run_id": run_ids[combination // DATA_SOURCES],
+                         "receiving_start": BEGIN + timedelta(seconds=position // (DATA_SOURCES * RUNS)),
+                         "receiving_done": None, "data": random.random(), "packets": 1, "packets_received": 1,
+                         "message_id": position, "size": 4})
+        repository.bulk_insert(rows, tumblebase_id, session)
+        session.commit()
+        start += batch_size
+        count -= batch_size
+    session.execute("ANALYZE floatdata")
+    session.commit()
+    return start
+
+
+def measure(repository, session, dataSource_id, run_id, rows):
+    seconds = rows // (DATA_SOURCES * RUNS)
+    latencies = list()
+    for _ in range(REPETITIONS):
+        offset = random.randint(0, max(seconds - INTERVAL_POINTS, 0))
+        start = BEGIN + timedelta(seconds=offset)
+        end = start + timedelta(seconds=INTERVAL_POINTS - 1)
+        begin = time.perf_counter()
+        repository.get_by_dataSource_id_and_run_id_interval(dataSource_id, run_id, start, end, session)
+        latencies.append(time.perf_counter() - begin)
+        session.expunge_all()
+    return sorted(latencies)[len(latencies) // 2] * 1000
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+    database_connector = DatabaseConnector()
+    database_connector.connection_string = DatabaseConnector.get_connection_string(mode=Mode.test)
+    database_connector.pool_size = DatabaseConnector.get_pool_size(mode=Mode.test)
+    database_tools = DatabaseTools(database_connector)
+    database_tools.drop_database()
+    database_tools.create_database()
+
+    repository = FloatDataRepository.get_repository(Mode.test)
+    index = next(index for index in FloatData.__table__.indexes
+                 if index.name == "ix_floatdata_data_source_id_run_id_receiving_start")
+    session = database_connector.session
+    tumblebase_id, dataSource_ids, run_ids = set_up(session)
+
+    print(f"{'rows':>12} {'with index [ms]':>18} {'without index [ms]':>20}")
+    rows = 0
+    for size in sorted(sizes):
+        rows = fill(repository, session, size - rows, tumblebase_id, dataSource_ids, run_ids, rows)
+        with_index = measure(repository, session, dataSource_ids[0], run_ids[0], rows)
+        session.close()
+        index.drop(bind=database_connector.engine)
+        without_index = measure(repository, session, dataSource_ids[0], run_ids[0], rows)
+        session.close()
+        index.create(bind=database_connector.engine)
+        print(f"{rows:>12} {with_index:>18.2f} {without_index:>20.2f}")
+
+    session.close()
+    database_tools.drop_database()
+    database_connector.engine.dispose()
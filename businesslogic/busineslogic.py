@@ -1,13 +1,27 @@
 from model.data_access_objects import Tumbleweed, TumbleBase, Run, Command, CommandType, SubSystem, DataSource, FloatData, LongData, IntData, StringData, ByteData, ImageData
-from util.utils import internal_server_error_message, get_config_parser
-from repositories.repositories import TumbleweedRepository, TumbleBaseRepository, RunRepository, CommandRepository, CommandTypeRepository, SubSystemRepository, DataSourceRepository, LongDataRepository, IntDataRepository, FloatDataRepository, StringDataRepository, ByteDataRepository, ImageDataRepository
+from util.utils import internal_server_error_message, invalid_format_message, get_config_parser
+from repositories.repositories import TumbleweedRepository, TumbleBaseRepository, RunRepository, CommandRepository, CommandTypeRepository, SubSystemRepository, DataSourceRepository, LongDataRepository, IntDataRepository, FloatDataRepository, StringDataRepository, ByteDataRepository, ImageDataRepository, NumericDataRepository
 from exception.custom_exceptions import TumbleWebException, InternalServerError
-from model.data_transfer_objects import Tumbleweed as TumbleweedDTO, TumbleBase as TumbleBaseDTO, Run as RunDTO, Command as CommandDTO, CommandType as CommandTypeDTO, SubSystem as SubSystemDTO, DataSource as DataSourceDTO, LongData as LongDataDTO, IntData as IntDataDTO, FloatData as FloatDataDTO, StringData as StringDataDTO, ByteData as ByteDataDTO, ImageData as ImageDataDTO
+from model.data_transfer_objects import Tumbleweed as TumbleweedDTO, TumbleBase as TumbleBaseDTO, Run as RunDTO, Command as CommandDTO, CommandType as CommandTypeDTO, SubSystem as SubSystemDTO, DataSource as DataSourceDTO, LongData as LongDataDTO, IntData as IntDataDTO, FloatData as FloatDataDTO, StringData as StringDataDTO, ByteData as ByteDataDTO, ImageData as ImageDataDTO, ImageMetadata as ImageMetadataDTO, Aggregate as AggregateDTO
+from businesslogic.resolution_cache import ResolutionCache, Resolution
+from util.downsampling import series_from_chunks, lttb
+from businesslogic.image_garbage_collector import ImageGarbageCollector
+from businesslogic.reassembly_buffer import ReassemblyBuffer, MessageKey
+from businesslogic.command_dispatcher import CommandDispatcher, Delivery
+from businesslogic.tumblebase_client import TumbleBaseClientRegistry
+from util.thumbnails import ThumbnailGenerator
+from util.image_store import get_image_store
+from util.periodic_task import PeriodicTask
 from database.database import DatabaseConnector
+from datetime import datetime, timezone, timedelta
+from dataclasses import replace
+from marshmallow import ValidationError
 from logger.logger import LoggerFactory
 from abc import abstractmethod
+from model.enums import DType
 from functools import wraps
 from util.mode import Mode
+import os
 
 
 def execute_in_session(func):
@@ -23,7 +37,42 @@ def execute_in_session(func):
             result = func(*args, **kwargs)
 
             session.commit()
+            session.info.pop("after_rollback", None)
+            for callback in session.info.pop("after_commit", []):
+                callback()
             return result
+        except TumbleWebException as e:
+            _rollback(session)
+            raise e
+        except Exception as e:
+            business_logic._logger.error(business_logic.__class__.__name__ + "." + func.__name__ + "(): " + str(e))
+            _rollback(session)
+            raise InternalServerError(internal_server_error_message)
+        finally:
+            session.close()
+    return wrapper
+
+
+def _rollback(session):
+    session.rollback()
+    for callback in session.info.pop("after_rollback", []):
+        callback()
+
+
+def stream_in_session(func):
+    """
+    Like execute_in_session, but for generator methods. The session stays open until the generator is exhausted or
+    closed, so the results can be streamed from a server side cursor.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        business_logic = args[0]
+        session = business_logic._database_connector.session
+        kwargs["session"] = session
+        try:
+            yield from func(*args, **kwargs)
+            session.commit()
         except TumbleWebException as e:
             session.rollback()
             raise e
@@ -68,6 +117,16 @@ class TumbleWebLogic(BusinessLogic):
         self._byteData_repository = None
         self._imageData_repository = None
         self._secret_key = None
+        self._resolution_cache = None
+        self._delete_chunk_size = None
+        self._thumbnail_generator = None
+        self._image_garbage_collector = None
+        self._image_garbage_collection = None
+        self._reassembly_buffer = None
+        self._packet_expiry = None
+        self._tumblebase_clients = None
+        self._command_dispatcher = None
+        self._command_timeout_sweep = None
 
     @property
     def tumbleweed_repository(self):
@@ -154,6 +213,128 @@ class TumbleWebLogic(BusinessLogic):
             self._secret_key = environment_parser["environment"]["secret_key"]
         return self._secret_key
 
+    @property
+    def resolution_cache(self):
+        if self._resolution_cache is None:
+            environment_parser = get_config_parser("environment.ini")
+            ttl = float(environment_parser["resolution_cache"]["ttl"])
+            max_size = int(environment_parser["resolution_cache"]["max_size"])
+            self._resolution_cache = ResolutionCache(ttl=ttl, max_size=max_size)
+        return self._resolution_cache
+
+    @property
+    def delete_chunk_size(self):
+        if self._delete_chunk_size is None:
+            environment_parser = get_config_parser("environment.ini")
+            self._delete_chunk_size = int(environment_parser["delete"]["chunk_size"])
+        return self._delete_chunk_size if self._delete_chunk_size > 0 else None
+
+    @property
+    def thumbnail_generator(self):
+        if self._thumbnail_generator is None:
+            environment_parser = get_config_parser("environment.ini")
+            sizes = {"thumb": int(environment_parser["thumbnails"]["thumb"]),
+                     "preview": int(environment_parser["thumbnails"]["preview"])}
+            max_workers = int(environment_parser["thumbnails"]["workers"])
+            self._thumbnail_generator = ThumbnailGenerator(sizes, max_workers, self._logger)
+        return self._thumbnail_generator
+
+    @property
+    def reassembly_buffer(self):
+        if self._reassembly_buffer is None:
+            environment_parser = get_config_parser("environment.ini")
+            self._reassembly_buffer = ReassemblyBuffer(int(environment_parser["reassembly"]["max_messages"]),
+                                                       int(environment_parser["reassembly"]["max_bytes"]),
+                                                       int(environment_parser["reassembly"]["timeout"]))
+            self.start_packet_reassembly()
+        return self._reassembly_buffer
+
+    @property
+    def tumblebase_clients(self):
+        if self._tumblebase_clients is None:
+            max_in_flight = int(get_config_parser("environment.ini")["commands"]["max_in_flight"])
+            self._tumblebase_clients = TumbleBaseClientRegistry(self._get_tumblebase_address, pool_size=max_in_flight)
+        return self._tumblebase_clients
+
+    @property
+    def command_dispatcher(self):
+        if self._command_dispatcher is None:
+            environment_parser = get_config_parser("environment.ini")
+            self._command_dispatcher = CommandDispatcher(self.tumblebase_clients, self._mark_command_transmitted,
+                                                         int(environment_parser["commands"]["workers"]),
+                                                         int(environment_parser["commands"]["max_in_flight"]),
+                                                         float(environment_parser["commands"]["timeout"]),
+                                                         int(environment_parser["commands"]["max_attempts"]),
+                                                         float(environment_parser["commands"]["backoff"]),
+                                                         float(environment_parser["commands"]["max_backoff"]),
+                                                         self._logger)
+        return self._command_dispatcher
+
+    @property
+    def image_garbage_collector(self):
+        if self._image_garbage_collector is None:
+            min_age = int(get_config_parser("environment.ini")["image_gc"]["min_age"])
+            self._image_garbage_collector = ImageGarbageCollector(get_image_store().root_path,
+                                                                  self.thumbnail_generator.sizes.keys(), min_age,
+                                                                  self._logger)
+        return self._image_garbage_collector
+
+    @staticmethod
+    def get_dataPoint_dto_class(dtype):
+        """
+        Return the DTO class used to list datapoints of the dtype. Images are listed without their image.
+        """
+        if dtype == DType.Long:
+            return LongDataDTO
+        elif dtype == DType.Int:
+            return IntDataDTO
+        elif dtype == DType.Float:
+            return FloatDataDTO
+        elif dtype == DType.String:
+            return StringDataDTO
+        elif dtype == DType.Byte:
+            return ByteDataDTO
+        elif dtype == DType.Image:
+            return ImageMetadataDTO
+        else:
+            return None
+
+    @staticmethod
+    def _after_commit(session, callback):
+        """
+        Register a callback which is executed once the session was committed successfully, e.g. to invalidate a
+        cache only after the change is visible to other sessions.
+        """
+        session.info.setdefault("after_commit", []).append(callback)
+
+    @staticmethod
+    def _after_rollback(session, callback):
+        """
+        Register a callback which is executed if the session was rolled back, e.g. to undo a change of an in-memory
+        structure which was made for a transaction that did not go through.
+        """
+        session.info.setdefault("after_rollback", []).append(callback)
+
+    def _create_thumbnails_after_commit(self, session, image_path):
+        if image_path is not None:
+            self._after_commit(session, lambda: self.thumbnail_generator.submit(image_path))
+
+    def get_dataPoint_repository(self, dtype):
+        if dtype == DType.Long:
+            return self.longData_repository
+        elif dtype == DType.Int:
+            return self.intData_repository
+        elif dtype == DType.Float:
+            return self.floatData_repository
+        elif dtype == DType.String:
+            return self.stringData_repository
+        elif dtype == DType.Byte:
+            return self.byteData_repository
+        elif dtype == DType.Image:
+            return self.imageData_repository
+        else:
+            return None
+
     @staticmethod
     def get_business_logic(mode=Mode.productive):
         database_connector = DatabaseConnector()
@@ -170,84 +351,464 @@ class TumbleWebLogic(BusinessLogic):
     @execute_in_session
     def save_tumbleweed(self, tumbleweed_dto, session=None):
         tumbleweed_dao = Tumbleweed.create_from_dto(tumbleweed_dto)
-        tumbleweed_id = self.tumbleweed_repository.save_entity(tumbleweed_dao, session)
+        tumbleweed_id = self.tumbleweed_repository.insert_entity(tumbleweed_dao, session)
         return tumbleweed_id
 
     @execute_in_session
     def save_tumblebase(self, tumblebase_dto, session=None):
         tumblebase_dao = TumbleBase.create_from_dto(tumblebase_dto)
-        tumblebase_id = self.tumbleBase_repository.save_entity(tumblebase_dao, session)
+        tumblebase_id = self.tumbleBase_repository.insert_entity(tumblebase_dao, session)
         return tumblebase_id
 
     @execute_in_session
     def save_subSystem(self, subSystem_dto, session=None):
         subSystem_dao = SubSystem.create_from_dto(subSystem_dto)
-        subSystem_id = self.subSystem_repository.save_entity(subSystem_dao, session)
+        subSystem_id = self.subSystem_repository.insert_entity(subSystem_dao, session)
         return subSystem_id
 
     @execute_in_session
     def save_dataSource(self, dataSource_dto, session=None):
         dataSource_dao = DataSource.create_from_dto(dataSource_dto)
-        dataSource_id = self.dataSource_repository.save_entity(dataSource_dao, session)
+        dataSource_id = self.dataSource_repository.insert_entity(dataSource_dao, session)
         return dataSource_id
 
     @execute_in_session
     def save_commandType(self, commandType_dto, session=None):
         commandType_dao = CommandType.create_from_dto(commandType_dto)
-        commandType_id = self.commandType_repository.save_entity(commandType_dao, session)
+        commandType_id = self.commandType_repository.insert_entity(commandType_dao, session)
         return commandType_id
 
     @execute_in_session
     def save_command(self, command_dto, session=None):
         command_dao = Command.create_from_dto(command_dto)
-        command_id = self.command_repository.save_entity(command_dao, session)
+        command_id = self.command_repository.insert_entity(command_dao, session)
         return command_id
 
+    def send_command(self, tumbleweed_id, tumblebase_id, commandType_id, command_dto):
+        """
+        Store a command with all its foreign keys set in one insert and queue its delivery to the tumblebase, which
+        marks it as transmitted once the tumblebase accepted it. See broadcast_command.
+        :return: The id of the command.
+        :raise TumbleWebException: If the tumbleweed, its active run, the tumblebase or the command type does not exist.
+        """
+        result = self.broadcast_command(commandType_id, command_dto, [(tumbleweed_id, tumblebase_id)])[0]
+        if result["status"] != 202:
+            raise TumbleWebException(result["info"])
+        return result["info"]
+
+    @execute_in_session
+    def broadcast_command(self, commandType_id, command_dto, targets, session=None):
+        """
+        Store a command for every target and queue the deliveries, which run concurrently once the session is
+        committed. All targets are validated with one query and the commands of the valid ones are inserted with their
+        foreign keys set, all in one transaction.
+        :param targets: A list of (tumbleweed_id, tumblebase_id) pairs.
+        :return: A list with a result per target: {"status": 202, "info": command_id} if the command is queued,
+                 otherwise {"status": 400, "info": message}.
+        """
+        commandType_dao = self.commandType_repository.get_entity(commandType_id, session)
+        if commandType_dao is None:
+            raise TumbleWebException(f"The CommandType with id {commandType_id} does not exist.")
+        rows = {(row.tumbleweed_id, row.tumblebase_id): row
+                for row in self.command_repository.get_targets(targets, session)}
+        results = [None] * len(targets)
+        queued = list()
+        for index, (tumbleweed_id, tumblebase_id) in enumerate(targets):
+            row = rows[(tumbleweed_id, tumblebase_id)]
+            if not row.tumbleweed_exists:
+                message = f"The Tumbleweed with id {tumbleweed_id} does not exist."
+            elif row.tumbleweed_address is None:
+                message = f"The Tumbleweed with id {tumbleweed_id} has no address configured."
+            elif row.run_id is None:
+                message = f"The Tumbleweed {tumbleweed_id} is currently not active"
+            elif not row.tumblebase_exists:
+                message = f"The TumbleBase with id {tumblebase_id} does not exist."
+            else:
+                command_dao = Command.create_from_dto(command_dto)
+                command_dao.command_type_id = commandType_id
+                command_dao.sender_base_id = tumblebase_id
+                command_dao.tumbleweed_id = tumbleweed_id
+                command_dao.run_id = row.run_id
+                command_dao.transmitted = False
+                queued.append((index, row, command_dao))
+                continue
+            results[index] = {"status": 400, "info": message}
+        command_ids = self.command_repository.insert_entities([command_dao for _, _, command_dao in queued], session)
+        deliveries = list()
+        for (index, row, _), command_id in zip(queued, command_ids):
+            deliveries.append(Delivery(command_id, row.tumblebase_id,
+                                       self._get_command_payload(row.tumbleweed_address, commandType_dao.type,
+                                                                 command_dto.args)))
+            results[index] = {"status": 202, "info": command_id}
+        for delivery in deliveries:
+            self._after_commit(session, lambda delivery=delivery: self.command_dispatcher.dispatch(delivery))
+        return results
+
+    @execute_in_session
+    def dispatch_untransmitted_commands(self, session=None):
+        """
+        Queue the commands of active runs which have not been transmitted yet, for example because the process
+        stopped before they were delivered.
+        :return: The number of queued commands.
+        """
+        deliveries = [self._create_delivery(command_dao)
+                      for command_dao in self.command_repository.get_untransmitted_of_active_runs(session)]
+        for delivery in deliveries:
+            self._after_commit(session, lambda delivery=delivery: self.command_dispatcher.dispatch(delivery))
+        return len(deliveries)
+
+    def start_command_dispatch(self):
+        """Queue the commands left untransmitted by the previous process."""
+        self.dispatch_untransmitted_commands()
+
+    def get_command_dispatch_state(self):
+        return self.command_dispatcher.get_state()
+
+    @execute_in_session
+    def sweep_timed_out_commands(self, deadline, retry=False, session=None):
+        """
+        Flag the commands which did not get a response within the deadline. Every command is flagged once.
+        :param deadline: The seconds after its creation a command has to get a response.
+        :param retry: If True, the flagged commands of active runs are sent once more.
+        :return: The number of flagged commands.
+        """
+        now = datetime.now(timezone.utc)
+        command_ids = self.command_repository.mark_timed_out(now - timedelta(seconds=deadline), now, session)
+        if retry and len(command_ids) > 0:
+            for command_dao in self.command_repository.get_by_ids_of_active_runs(command_ids, session):
+                delivery = self._create_delivery(command_dao)
+                self._after_commit(session, lambda delivery=delivery: self.command_dispatcher.dispatch(delivery))
+        return len(command_ids)
+
+    def start_command_timeout_sweep(self):
+        """Flag timed out commands periodically in the background."""
+        if self._command_timeout_sweep is None:
+            environment_parser = get_config_parser("environment.ini")
+            interval = int(environment_parser["command_timeout"]["interval"])
+            deadline = int(environment_parser["command_timeout"]["deadline"])
+            retry = environment_parser.getboolean("command_timeout", "retry")
+            if interval > 0:
+                self._command_timeout_sweep = PeriodicTask(
+                    "command-timeout-sweep", lambda: self.sweep_timed_out_commands(deadline, retry), interval,
+                    self._logger)
+                self._command_timeout_sweep.start()
+
+    @execute_in_session
+    def get_unanswered_command_counts(self, session=None):
+        """Count the unanswered and timed out commands of the active run of every tumbleweed."""
+        return [{"tumbleweed_id": row.tumbleweed_id, "run_id": row.run_id, "unanswered": row.unanswered,
+                 "timed_out": row.timed_out}
+                for row in self.command_repository.count_unanswered_of_active_runs(session)]
+
+    def _create_delivery(self, command_dao):
+        return Delivery(command_dao.id, command_dao.sender_base_id,
+                        self._get_command_payload(command_dao.tumbleweed.address, command_dao.command_type.type,
+                                                  command_dao.args))
+
+    @execute_in_session
+    def _get_tumblebase_address(self, tumblebase_id, session=None):
+        """
+        Look up where the commands of a tumblebase are sent to.
+        :return: The host, port and command route of the tumblebase, or None if it does not exist.
+        """
+        tumblebase_dao = self.tumbleBase_repository.get_entity(tumblebase_id, session)
+        if tumblebase_dao is None:
+            return None
+        return tumblebase_dao.host, tumblebase_dao.port, tumblebase_dao.command_route
+
+    @staticmethod
+    def _get_command_payload(tumbleweed_address, commandType, args):
+        """The json sent to a tumblebase: the address of the tumbleweed and the command type, followed by +args."""
+        data = commandType
+        if args is not None:
+            data += f"+{args}"
+        return {"address": tumbleweed_address, "data": data}
+
+    def _mark_command_transmitted(self, command_id):
+        self.update_command(command_id, CommandDTO(transmitted=True))
+
     @execute_in_session
     def save_LongData(self, dataPoint_dto, session=None):
         dataPoint_dao = LongData.create_from_dto(dataPoint_dto)
-        dataPoint_id = self.longData_repository.save_entity(dataPoint_dao, session)
+        dataPoint_id = self.longData_repository.insert_entity(dataPoint_dao, session)
         return dataPoint_id
 
     @execute_in_session
     def save_FloatData(self, dataPoint_dto, session=None):
         dataPoint_dao = FloatData.create_from_dto(dataPoint_dto)
-        dataPoint_id = self.floatData_repository.save_entity(dataPoint_dao, session)
+        dataPoint_id = self.floatData_repository.insert_entity(dataPoint_dao, session)
         return dataPoint_id
 
     @execute_in_session
     def save_IntData(self, dataPoint_dto, session=None):
         dataPoint_dao = IntData.create_from_dto(dataPoint_dto)
-        dataPoint_id = self.intData_repository.save_entity(dataPoint_dao, session)
+        dataPoint_id = self.intData_repository.insert_entity(dataPoint_dao, session)
         return dataPoint_id
 
     @execute_in_session
     def save_StringData(self, dataPoint_dto, session=None):
         dataPoint_dao = StringData.create_from_dto(dataPoint_dto)
-        dataPoint_id = self.stringData_repository.save_entity(dataPoint_dao, session)
+        dataPoint_id = self.stringData_repository.insert_entity(dataPoint_dao, session)
         return dataPoint_id
 
     @execute_in_session
     def save_ByteData(self, dataPoint_dto, session=None):
         dataPoint_dao = ByteData.create_from_dto(dataPoint_dto)
-        dataPoint_id = self.byteData_repository.save_entity(dataPoint_dao, session)
+        dataPoint_id = self.byteData_repository.insert_entity(dataPoint_dao, session)
         return dataPoint_id
 
     @execute_in_session
     def save_ImageData(self, dataPoint_dto, session=None):
         dataPoint_dao = ImageData.create_from_dto(dataPoint_dto)
-        dataPoint_id = self.imageData_repository.save_entity(dataPoint_dao, session)
+        dataPoint_id = self.imageData_repository.insert_entity(dataPoint_dao, session)
+        self._create_thumbnails_after_commit(session, dataPoint_dao._data)
         return dataPoint_id
 
     @execute_in_session
     def start_run(self, run_dto, tumbleweed_id, session=None):
+        if self.tumbleweed_repository.get_entity(tumbleweed_id, session) is None:
+            return None
         run_dao = Run.create_from_dto(run_dto)
-        tumbleweed_dao = self.tumbleweed_repository.get_entity(tumbleweed_id, session)
-        tumbleweed_dao.runs.append(run_dao)
-        tumbleweed_id = self.tumbleweed_repository.save_entity(tumbleweed_dao, session)
-        run_id = self.run_repository.save_entity(run_dao, session)
+        # set the foreign key instead of appending to tumbleweed.runs, which would load the whole run history
+        run_dao.tumbleweed_id = tumbleweed_id
+        run_id = self.run_repository.insert_entity(run_dao, session)
+        self._after_commit(session, lambda: self.resolution_cache.invalidate_tumbleweed(tumbleweed_id))
         return run_id
 
+    @execute_in_session
+    def stop_run(self, tumbleweed_id, session=None):
+        run_dao = self.run_repository.get_active_run(tumbleweed_id, session)
+        if run_dao is None:
+            return None
+        run_dao.ended_at = datetime.now(timezone.utc)
+        run_id = run_dao.id
+        self._after_commit(session, lambda: self.resolution_cache.invalidate_run(run_id))
+        return run_id
+
+    """ Methods to ingest datapoints """
+
+    @execute_in_session
+    def ingest_datapoint(self, tumbleweed_address, tumblebase_address, short_key, dataPoint_json, schemas,
+                         tumblebase_host=None, session=None):
+        """
+        Store a datapoint sent by a tumblebase. The active run and the data source are resolved, the datapoint is
+        inserted with its foreign keys already set and linked to the tumblebase, all in one session and one commit.
+        A tumblebase which is not known yet is created on the fly. A datapoint which is stored already, with the
+        same message id for the data source and run, is not stored again but linked to the tumblebase.
+        :param tumbleweed_address: The address of the tumbleweed which sent the datapoint.
+        :param tumblebase_address: The address of the tumblebase which received the datapoint.
+        :param short_key: The short key of the data source.
+        :param dataPoint_json: The datapoint as sent by the tumblebase.
+        :param schemas: A dictionary which maps every DType to the schema loading the datapoint json.
+        :param tumblebase_host: The host stored for a newly created tumblebase.
+        :return: The id of the new or the already stored datapoint.
+        """
+        resolution = self._resolve_datapoint_targets(tumbleweed_address, [short_key], session).get(short_key)
+        if resolution is None:
+            raise TumbleWebException(f"The DataSource with short key {short_key} does not exist for tumbleweed with "
+                                     f"address {tumbleweed_address}.")
+        dataPoint_dto = self._load_datapoint(resolution.dtype, dataPoint_json, schemas)
+        tumblebase_dao = self._get_or_create_tumblebase(tumblebase_address, tumblebase_host, session)
+        dataPoint_repository = self.get_dataPoint_repository(resolution.dtype)
+        row = dataPoint_repository.entity_model.create_from_dto(dataPoint_dto).to_row()
+        row["data_source_id"] = resolution.data_source_id
+        row["run_id"] = resolution.run_id
+        dataPoint_id = dataPoint_repository.insert_datapoint(row, tumblebase_dao.id, session)
+        if resolution.dtype == DType.Image:
+            self._create_thumbnails_after_commit(session, row["_data"])
+        return dataPoint_id
+
+    @execute_in_session
+    def ingest_datapoints(self, tumbleweed_address, tumblebase_address, dataPoints_json, schemas,
+                          tumblebase_host=None, session=None):
+        """
+        Store a batch of datapoints of mixed data types sent by a tumblebase. Every item carries the short key of
+        its data source. Items are validated one by one, the valid ones are bulk inserted with one COPY per table for
+        numeric data and one executemany per table for all other data. All of them share one transaction.
+        :param dataPoints_json: A list of datapoints, each of them with an additional short_key.
+        :return: A list with a result for every item in the same order. Each result holds the status and either
+        the id of the new datapoint or the reason why it was rejected.
+        """
+        short_keys = {dataPoint_json.get("short_key") for dataPoint_json in dataPoints_json
+                      if isinstance(dataPoint_json, dict)}
+        resolutions = self._resolve_datapoint_targets(tumbleweed_address, short_keys, session)
+        results = [None] * len(dataPoints_json)
+        rows_by_dtype = dict()
+        for index, dataPoint_json in enumerate(dataPoints_json):
+            if not isinstance(dataPoint_json, dict):
+                results[index] = {"status": 400, "info": invalid_format_message}
+                continue
+            dataPoint_json = dataPoint_json.copy()
+            short_key = dataPoint_json.pop("short_key", None)
+            resolution = resolutions.get(short_key)
+            if resolution is None:
+                results[index] = {"status": 400, "info": f"The DataSource with short key {short_key} does not exist "
+                                                         f"for tumbleweed with address {tumbleweed_address}."}
+                continue
+            try:
+                dataPoint_dto = self._load_datapoint(resolution.dtype, dataPoint_json, schemas)
+            except TumbleWebException as e:
+                results[index] = {"status": 400, "info": str(e)}
+                continue
+            dataPoint_model = self.get_dataPoint_repository(resolution.dtype).entity_model
+            row = dataPoint_model.create_from_dto(dataPoint_dto).to_row()
+            row["data_source_id"] = resolution.data_source_id
+            row["run_id"] = resolution.run_id
+            rows_by_dtype.setdefault(resolution.dtype, []).append((index, row))
+        if len(rows_by_dtype) == 0:
+            return results
+        tumblebase_dao = self._get_or_create_tumblebase(tumblebase_address, tumblebase_host, session)
+        for dtype, indexed_rows in rows_by_dtype.items():
+            dataPoint_repository = self.get_dataPoint_repository(dtype)
+            rows = [row for _, row in indexed_rows]
+            if isinstance(dataPoint_repository, NumericDataRepository):
+                dataPoint_ids = dataPoint_repository.bulk_copy(rows, tumblebase_dao.id, session)
+            else:
+                for row, dataPoint_id in zip(rows, dataPoint_repository.reserve_ids(len(rows), session)):
+                    row["id"] = dataPoint_id
+                dataPoint_ids = dataPoint_repository.bulk_insert(rows, tumblebase_dao.id, session)
+            for (index, row), dataPoint_id in zip(indexed_rows, dataPoint_ids):
+                results[index] = {"status": 200, "info": dataPoint_id}
+                if dtype == DType.Image:
+                    self._create_thumbnails_after_commit(session, row["_data"])
+        return results
+
+    reassembled_dtypes = [DType.String, DType.Byte, DType.Image]
+
+    @execute_in_session
+    def ingest_packet(self, tumbleweed_address, tumblebase_address, short_key, packet_json, schemas,
+                      tumblebase_host=None, session=None):
+        """
+        Buffer one packet of a datapoint which is sent in several packets. The packet is a datapoint whose data is a
+        fragment of the data, with the additional index of the packet. The datapoint is stored once all its packets
+        arrived, the fragments are joined in the order of their index. If the datapoint cannot be stored, the message
+        is put back into the buffer, so it is stored once its packets are resent or it expires.
+        :return: The id of the new datapoint if the packet completed it, otherwise None.
+        """
+        resolution = self._resolve_datapoint_targets(tumbleweed_address, [short_key], session).get(short_key)
+        if resolution is None:
+            raise TumbleWebException(f"The DataSource with short key {short_key} does not exist for tumbleweed with "
+                                     f"address {tumbleweed_address}.")
+        if resolution.dtype not in self.reassembled_dtypes:
+            raise TumbleWebException(f"Datapoints of data type {resolution.dtype.value} cannot be sent in packets.")
+        if not isinstance(packet_json, dict):
+            raise TumbleWebException(invalid_format_message)
+        packet_json = packet_json.copy()
+        index = packet_json.pop("packet", None)
+        dataPoint_dto = self._load_datapoint(resolution.dtype, packet_json, schemas)
+        if not isinstance(index, int) or not 0 <= index < dataPoint_dto.packets or dataPoint_dto.data is None:
+            raise TumbleWebException(invalid_format_message)
+        key = MessageKey(tumbleweed_address, tumblebase_address, dataPoint_dto.message_id)
+        message = self.reassembly_buffer.add(key, short_key, resolution, index, dataPoint_dto, tumblebase_host)
+        if message is None:
+            return None
+        self._after_rollback(session, lambda: self.reassembly_buffer.restore(message))
+        return self._insert_message(message, session)
+
+    @execute_in_session
+    def flush_expired_packets(self, session=None):
+        """
+        Store the messages which expired or were evicted from the reassembly buffer as partial datapoints, with the
+        packets received so far. Every message is stored in its own savepoint, so a message whose run or data source
+        has been deleted in the meantime does not keep the others from being stored.
+        :return: The number of stored datapoints.
+        """
+        stored = 0
+        for message in self.reassembly_buffer.pop_expired():
+            try:
+                with session.begin_nested():
+                    self._insert_message(message, session)
+                stored += 1
+            except Exception as e:
+                self._logger.error(f"TumbleWebLogic.flush_expired_packets(): message {message.key} is lost: {e}")
+        return stored
+
+    def start_packet_reassembly(self):
+        """
+        Store expired messages of the reassembly buffer periodically in the background. The task is started with the
+        buffer, so expired and evicted messages are never collected without being stored.
+        """
+        if self._packet_expiry is None:
+            interval = max(self.reassembly_buffer.timeout / 2, 1)
+            self._packet_expiry = PeriodicTask("packet-expiry", self.flush_expired_packets, interval, self._logger)
+            self._packet_expiry.start()
+
+    def get_packet_reassembly_state(self):
+        return self.reassembly_buffer.get_state()
+
+    def _insert_message(self, message, session):
+        data = message.assemble()
+        receiving_done = None
+        if message.complete:
+            receiving_done = message.receiving_done or datetime.now(timezone.utc)
+        dataPoint_dto = replace(message.dataPoint_dto, data=data, size=len(data), receiving_done=receiving_done,
+                                packets_received=message.packets_received)
+        dataPoint_repository = self.get_dataPoint_repository(message.resolution.dtype)
+        row = dataPoint_repository.entity_model.create_from_dto(dataPoint_dto).to_row()
+        row["data_source_id"] = message.resolution.data_source_id
+        row["run_id"] = message.resolution.run_id
+        tumblebase_dao = self._get_or_create_tumblebase(message.key.tumblebase_address, message.tumblebase_host,
+                                                        session)
+        dataPoint_id = dataPoint_repository.insert_datapoint(row, tumblebase_dao.id, session)
+        if message.resolution.dtype == DType.Image:
+            self._create_thumbnails_after_commit(session, row["_data"])
+        return dataPoint_id
+
+    def _resolve_datapoint_targets(self, tumbleweed_address, short_keys, session):
+        """
+        Resolve the short keys of a tumbleweed to the data source and the active run a datapoint belongs to. Cached
+        resolutions are used without touching the database, the remaining short keys are resolved with one query
+        for the active run and one for the data sources.
+        :return: A dictionary which maps every known short key to its Resolution.
+        """
+        resolutions = dict()
+        missing_short_keys = set()
+        for short_key in short_keys:
+            resolution = self.resolution_cache.get(tumbleweed_address, short_key)
+            if resolution is not None:
+                resolutions[short_key] = resolution
+            else:
+                missing_short_keys.add(short_key)
+        if len(missing_short_keys) == 0:
+            return resolutions
+        generation = self.resolution_cache.generation
+        run_dao = self._get_active_run_by_tumbleweed_address(tumbleweed_address, session)
+        dataSources_dao = self.dataSource_repository.get_dataSources_by_tumbleweed_id_and_short_keys(
+            run_dao.tumbleweed_id, missing_short_keys, session)
+        for dataSource_dao in dataSources_dao:
+            resolution = Resolution(run_dao.tumbleweed_id, dataSource_dao.id, dataSource_dao.dtype, run_dao.id)
+            self.resolution_cache.put(tumbleweed_address, dataSource_dao.short_key, resolution, generation=generation)
+            resolutions[dataSource_dao.short_key] = resolution
+        return resolutions
+
+    def _get_active_run_by_tumbleweed_address(self, tumbleweed_address, session):
+        tumbleweeds_dao = self.tumbleweed_repository.get_by_address(tumbleweed_address, session)
+        runs_dao = self.run_repository.get_active_runs([tumbleweed_dao.id for tumbleweed_dao in tumbleweeds_dao],
+                                                       session)
+        if len(runs_dao) > 1:
+            raise TumbleWebException(f"More than one tumbleweed with ID {tumbleweed_address} is active")
+        if len(runs_dao) == 0:
+            raise TumbleWebException(f"No Tumbleweed with address {tumbleweed_address} is active.")
+        return runs_dao[0]
+
+    def _get_or_create_tumblebase(self, tumblebase_address, tumblebase_host, session):
+        tumblebase_dao = self.tumbleBase_repository.get_by_address(tumblebase_address, session)
+        if tumblebase_dao is None:
+            tumblebase_dto = TumbleBaseDTO(address=tumblebase_address, name="Default TumbleBase", host=tumblebase_host,
+                                           created_at=datetime.now(timezone.utc))
+            tumblebase_dao = TumbleBase.create_from_dto(tumblebase_dto)
+            self.tumbleBase_repository.insert_entity(tumblebase_dao, session)
+        return tumblebase_dao
+
+    @staticmethod
+    def _load_datapoint(dtype, dataPoint_json, schemas):
+        if dtype not in schemas:
+            raise TumbleWebException(f"No schema exists for data type {dtype.value}.")
+        try:
+            return schemas[dtype].load(dataPoint_json)
+        except ValidationError:
+            raise TumbleWebException(invalid_format_message)
+
     """ Methods to link resources """
 
     @execute_in_session
@@ -283,50 +844,6 @@ class TumbleWebLogic(BusinessLogic):
         else:
             return None
 
-    @execute_in_session
-    def add_command_to_tumbleweed(self, command_id, tumbleweed_id, session=None):
-        command_dao = self.command_repository.get_entity(command_id, session)
-        tumbleweed_dao = self.tumbleweed_repository.get_entity(tumbleweed_id, session)
-        if command_dao is not None and tumbleweed_dao is not None:
-            tumbleweed_dao.commands.append(command_dao)
-            tumbleweed_id = self.tumbleweed_repository.save_entity(tumbleweed_dao, session)
-            return tumbleweed_id
-        else:
-            return None
-
-    @execute_in_session
-    def add_command_to_tumblebase(self, command_id, tumblebase_id, session=None):
-        command_dao = self.command_repository.get_entity(command_id, session)
-        tumblebase_dao = self.tumbleBase_repository.get_entity(tumblebase_id, session)
-        if command_dao is not None and tumblebase_dao is not None:
-            tumblebase_dao.sent_commands.append(command_dao)
-            tumblebase_id = self.tumbleBase_repository.save_entity(tumblebase_dao, session)
-            return tumblebase_id
-        else:
-            return None
-
-    @execute_in_session
-    def add_command_to_commandType(self, command_id, commandType_id, session=None):
-        command_dao = self.command_repository.get_entity(command_id, session)
-        commandType_dao = self.commandType_repository.get_entity(commandType_id, session)
-        if command_dao is not None and commandType_dao is not None:
-            commandType_dao.commands.append(command_dao)
-            commandType_id = self.commandType_repository.save_entity(commandType_dao, session)
-            return commandType_id
-        else:
-            return None
-
-    @execute_in_session
-    def add_command_to_run(self, command_id, run_id, session=None):
-        command_dao = self.command_repository.get_entity(command_id, session)
-        run_dao = self.run_repository.get_entity(run_id, session)
-        if command_dao is not None and run_id is not None:
-            run_dao.commands.append(command_dao)
-            run_id = self.run_repository.save_entity(run_dao, session)
-            return run_id
-        else:
-            return None
-
     @execute_in_session
     def add_LongData_to_dataSource(self, datapoint_id, dataSource_id, session=None):
         datapoint_dao = self.longData_repository.get_entity(datapoint_id, session)
@@ -529,17 +1046,19 @@ class TumbleWebLogic(BusinessLogic):
 
     @execute_in_session
     def get_active_run(self, tumbleweed_id, session=None):
-        tumbleweed_dao = self.tumbleweed_repository.get_entity(tumbleweed_id, session)
-        if len(tumbleweed_dao.runs) == 0:
-            return None
-        runs = tumbleweed_dao.runs.copy()
-        runs.sort(key=lambda run: run.created_at, reverse=True)
-        most_recent_run = runs[0]
-        if most_recent_run.ended_at is None:
-            return RunDTO.create_from_dao(most_recent_run)
+        run_dao = self.run_repository.get_active_run(tumbleweed_id, session)
+        if run_dao is not None:
+            return RunDTO.create_from_dao(run_dao)
         else:
             return None
 
+    @execute_in_session
+    def get_active_runs_by_tumbleweed_address(self, tumbleweed_address, session=None):
+        tumbleweeds_dao = self.tumbleweed_repository.get_by_address(tumbleweed_address, session)
+        runs_dao = self.run_repository.get_active_runs([tumbleweed_dao.id for tumbleweed_dao in tumbleweeds_dao],
+                                                       session)
+        return RunDTO.create_from_dao_list(runs_dao)
+
     @execute_in_session
     def get_tumbleweed(self, tumbleweed_id, session=None):
         tumbleweed_dao = self.tumbleweed_repository.get_entity(tumbleweed_id, session)
@@ -612,6 +1131,16 @@ class TumbleWebLogic(BusinessLogic):
         else:
             return None
 
+    @execute_in_session
+    def get_runs_page_by_tumbleweed_id(self, tumbleweed_id, limit, after=None, session=None):
+        """
+        Return one page of the runs of a tumbleweed, ordered by id.
+        :param after: The id of the last run of the previous page or None for the first page.
+        :return: A tuple of the runs and whether more runs follow.
+        """
+        runs_dao = self.run_repository.get_page_by_tumbleweed_id(tumbleweed_id, limit + 1, after, session)
+        return RunDTO.create_from_dao_list(runs_dao[:limit]), len(runs_dao) > limit
+
     @execute_in_session
     def get_tumbleweeds(self, session=None):
         tumbleweeds_dao = self.tumbleweed_repository.get_entities(session)
@@ -712,6 +1241,17 @@ class TumbleWebLogic(BusinessLogic):
         else:
             return None
 
+    @execute_in_session
+    def get_commands_page_by_tumbleweed_id_and_run_id(self, tumbleweed_id, run_id, limit, after=None, session=None):
+        """
+        Return one page of the commands of a tumbleweed and run, ordered by id.
+        :param after: The id of the last command of the previous page or None for the first page.
+        :return: A tuple of the commands and whether more commands follow.
+        """
+        commands_dao = self.command_repository.get_page_by_tumbleweed_id_and_run_id(tumbleweed_id, run_id, limit + 1,
+                                                                                    after, session)
+        return CommandDTO.create_from_dao_list(commands_dao[:limit]), len(commands_dao) > limit
+
     @execute_in_session
     def get_unanswered_commands_by_tumbleweed_id_and_run_id(self, tumbleweed_id, run_id, session=None):
         commands_dao = self.command_repository.get_unanswered_by_tumbleweed_id_and_run_id(tumbleweed_id, run_id, session)
@@ -770,7 +1310,7 @@ class TumbleWebLogic(BusinessLogic):
     def get_imagedatapoints_by_dataSource_and_run(self, dataSource_id, run_id, session=None):
         imagedata_dao = self.imageData_repository.get_by_dataSource_id_and_run_id(dataSource_id, run_id, session)
         if imagedata_dao is not None:
-            imagedata_dto = ImageDataDTO.create_from_dao_list(imagedata_dao)
+            imagedata_dto = ImageMetadataDTO.create_from_dao_list(imagedata_dao)
             return imagedata_dto
         else:
             return None
@@ -830,11 +1370,95 @@ class TumbleWebLogic(BusinessLogic):
         imagedata_dao = self.imageData_repository.get_by_dataSource_id_and_run_id_interval(dataSource_id, run_id, start,
                                                                                            end, session)
         if imagedata_dao is not None:
-            imagedata_dto = ImageDataDTO.create_from_dao_list(imagedata_dao)
+            imagedata_dto = ImageMetadataDTO.create_from_dao_list(imagedata_dao)
             return imagedata_dto
         else:
             return None
 
+    @execute_in_session
+    def get_aggregates_by_dataSource_and_run_interval(self, dataSource_id, run_id, start, end, bucket, functions=None,
+                                                      session=None):
+        """
+        Aggregate the numeric datapoints of a data source and run in time buckets. The aggregation is done by the
+        database, only one row per bucket is transferred.
+        :param bucket: The length of a bucket in seconds.
+        :param functions: The aggregate functions to compute, see NumericDataRepository.aggregate_functions. All of
+        them if None.
+        :return: A tuple of the list of aggregates and the computed functions or None if the data source does not exist.
+        """
+        dataSource_dao = self.dataSource_repository.get_entity(dataSource_id, session)
+        if dataSource_dao is None:
+            return None
+        repository = self.get_dataPoint_repository(dataSource_dao.dtype)
+        if not isinstance(repository, NumericDataRepository):
+            raise TumbleWebException(f"Data source {dataSource_id} is not numeric.")
+        if functions is None:
+            functions = repository.aggregate_functions
+        if bucket <= 0 or any(function not in repository.aggregate_functions for function in functions):
+            raise TumbleWebException(invalid_format_message)
+        rows = repository.get_aggregates_by_dataSource_id_and_run_id_interval(dataSource_id, run_id, start, end,
+                                                                              bucket, functions, session)
+        return [AggregateDTO(**row._asdict()) for row in rows], functions
+
+    @execute_in_session
+    def get_datapoints_by_dataSource_and_run_interval_downsampled(self, dataSource_id, run_id, start, end, max_points,
+                                                                  session=None):
+        """
+        Select at most max_points datapoints of a numeric data source and run which keep the shape of the series when
+        plotted, see util.downsampling.lttb. The series is streamed from the database and only the selected
+        datapoints are loaded completely.
+        :return: A list of datapoints or None if the data source does not exist.
+        """
+        dataSource_dao = self.dataSource_repository.get_entity(dataSource_id, session)
+        if dataSource_dao is None:
+            return None
+        repository = self.get_dataPoint_repository(dataSource_dao.dtype)
+        if not isinstance(repository, NumericDataRepository):
+            raise TumbleWebException(f"Data source {dataSource_id} is not numeric.")
+        series = series_from_chunks(repository.get_series_by_dataSource_id_and_run_id_interval(
+            dataSource_id, run_id, start, end, session))
+        selected = lttb(series[:, 1], series[:, 2], max_points)
+        ids = series[selected, 0].astype(int).tolist()
+        datapoint_daos = repository.get_by_ids(ids, session)
+        return self.get_dataPoint_dto_class(dataSource_dao.dtype).create_from_dao_list(datapoint_daos)
+
+    @stream_in_session
+    def stream_datapoints_by_dataSource_and_run(self, dataSource_id, run_id, start=None, end=None, session=None):
+        """
+        Generate the datapoints of a data source and run one by one while they are read from the database in chunks,
+        so the whole run is never held in memory. Without an interval the datapoints are ordered by receiving_done,
+        with an interval by receiving_start, like in the non streaming methods.
+        """
+        dataSource_dao = self.dataSource_repository.get_entity(dataSource_id, session)
+        if dataSource_dao is None:
+            return
+        repository = self.get_dataPoint_repository(dataSource_dao.dtype)
+        dto_class = self.get_dataPoint_dto_class(dataSource_dao.dtype)
+        if start is None and end is None:
+            datapoint_daos = repository.stream_by_dataSource_id_and_run_id(dataSource_id, run_id, session)
+        else:
+            datapoint_daos = repository.stream_by_dataSource_id_and_run_id_interval(dataSource_id, run_id, start, end,
+                                                                                    session)
+        for datapoint_dao in datapoint_daos:
+            yield dto_class.create_from_dao(datapoint_dao)
+
+    @execute_in_session
+    def get_datapoints_page_by_dataSource_and_run(self, dataSource_id, run_id, limit, after=None, session=None):
+        """
+        Return one page of the datapoints of a data source and run, ordered by receiving_start and id.
+        :param after: The (receiving_start, id) of the last datapoint of the previous page or None for the first page.
+        :return: A tuple of the datapoints and whether more datapoints follow, or None if the data source does not
+        exist.
+        """
+        dataSource_dao = self.dataSource_repository.get_entity(dataSource_id, session)
+        if dataSource_dao is None:
+            return None
+        repository = self.get_dataPoint_repository(dataSource_dao.dtype)
+        datapoint_daos = repository.get_page_by_dataSource_id_and_run_id(dataSource_id, run_id, limit + 1, after,
+                                                                         session)
+        datapoint_dtos = self.get_dataPoint_dto_class(dataSource_dao.dtype).create_from_dao_list(datapoint_daos[:limit])
+        return datapoint_dtos, len(datapoint_daos) > limit
+
     @execute_in_session
     def get_longdatapoint(self, datapoint_id, session=None):
         data_dao = self.longData_repository.get_entity(datapoint_id, session)
@@ -889,107 +1513,124 @@ class TumbleWebLogic(BusinessLogic):
         else:
             return None
 
+    @execute_in_session
+    def get_image_path(self, datapoint_id, size=None, session=None):
+        """
+        Return where the image of an image datapoint is stored, so it can be sent without reading it.
+        :param size: The name of a thumbnail size, see ThumbnailGenerator.sizes, or None for the image itself. Without
+        Pillow the image itself is returned for every size.
+        :return: A tuple of the path of the image file and its format or None if the datapoint does not exist or has
+        no image.
+        """
+        if size is not None and size not in self.thumbnail_generator.sizes:
+            raise TumbleWebException(invalid_format_message)
+        data_dao = self.imageData_repository.get_entity(datapoint_id, session)
+        if data_dao is None or data_dao._data is None or not os.path.exists(data_dao._data):
+            return None
+        if size is not None:
+            thumbnail_path = self.thumbnail_generator.get_thumbnail(data_dao._data, size)
+            if thumbnail_path is not None:
+                return thumbnail_path, "jpg"
+        return data_dao._data, ImageMetadataDTO.create_from_dao(data_dao).format
+
     """ Methods to update resources"""
 
     @execute_in_session
     def update_tumbleweed(self, tumbleweed_id, tumbleweed_dto, session=None):
         tumbleweed_dao = Tumbleweed.create_from_dto_update(tumbleweed_dto)
-        tumbleweed_dao.id = tumbleweed_id
-        tumbleweed_id = self.tumbleweed_repository.save_entity(tumbleweed_dao, session)
+        tumbleweed_id = self.tumbleweed_repository.update_entity(tumbleweed_id, tumbleweed_dao.to_update_values(), session)
+        if tumbleweed_id is not None:
+            self._after_commit(session, lambda: self.resolution_cache.invalidate_tumbleweed(tumbleweed_id))
         return tumbleweed_id
 
     @execute_in_session
     def update_tumblebase(self, tumblebase_id, tumblebase_dto, session=None):
         tumblebase_dao = TumbleBase.create_from_dto_update(tumblebase_dto)
-        tumblebase_dao.id = tumblebase_id
-        tumblebase_id = self.tumbleBase_repository.save_entity(tumblebase_dao, session)
+        values = tumblebase_dao.to_update_values()
+        tumblebase_id = self.tumbleBase_repository.update_entity(tumblebase_id, values, session)
+        if tumblebase_id is not None and not {"host", "port", "command_route"}.isdisjoint(values):
+            self._after_commit(session, lambda: self.tumblebase_clients.invalidate(tumblebase_id))
         return tumblebase_id
 
     @execute_in_session
     def update_subSystem(self, subSystem_id, subSystem_dto, session=None):
         subSystem_dao = SubSystem.create_from_dto_update(subSystem_dto)
-        subSystem_dao.id = subSystem_id
-        subSystem_id = self.subSystem_repository.save_entity(subSystem_dao, session)
+        subSystem_id = self.subSystem_repository.update_entity(subSystem_id, subSystem_dao.to_update_values(), session)
         return subSystem_id
 
     @execute_in_session
     def update_dataSource(self, dataSource_id, dataSource_dto, session=None):
         dataSource_dao = DataSource.create_from_dto_update(dataSource_dto)
-        dataSource_dao.id = dataSource_id
-        dataSource_id = self.dataSource_repository.save_entity(dataSource_dao, session)
+        dataSource_id = self.dataSource_repository.update_entity(dataSource_id, dataSource_dao.to_update_values(), session)
+        if dataSource_id is not None:
+            self._after_commit(session, lambda: self.resolution_cache.invalidate_dataSource(dataSource_id))
         return dataSource_id
 
     @execute_in_session
     def update_commandType(self, commandType_id, commandType_dto, session=None):
         commandType_dao = CommandType.create_from_dto_update(commandType_dto)
-        commandType_dao.id = commandType_id
-        commandType_id = self.commandType_repository.save_entity(commandType_dao, session)
+        commandType_id = self.commandType_repository.update_entity(commandType_id, commandType_dao.to_update_values(), session)
         return commandType_id
 
     @execute_in_session
     def update_run(self, run_id, run_dto, session=None):
         run_dao = Run.create_from_dto_update(run_dto)
-        run_dao.id = run_id
-        run_id = self.run_repository.save_entity(run_dao, session)
+        run_id = self.run_repository.update_entity(run_id, run_dao.to_update_values(), session)
         return run_id
 
     @execute_in_session
     def update_command(self, command_id, command_dto, session=None):
         command_dao = Command.create_from_dto_update(command_dto)
-        command_dao.id = command_id
-        command_id = self.command_repository.save_entity(command_dao, session)
+        command_id = self.command_repository.update_entity(command_id, command_dao.to_update_values(), session)
         return command_id
 
     @execute_in_session
     def update_longdatapoint(self, datapoint_id, datapoint_dto, session=None):
         datapoint_dao = LongData.create_from_dto_update(datapoint_dto)
-        datapoint_dao.id = datapoint_id
-        datapoint_id = self.longData_repository.save_entity(datapoint_dao, session)
+        datapoint_id = self.longData_repository.update_entity(datapoint_id, datapoint_dao.to_update_values(), session)
         return datapoint_id
 
     @execute_in_session
     def update_intdatapoint(self, datapoint_id, datapoint_dto, session=None):
         datapoint_dao = IntData.create_from_dto_update(datapoint_dto)
-        datapoint_dao.id = datapoint_id
-        datapoint_id = self.intData_repository.save_entity(datapoint_dao, session)
+        datapoint_id = self.intData_repository.update_entity(datapoint_id, datapoint_dao.to_update_values(), session)
         return datapoint_id
 
     @execute_in_session
     def update_floatdatapoint(self, datapoint_id, datapoint_dto, session=None):
         datapoint_dao = FloatData.create_from_dto_update(datapoint_dto)
-        datapoint_dao.id = datapoint_id
-        datapoint_id = self.floatData_repository.save_entity(datapoint_dao, session)
+        datapoint_id = self.floatData_repository.update_entity(datapoint_id, datapoint_dao.to_update_values(), session)
         return datapoint_id
 
     @execute_in_session
     def update_stringdatapoint(self, datapoint_id, datapoint_dto, session=None):
         datapoint_dao = StringData.create_from_dto_update(datapoint_dto)
-        datapoint_dao.id = datapoint_id
-        datapoint_id = self.stringData_repository.save_entity(datapoint_dao, session)
+        datapoint_id = self.stringData_repository.update_entity(datapoint_id, datapoint_dao.to_update_values(), session)
         return datapoint_id
 
     @execute_in_session
     def update_bytedatapoint(self, datapoint_id, datapoint_dto, session=None):
         datapoint_dao = ByteData.create_from_dto_update(datapoint_dto)
-        datapoint_dao.id = datapoint_id
-        datapoint_id = self.byteData_repository.save_entity(datapoint_dao, session)
+        datapoint_id = self.byteData_repository.update_entity(datapoint_id, datapoint_dao.to_update_values(), session)
         return datapoint_id
 
     @execute_in_session
     def update_imagedatapoint(self, datapoint_id, datapoint_dto, session=None):
         datapoint_dao = ImageData.create_from_dto_update(datapoint_dto)
-        datapoint_dao.id = datapoint_id
-        datapoint_id = self.imageData_repository.save_entity(datapoint_dao, session)
+        datapoint_id = self.imageData_repository.update_entity(datapoint_id, datapoint_dao.to_update_values(), session)
+        if datapoint_id is not None:
+            self._create_thumbnails_after_commit(session, datapoint_dao._data)
         return datapoint_id
 
     """ Methods to delete resources """
 
     @execute_in_session
     def delete_dataSource(self, dataSource_id, session=None):
-        dataSource_id = self.dataSource_repository.delete_entity(dataSource_id, session)
+        dataSource_id = self.dataSource_repository.delete_entity(dataSource_id, session, chunk_size=self.delete_chunk_size)
         if dataSource_id is None:
             return None
         else:
+            self._after_commit(session, lambda: self.resolution_cache.invalidate_dataSource(dataSource_id))
             return dataSource_id
 
     @execute_in_session
@@ -1002,15 +1643,16 @@ class TumbleWebLogic(BusinessLogic):
 
     @execute_in_session
     def delete_tumbleweed(self, tumbleweed_id, session=None):
-        tumbleweed_id = self.tumbleweed_repository.delete_entity(tumbleweed_id, session)
+        tumbleweed_id = self.tumbleweed_repository.delete_entity(tumbleweed_id, session, chunk_size=self.delete_chunk_size)
         if tumbleweed_id is None:
             return None
         else:
+            self._after_commit(session, lambda: self.resolution_cache.invalidate_tumbleweed(tumbleweed_id))
             return tumbleweed_id
 
     @execute_in_session
     def delete_commandType(self, commandType_id, session=None):
-        commandType_id = self.commandType_repository.delete_entity(commandType_id, session)
+        commandType_id = self.commandType_repository.delete_entity(commandType_id, session, chunk_size=self.delete_chunk_size)
         if commandType_id is None:
             return None
         else:
@@ -1018,10 +1660,11 @@ class TumbleWebLogic(BusinessLogic):
 
     @execute_in_session
     def delete_run(self, run_id, session=None):
-        run_id = self.run_repository.delete_entity(run_id, session)
+        run_id = self.run_repository.delete_entity(run_id, session, chunk_size=self.delete_chunk_size)
         if run_id is None:
             return None
         else:
+            self._after_commit(session, lambda: self.resolution_cache.invalidate_run(run_id))
             return run_id
 
     @execute_in_session
@@ -1030,4 +1673,26 @@ class TumbleWebLogic(BusinessLogic):
         if tumblebase_id is None:
             return None
         else:
+            self._after_commit(session, lambda: self.tumblebase_clients.invalidate(tumblebase_id))
             return tumblebase_id
+
+    @execute_in_session
+    def collect_image_garbage(self, dry_run=False, session=None):
+        """
+        Remove image files and thumbnails which are not referenced by an image datapoint anymore.
+        :param dry_run: If True, the orphaned files are only counted.
+        :return: An ImageGarbageReport.
+        """
+        referenced_stems = self.imageData_repository.stream_path_stems(get_image_store().root_path, session)
+        return self.image_garbage_collector.collect(referenced_stems, dry_run=dry_run)
+
+    def start_image_garbage_collection(self):
+        """
+        Collect image garbage periodically in the background, as configured in the image_gc section of environment.ini.
+        """
+        interval = int(get_config_parser("environment.ini")["image_gc"]["interval"])
+        if interval > 0 and self._image_garbage_collection is None:
+            self._image_garbage_collection = PeriodicTask("image-garbage-collection", self.collect_image_garbage,
+                                                          interval, self._logger)
+            self._image_garbage_collection.start()
+
@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, namedtuple
+from threading import Lock
+import requests
+import time
+
+
+Delivery = namedtuple("Delivery", ["command_id", "tumblebase_id", "payload"])
+
+
+class CommandDispatcher:
+    """
+    Delivers commands to the tumblebases in a pool of worker threads, so neither the request sending a command nor
+    the web server wait for a tumblebase. The commands are sent with the keep-alive TumbleBaseClient of their
+    tumblebase, which holds the current address of the tumblebase. Every tumblebase has its own queue and at most
+    max_in_flight of its commands are delivered at once, so an unreachable tumblebase occupies at most max_in_flight
+    workers. A delivery which fails with a connection error, a timeout or a server error is retried up to max_attempts
+    times with exponential backoff. The commands are stored before they are dispatched and marked as transmitted by
+    on_transmitted once the tumblebase accepted them, so commands which were not delivered when the process stopped
+    can be dispatched again.
+    """
+
+    def __init__(self, tumblebase_clients, on_transmitted, max_workers, max_in_flight, timeout, max_attempts, backoff,
+                 max_backoff, logger, sleep=time.sleep):
+        self._tumblebase_clients = tumblebase_clients
+        self._on_transmitted = on_transmitted
+        self._max_workers = max_workers
+        self._max_in_flight = max_in_flight
+        self._timeout = timeout
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._logger = logger
+        self._sleep = sleep
+        self._executor = None
+        self._queues = dict()
+        self._in_flight = dict()
+        self._transmitted = 0
+        self._failed = 0
+        self._lock = Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                        thread_name_prefix="command-dispatcher")
+        return self._executor
+
+    def dispatch(self, delivery):
+        """Queue a command for delivery to its tumblebase and return right away."""
+        executor = self.executor
+        with self._lock:
+            self._queues.setdefault(delivery.tumblebase_id, deque()).append(delivery)
+            self._submit_queued(executor, delivery.tumblebase_id)
+
+    def get_state(self):
+        """Describe the queued and running deliveries for monitoring."""
+        with self._lock:
+            tumblebase_ids = sorted(set(self._queues) | set(self._in_flight))
+            return {
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "in_flight": sum(self._in_flight.values()),
+                "transmitted": self._transmitted,
+                "failed": self._failed,
+                "tumblebases": [{"tumblebase_id": tumblebase_id,
+                                 "queued": len(self._queues.get(tumblebase_id, ())),
+                                 "in_flight": self._in_flight.get(tumblebase_id, 0)}
+                                for tumblebase_id in tumblebase_ids]
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._tumblebase_clients.close()
+
+    def _submit_queued(self, executor, tumblebase_id):
+        """Start queued deliveries of the tumblebase while it has less than max_in_flight. The lock must be held."""
+        queue = self._queues.get(tumblebase_id)
+        while queue and self._in_flight.get(tumblebase_id, 0) < self._max_in_flight:
+            self._in_flight[tumblebase_id] = self._in_flight.get(tumblebase_id, 0) + 1
+            executor.submit(self._deliver, queue.popleft())
+        if queue is not None and len(queue) == 0:
+            del self._queues[tumblebase_id]
+
+    def _deliver(self, delivery):
+        transmitted = False
+        try:
+            transmitted = self._send(delivery)
+            if transmitted:
+                self._on_transmitted(delivery.command_id)
+        except Exception as e:
+            self._logger.error(f"CommandDispatcher._deliver(): command {delivery.command_id}: {e}")
+        finally:
+            with self._lock:
+                if transmitted:
+                    self._transmitted += 1
+                else:
+                    self._failed += 1
+                self._in_flight[delivery.tumblebase_id] -= 1
+                if self._in_flight[delivery.tumblebase_id] == 0:
+                    del self._in_flight[delivery.tumblebase_id]
+                self._submit_queued(self._executor, delivery.tumblebase_id)
+
+    def _send(self, delivery):
+        """
+        Post the command to the tumblebase, retrying connection errors, timeouts and server errors.
+        :return: True if the tumblebase accepted the command, False if it rejected it or all attempts failed.
+        """
+        error = None
+        for attempt in range(self._max_attempts):
+            if attempt > 0:
+                self._sleep(min(self._backoff * 2 ** (attempt - 1), self._max_backoff))
+            client = self._tumblebase_clients.get(delivery.tumblebase_id)
+            if client is None:
+                self._logger.error(f"CommandDispatcher._send(): command {delivery.command_id} cannot be sent, "
+                                   f"tumblebase {delivery.tumblebase_id} does not exist")
+                return False
+            try:
+                response = client.send_command(delivery.payload, self._timeout)
+            except requests.RequestException as e:
+                error = e
+                continue
+            if response.status_code == 200:
+                return True
+            if response.status_code < 500:
+                self._logger.error(f"CommandDispatcher._send(): command {delivery.command_id} was rejected by "
+                                   f"tumblebase {delivery.tumblebase_id}: {response.status_code} {response.text}")
+                return False
+            error = f"{response.status_code} {response.text}"
+        self._logger.error(f"CommandDispatcher._send(): command {delivery.command_id} could not be sent to tumblebase "
+                           f"{delivery.tumblebase_id} in {self._max_attempts} attempts: {error}")
+        return False
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+import time
+import sys
+import os
+
+
+def get_image_stem(name, size_names=()):
+    """
+    Return the name of an image file without its extension. Thumbnails, named like abcd.thumb.jpg, share the stem of
+    their image abcd.png, so they are kept exactly as long as their image is referenced.
+    """
+    stem, dot, extension = name.rpartition(".")
+    if not dot:
+        return name
+    if extension == "jpg":
+        image_stem, dot, size_name = stem.rpartition(".")
+        if dot and size_name in size_names:
+            return image_stem
+    return stem
+
+
+@dataclass
+class ImageGarbageReport:
+    files: int = 0
+    orphans: int = 0
+    bytes: int = 0
+    dry_run: bool = False
+
+
+class ImageGarbageCollector:
+    """
+    Removes image files which are not referenced by any image datapoint anymore, for example after runs or data
+    sources have been deleted or when the transaction storing an image was rolled back after the file was written.
+    The image directory is walked in sorted order and merged with the sorted stems of all referenced paths, so neither
+    the listing nor the references are held in memory at once. Files modified less than min_age seconds ago are kept,
+    they may belong to a transaction which has not been committed yet.
+    """
+
+    def __init__(self, root_path, size_names, min_age, logger, clock=time.time):
+        self._root_path = root_path
+        self._size_names = frozenset(size_names)
+        self._min_age = min_age
+        self._logger = logger
+        self._clock = clock
+
+    def collect(self, referenced_stems, dry_run=False):
+        """
+        Remove every file below the root path whose stem is not referenced.
+        :param referenced_stems: An iterable of the paths of all referenced images without their extension, sorted by
+                                 code point as done by ORDER BY ... COLLATE "C".
+        :param dry_run: If True, only report the orphaned files.
+        :return: An ImageGarbageReport with the number of files, orphaned files and the bytes (to be) reclaimed.
+        """
+        report = ImageGarbageReport(dry_run=dry_run)
+        if not os.path.isdir(self._root_path):
+            return report
+        referenced_stems = iter(referenced_stems)
+        referenced_stem = next(referenced_stems, None)
+        deadline = self._clock() - self._min_age
+        for stem, path in self._walk(self._root_path):
+            report.files += 1
+            while referenced_stem is not None and referenced_stem < stem:
+                referenced_stem = next(referenced_stems, None)
+            if referenced_stem == stem:
+                continue
+            try:
+                stat = os.lstat(path)
+                if stat.st_mtime > deadline:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                self._logger.error(f"ImageGarbageCollector.collect(): could not remove {path}: {e}")
+                continue
+            report.orphans += 1
+            report.bytes += stat.st_size
+        self._logger.info(f"ImageGarbageCollector.collect(): {report}")
+        return report
+
+    def _walk(self, directory):
+        """
+        Yield (stem, path) of every file below the directory, sorted by stem. A subdirectory is sorted as its name
+        followed by a slash, so its files appear in the same position as their paths do in the database.
+        """
+        entries = list()
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.append((entry.name + "/", entry))
+                else:
+                    entries.append((get_image_stem(entry.name, self._size_names), entry))
+        entries.sort(key=lambda sortable: sortable[0])
+        for key, entry in entries:
+            if key.endswith("/"):
+                yield from self._walk(entry.path)
+            else:
+                yield os.path.join(directory, key), entry.path
+
+
+if __name__ == "__main__":
+    from businesslogic.busineslogic import TumbleWebLogic
+
+    dry_run = "--dry-run" in sys.argv[1:]
+    print(TumbleWebLogic.get_business_logic().collect_image_garbage(dry_run=dry_run))
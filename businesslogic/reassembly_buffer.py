@@ -0,0 +1,167 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import time
+
+
+MessageKey = namedtuple("MessageKey", ["tumbleweed_address", "tumblebase_address", "message_id"])
+
+
+class Message:
+    """
+    The packets of one datapoint received so far. The first packet carries the fields of the datapoint besides its
+    data, every packet carries a fragment of the data.
+    """
+
+    def __init__(self, key, short_key, resolution, dataPoint_dto, tumblebase_host, now):
+        self.key = key
+        self.short_key = short_key
+        self.resolution = resolution
+        self.tumblebase_host = tumblebase_host
+        self.dataPoint_dto = dataPoint_dto
+        self.receiving_done = None
+        self.fragments = dict()
+        self.size = 0
+        self.started_at = now
+        self.updated_at = now
+
+    @property
+    def packets(self):
+        return self.dataPoint_dto.packets
+
+    @property
+    def packets_received(self):
+        return len(self.fragments)
+
+    @property
+    def complete(self):
+        return self.packets_received == self.packets
+
+    def assemble(self):
+        """Join the fragments in the order of their packet index, missing packets of a partial message are skipped."""
+        fragments = [self.fragments[index] for index in sorted(self.fragments)]
+        if len(fragments) > 0 and isinstance(fragments[0], str):
+            return "".join(fragments)
+        return b"".join(fragments)
+
+
+class ReassemblyBuffer:
+    """
+    Collects the packets of datapoints which are sent in several packets, so a datapoint is written once when its
+    last packet arrives instead of being updated with every packet. Messages are identified by the addresses of the
+    tumbleweed and the tumblebase and the message id. A message which does not receive a packet for timeout seconds
+    expires, and the least recently updated messages are evicted once more than max_messages messages or max_bytes
+    bytes are buffered. Expired and evicted messages are handed out by pop_expired to be written as partial datapoints.
+    """
+
+    def __init__(self, max_messages=1024, max_bytes=64 * 1024 * 1024, timeout=60, clock=time.monotonic):
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._timeout = timeout
+        self._clock = clock
+        self._messages = OrderedDict()
+        self._expired = list()
+        self._bytes = 0
+        self._lock = Lock()
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def add(self, key, short_key, resolution, index, dataPoint_dto, tumblebase_host=None):
+        """
+        Buffer a packet. A packet of a known message with another data source or number of packets starts a new
+        message, the old one is handed out as partial. A packet received twice replaces the first one.
+        :param index: The index of the packet, between 0 and dataPoint_dto.packets - 1.
+        :param dataPoint_dto: The datapoint sent with the packet, its data is the fragment carried by the packet.
+        :param tumblebase_host: The host stored if the tumblebase has to be created when the message is stored.
+        :return: The message if the packet completed it, otherwise None.
+        """
+        now = self._clock()
+        with self._lock:
+            message = self._messages.get(key)
+            if message is not None and (message.short_key != short_key or message.packets != dataPoint_dto.packets):
+                self._expire(key)
+                message = None
+            if message is None:
+                message = Message(key, short_key, resolution, dataPoint_dto, tumblebase_host, now)
+                self._messages[key] = message
+            self._messages.move_to_end(key)
+            fragment = dataPoint_dto.data
+            replaced = message.fragments.get(index)
+            if replaced is not None:
+                message.size -= len(replaced)
+                self._bytes -= len(replaced)
+            message.fragments[index] = fragment
+            message.size += len(fragment)
+            self._bytes += len(fragment)
+            message.updated_at = now
+            if dataPoint_dto.receiving_done is not None:
+                message.receiving_done = dataPoint_dto.receiving_done
+            if message.complete:
+                del self._messages[key]
+                self._bytes -= message.size
+                return message
+            self._evict()
+            return None
+
+    def restore(self, message):
+        """
+        Put back a message which was handed out by add or pop_expired but could not be stored. If packets of the
+        message arrived in the meantime, the fragments are added to the buffered message.
+        """
+        now = self._clock()
+        with self._lock:
+            buffered = self._messages.get(message.key)
+            if buffered is None:
+                self._messages[message.key] = message
+                self._bytes += message.size
+            else:
+                for index, fragment in message.fragments.items():
+                    if index not in buffered.fragments:
+                        buffered.fragments[index] = fragment
+                        buffered.size += len(fragment)
+                        self._bytes += len(fragment)
+                message = buffered
+            message.updated_at = now
+            self._messages.move_to_end(message.key)
+            self._evict()
+
+    def pop_expired(self):
+        """
+        Remove and return the evicted messages and the messages which did not receive a packet for timeout seconds.
+        """
+        deadline = self._clock() - self._timeout
+        with self._lock:
+            while len(self._messages) > 0:
+                key, message = next(iter(self._messages.items()))
+                if message.updated_at > deadline:
+                    break
+                self._expire(key)
+            expired = self._expired
+            self._expired = list()
+            return expired
+
+    def get_state(self):
+        """Describe the buffered messages for monitoring."""
+        now = self._clock()
+        with self._lock:
+            return {
+                "messages": len(self._messages),
+                "bytes": self._bytes,
+                "expired": len(self._expired),
+                "in_flight": [{"tumbleweed_address": message.key.tumbleweed_address,
+                               "tumblebase_address": message.key.tumblebase_address,
+                               "message_id": message.key.message_id, "short_key": message.short_key,
+                               "packets": message.packets, "packets_received": message.packets_received,
+                               "size": message.size, "age": now - message.started_at}
+                              for message in self._messages.values()]
+            }
+
+    def _evict(self):
+        while len(self._messages) > self._max_messages or self._bytes > self._max_bytes:
+            self._expire(next(iter(self._messages)))
+
+    def _expire(self, key):
+        message = self._messages.pop(key)
+        self._bytes -= message.size
+        self._expired.append(message)
@@ -0,0 +1,77 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import time
+
+
+Resolution = namedtuple("Resolution", ["tumbleweed_id", "data_source_id", "dtype", "run_id"])
+
+
+class ResolutionCache:
+    """
+    An in-process cache which maps the address of a tumbleweed and the short key of a data source to everything
+    needed to store a datapoint: the tumbleweed id, the data source id, its dtype and the id of the active run.
+    Entries expire after ttl seconds and the least recently used entry is evicted once max_size entries are stored.
+    The cache is local to one process, so changes done by another process are only picked up after the ttl. Changes
+    done by this process have to be announced explicitly with one of the invalidate methods.
+    """
+
+    def __init__(self, ttl=30, max_size=4096, clock=time.monotonic):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = Lock()
+
+    @property
+    def generation(self):
+        """
+        A counter which is increased by every invalidation. Read it before querying the database and hand it to put,
+        so a resolution read before a concurrent invalidation is not cached.
+        """
+        return self._generation
+
+    def get(self, tumbleweed_address, short_key):
+        key = (tumbleweed_address, short_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, resolution = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return resolution
+
+    def put(self, tumbleweed_address, short_key, resolution, generation=None):
+        key = (tumbleweed_address, short_key)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (self._clock() + self._ttl, resolution)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_tumbleweed(self, tumbleweed_id):
+        self._invalidate(lambda resolution: resolution.tumbleweed_id == tumbleweed_id)
+
+    def invalidate_run(self, run_id):
+        self._invalidate(lambda resolution: resolution.run_id == run_id)
+
+    def invalidate_dataSource(self, dataSource_id):
+        self._invalidate(lambda resolution: resolution.data_source_id == dataSource_id)
+
+    def clear(self):
+        self._invalidate(lambda resolution: True)
+
+    def _invalidate(self, predicate):
+        with self._lock:
+            self._generation += 1
+            keys = [key for key, (_, resolution) in self._entries.items() if predicate(resolution)]
+            for key in keys:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
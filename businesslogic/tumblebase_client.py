@@ -0,0 +1,87 @@
+from requests.adapters import HTTPAdapter
+from threading import Lock
+import requests
+
+
+class TumbleBaseClient:
+    """
+    Sends commands to one tumblebase over a keep-alive session, so consecutive commands reuse their connections
+    instead of opening a new one each. The pool keeps up to pool_size connections, one per concurrent delivery.
+    """
+
+    def __init__(self, host, port, command_route, pool_size):
+        self.host = host
+        self.port = port
+        self.command_route = command_route
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    @property
+    def command_url(self):
+        return f"http://{self.host}:{self.port}/{self.command_route}"
+
+    def send_command(self, payload, timeout):
+        """
+        Post a command to the tumblebase.
+        :return: The response of the tumblebase.
+        :raise requests.RequestException: If the tumblebase could not be reached in time.
+        """
+        return self._session.post(self.command_url, json=payload, timeout=timeout)
+
+    def close(self):
+        self._session.close()
+
+
+class TumbleBaseClientRegistry:
+    """
+    Holds a TumbleBaseClient per tumblebase id. The client is created with the address returned by get_address, which
+    looks up the current host, port and command route of a tumblebase. A tumblebase which was updated or deleted has to
+    be announced with invalidate, the next client is then created with its new address. An address looked up before a
+    concurrent invalidation is not kept, so a client never goes back to an old address.
+    """
+
+    def __init__(self, get_address, pool_size):
+        self._get_address = get_address
+        self._pool_size = pool_size
+        self._clients = dict()
+        self._generation = 0
+        self._lock = Lock()
+
+    def get(self, tumblebase_id):
+        """
+        :return: The client of the tumblebase, or None if the tumblebase does not exist.
+        """
+        while True:
+            with self._lock:
+                client = self._clients.get(tumblebase_id)
+                if client is not None:
+                    return client
+                generation = self._generation
+            address = self._get_address(tumblebase_id)
+            if address is None:
+                return None
+            client = TumbleBaseClient(*address, self._pool_size)
+            with self._lock:
+                current = self._clients.get(tumblebase_id)
+                if current is None and generation == self._generation:
+                    self._clients[tumblebase_id] = client
+                    return client
+            client.close()
+            if current is not None:
+                return current
+
+    def invalidate(self, tumblebase_id):
+        """Close the client of a tumblebase which was updated or deleted."""
+        with self._lock:
+            self._generation += 1
+            client = self._clients.pop(tumblebase_id, None)
+        if client is not None:
+            client.close()
+
+    def close(self):
+        with self._lock:
+            self._generation += 1
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
@@ -1,8 +1,9 @@
 from sqlalchemy.orm.session import sessionmaker
-from model.data_access_objects import Base
+from model.data_access_objects import Base, LongData, IntData, FloatData, StringData, ByteData, ImageData
 from util.utils import get_config_parser
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from util.mode import Mode
+import sys
 
 Session = sessionmaker(autoflush=True)
 
@@ -74,6 +75,68 @@ class DatabaseTools:
 
     def create_database(self):
         Base.metadata.create_all(bind=self._database_connector.engine)
+        self.create_indexes()
+
+    def create_indexes(self):
+        """
+        create_all only creates the indexes of newly created tables. Create every index of the model which is
+        missing on an already existing table, so existing databases pick up new indexes as well.
+        """
+        engine = self._database_connector.engine
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=engine)
+
+    def migrate_database(self):
+        """
+        Bring an existing database up to date with the model: create missing tables, missing columns and missing
+        indexes. Duplicated datapoints are merged first, otherwise the unique indexes on their message ids could not be
+        created.
+        """
+        Base.metadata.create_all(bind=self._database_connector.engine)
+        self.add_missing_columns()
+        self.deduplicate_datapoints()
+        self.create_indexes()
+
+    def add_missing_columns(self):
+        """
+        create_all does not alter existing tables. Add every column of the model which is missing on an existing
+        table. Only nullable columns without a server default can be added like this, they are NULL in existing rows.
+        """
+        engine = self._database_connector.engine
+        inspector = inspect(engine)
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing_columns:
+                        column_type = column.type.compile(dialect=engine.dialect)
+                        connection.execute(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+    def deduplicate_datapoints(self):
+        """
+        Merge datapoints with the same data source, run and message id into the one with the lowest id: the links to
+        the tumblebases of the duplicates are moved to it and the duplicates are deleted.
+        """
+        with self._database_connector.engine.begin() as connection:
+            for dataPoint_model in [LongData, IntData, FloatData, StringData, ByteData, ImageData]:
+                dataPoint_table = dataPoint_model.__tablename__
+                association_table = dataPoint_model.tumblebases.property.secondary.name
+                duplicates = f"""(SELECT id, min(id) OVER (PARTITION BY data_source_id, run_id, message_id) AS kept_id
+                                  FROM {dataPoint_table}) AS duplicates"""
+                connection.execute(f"""UPDATE {association_table} SET {dataPoint_table}_id = duplicates.kept_id
+                                       FROM {duplicates}
+                                       WHERE {association_table}.{dataPoint_table}_id = duplicates.id
+                                       AND duplicates.id <> duplicates.kept_id""")
+                connection.execute(f"""DELETE FROM {dataPoint_table} USING {duplicates}
+                                       WHERE {dataPoint_table}.id = duplicates.id
+                                       AND duplicates.id <> duplicates.kept_id""")
+                connection.execute(f"""DELETE FROM {association_table} AS a USING {association_table} AS b
+                                       WHERE a.ctid > b.ctid AND a.tumblebase_id = b.tumblebase_id
+                                       AND a.{dataPoint_table}_id = b.{dataPoint_table}_id""")
 
     def drop_database(self):
         Base.metadata.drop_all(bind=self._database_connector.engine)
@@ -84,14 +147,20 @@ if __name__ == "__main__":
     database_connector.connection_string = DatabaseConnector.get_connection_string()
     database_connector.pool_size = DatabaseConnector.get_pool_size()
     database_tools = DatabaseTools(database_connector)
-    print(">>> create and drop database")
-    database_tools.drop_database()
-    print(">>> dropped database")
-    print("-----------------------------------------------------------------------------------------------------------")
-
-    database_tools.create_database()
-    print(">>> create database")
-    print(">>> successfully set up new database")
-    print("-----------------------------------------------------------------------------------------------------------")
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        print(">>> migrate database")
+        database_tools.migrate_database()
+        print(">>> successfully migrated database")
+        print("-----------------------------------------------------------------------------------------------------------")
+    else:
+        print(">>> create and drop database")
+        database_tools.drop_database()
+        print(">>> dropped database")
+        print("-----------------------------------------------------------------------------------------------------------")
+
+        database_tools.create_database()
+        print(">>> create database")
+        print(">>> successfully set up new database")
+        print("-----------------------------------------------------------------------------------------------------------")
 
     database_connector.engine.dispose()
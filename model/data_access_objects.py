@@ -1,12 +1,9 @@
-from sqlalchemy import Column, ForeignKey, Table, Integer, String, Enum, DateTime, Boolean, UniqueConstraint, BigInteger, Float, LargeBinary, UniqueConstraint
+from sqlalchemy import Column, ForeignKey, Table, Integer, String, Enum, DateTime, Boolean, UniqueConstraint, BigInteger, Float, LargeBinary, UniqueConstraint, Index, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from util.utils import get_config_parser
+from util.image_store import get_image_store
 from sqlalchemy.orm import relationship
 from sqlalchemy import func
-import fleep
-import os
 from model.enums import DType, ImageFormat
-import uuid
 
 
 Base = declarative_base()
@@ -32,6 +29,19 @@ class BaseWithConverter(Base):
         model_as_string += ";"
         return model_as_string
 
+    def to_row(self):
+        """Return the column values as a dictionary which can be passed to a core insert statement."""
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
+
+    def to_update_values(self):
+        """
+        Return the values of the columns which were set on the dao, for example by create_from_dto_update, as a
+        dictionary which can be passed to an update statement.
+        """
+        state = inspect(self)
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns
+                if column.key in state.dict}
+
     @classmethod
     def create_from_dto(cls, dto):
         dao = cls()
@@ -71,38 +81,51 @@ tumbleweed_tumblebase = Table('tumbleweed_tumblebase', Base.metadata,
 
 tumblebase_intdata = Table('tumblebase_intdata', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('intdata_id', Integer, ForeignKey('intdata.id'))
+    Column('intdata_id', Integer, ForeignKey('intdata.id')),
+    Index('ix_tumblebase_intdata_intdata_id', 'intdata_id'),
+    Index('ix_tumblebase_intdata_tumblebase_id_intdata_id', 'tumblebase_id', 'intdata_id', unique=True)
 )
 
 tumblebase_longdata = Table('tumblebase_longdata', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('longdata_id', Integer, ForeignKey('longdata.id'))
+    Column('longdata_id', Integer, ForeignKey('longdata.id')),
+    Index('ix_tumblebase_longdata_longdata_id', 'longdata_id'),
+    Index('ix_tumblebase_longdata_tumblebase_id_longdata_id', 'tumblebase_id', 'longdata_id', unique=True)
 )
 
 tumblebase_floatdata = Table('tumblebase_floatdata', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('floatdata_id', Integer, ForeignKey('floatdata.id'))
+    Column('floatdata_id', Integer, ForeignKey('floatdata.id')),
+    Index('ix_tumblebase_floatdata_floatdata_id', 'floatdata_id'),
+    Index('ix_tumblebase_floatdata_tumblebase_id_floatdata_id', 'tumblebase_id', 'floatdata_id', unique=True)
 )
 
 tumblebase_stringdata = Table('tumblebase_stringdata', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('stringdata_id', Integer, ForeignKey('stringdata.id'))
+    Column('stringdata_id', Integer, ForeignKey('stringdata.id')),
+    Index('ix_tumblebase_stringdata_stringdata_id', 'stringdata_id'),
+    Index('ix_tumblebase_stringdata_tumblebase_id_stringdata_id', 'tumblebase_id', 'stringdata_id', unique=True)
 )
 
 tumblebase_bytedata = Table('tumblebase_bytedata', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('bytedata_id', Integer, ForeignKey('bytedata.id'))
+    Column('bytedata_id', Integer, ForeignKey('bytedata.id')),
+    Index('ix_tumblebase_bytedata_bytedata_id', 'bytedata_id'),
+    Index('ix_tumblebase_bytedata_tumblebase_id_bytedata_id', 'tumblebase_id', 'bytedata_id', unique=True)
 )
 
 tumblebase_imagedata = Table('tumblebase_imagedata', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('imagedata_id', Integer, ForeignKey('imagedata.id'))
+    Column('imagedata_id', Integer, ForeignKey('imagedata.id')),
+    Index('ix_tumblebase_imagedata_imagedata_id', 'imagedata_id'),
+    Index('ix_tumblebase_imagedata_tumblebase_id_imagedata_id', 'tumblebase_id', 'imagedata_id', unique=True)
 )
 
 tumblebase_command = Table('tumblebase_command', Base.metadata,
     Column('tumblebase_id', Integer, ForeignKey('tumblebase.id')),
-    Column('command_id', Integer, ForeignKey('command.id'))
-) 
+    Column('command_id', Integer, ForeignKey('command.id')),
+    Index('ix_tumblebase_command_command_id', 'command_id')
+)
 
 
 
@@ -120,7 +143,7 @@ class Tumbleweed(BaseWithConverter):
     subsystems = relationship("SubSystem", uselist=True, back_populates="tumbleweed")
     data_sources = relationship("DataSource", uselist=True, back_populates="tumbleweed")
     runs = relationship("Run", uselist=True, back_populates="tumbleweed")
-    commands = relationship("Command", uselist=True, back_populates="tumbleweed")
+    commands = relationship("Command", uselist=True, back_populates="tumbleweed", lazy="dynamic")
 
     # fields
     address = Column(String, nullable=False)
@@ -142,8 +165,8 @@ class TumbleBase(BaseWithConverter):
     string_data_points = relationship("StringData", uselist=True, secondary=tumblebase_stringdata, back_populates="tumblebases")
     byte_data_points = relationship("ByteData", uselist=True, secondary=tumblebase_bytedata, back_populates="tumblebases")
     image_data_points = relationship("ImageData", uselist=True, secondary=tumblebase_imagedata, back_populates="tumblebases")
-    sent_commands = relationship("Command", uselist=True, back_populates="sender_base")
-    received_commands = relationship("Command", uselist=True, secondary=tumblebase_command, back_populates="received_from_bases")
+    sent_commands = relationship("Command", uselist=True, back_populates="sender_base", lazy="dynamic")
+    received_commands = relationship("Command", uselist=True, secondary=tumblebase_command, back_populates="received_from_bases", lazy="dynamic")
 
     # fields
     created_at = Column(DateTime(timezone=True), nullable=False)
@@ -165,7 +188,7 @@ class Run(BaseWithConverter):
 
     # relationships
     tumbleweed = relationship("Tumbleweed", uselist=False, back_populates="runs")
-    commands = relationship("Command", uselist=True, back_populates="run")
+    commands = relationship("Command", uselist=True, back_populates="run", lazy="dynamic")
     int_data_points = relationship("IntData", uselist=True, back_populates="run")
     long_data_points = relationship("LongData", uselist=True, back_populates="run")
     float_data_points = relationship("FloatData", uselist=True, back_populates="run")
@@ -179,6 +202,9 @@ class Run(BaseWithConverter):
     name = Column(String)
     description = Column(String)
 
+    # args
+    __table_args__ = (Index('ix_run_active_tumbleweed_id', tumbleweed_id, postgresql_where=ended_at.is_(None)),)
+
 
 class SubSystem(BaseWithConverter):
     __tablename__ = "subsystem"
@@ -207,7 +233,7 @@ class CommandType(BaseWithConverter):
     id = Column(Integer, primary_key=True, autoincrement=True)
 
     # relationships
-    commands = relationship("Command", uselist=True, back_populates="command_type")
+    commands = relationship("Command", uselist=True, back_populates="command_type", lazy="dynamic")
 
     # fields
     created_at = Column(DateTime(timezone=True), nullable=False)
@@ -241,6 +267,11 @@ class Command(BaseWithConverter):
     response = Column(String)
     received_response_at = Column(DateTime(timezone=True))
     response_message_id = Column(Integer)
+    timed_out_at = Column(DateTime(timezone=True))
+
+    # args
+    __table_args__ = (Index('ix_command_unanswered_tumbleweed_id_run_id', tumbleweed_id, run_id, id,
+                            postgresql_where=response.is_(None)),)
 
 
 class DataSource(BaseWithConverter):
@@ -299,6 +330,10 @@ class LongData(DataPoint):
     message_id = Column(Integer, nullable=False)
     size = Column(Integer)
 
+    # args
+    __table_args__ = (Index('ix_longdata_data_source_id_run_id_receiving_start', data_source_id, run_id, receiving_start),
+                      Index('ix_longdata_data_source_id_run_id_message_id', data_source_id, run_id, message_id, unique=True))
+
 
 class IntData(DataPoint):
     __tablename__ = "intdata"
@@ -324,6 +359,10 @@ class IntData(DataPoint):
     message_id = Column(Integer, nullable=False)
     size = Column(Integer)
 
+    # args
+    __table_args__ = (Index('ix_intdata_data_source_id_run_id_receiving_start', data_source_id, run_id, receiving_start),
+                      Index('ix_intdata_data_source_id_run_id_message_id', data_source_id, run_id, message_id, unique=True))
+
 
 class FloatData(DataPoint):
     __tablename__ = "floatdata"
@@ -349,6 +388,10 @@ class FloatData(DataPoint):
     message_id = Column(Integer, nullable=False)
     size = Column(Integer)
 
+    # args
+    __table_args__ = (Index('ix_floatdata_data_source_id_run_id_receiving_start', data_source_id, run_id, receiving_start),
+                      Index('ix_floatdata_data_source_id_run_id_message_id', data_source_id, run_id, message_id, unique=True))
+
 
 class StringData(DataPoint):
     __tablename__ = "stringdata"
@@ -374,6 +417,10 @@ class StringData(DataPoint):
     message_id = Column(Integer, nullable=False)
     size = Column(Integer)
 
+    # args
+    __table_args__ = (Index('ix_stringdata_data_source_id_run_id_receiving_start', data_source_id, run_id, receiving_start),
+                      Index('ix_stringdata_data_source_id_run_id_message_id', data_source_id, run_id, message_id, unique=True))
+
 
 class ByteData(DataPoint):
     __tablename__ = "bytedata"
@@ -399,6 +446,10 @@ class ByteData(DataPoint):
     message_id = Column(Integer, nullable=False)
     size = Column(Integer)
 
+    # args
+    __table_args__ = (Index('ix_bytedata_data_source_id_run_id_receiving_start', data_source_id, run_id, receiving_start),
+                      Index('ix_bytedata_data_source_id_run_id_message_id', data_source_id, run_id, message_id, unique=True))
+
 
 class ImageData(DataPoint):
     __tablename__ = "imagedata"
@@ -424,11 +475,22 @@ class ImageData(DataPoint):
     message_id = Column(Integer, nullable=False)
     size = Column(Integer)
 
+    # args
+    __table_args__ = (Index('ix_imagedata_data_source_id_run_id_receiving_start', data_source_id, run_id, receiving_start),
+                      Index('ix_imagedata_data_source_id_run_id_message_id', data_source_id, run_id, message_id, unique=True))
+
     def __init__(self):
         super().__init__()
         self.data = None
         self.__table__.columns.keys().append("data")
 
+    def to_update_values(self):
+        """__init__ always sets data, so keep the stored image unless the update provides a new one."""
+        values = super().to_update_values()
+        if values.get("_data") is None:
+            values.pop("_data", None)
+        return values
+
     @property
     def data(self):
         if self._data is not None:
@@ -442,16 +504,7 @@ class ImageData(DataPoint):
     @data.setter
     def data(self, value):
         if isinstance(value, bytes):
-            config_parser = get_config_parser("environment.ini")
-            path = config_parser["paths"]["images"]
-            if not os.path.exists(path):
-                os.mkdir(path)
-            name = str(uuid.uuid1())
-            format = fleep.get(value).extension[0]
-            full_path = f"{path}{name}.{format}"
-            with open(full_path, "wb+") as f:
-                f.write(value)
-            self._data = full_path
+            self._data = get_image_store().put(value)
         elif value is None:
             self._data = None
         else:
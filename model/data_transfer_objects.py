@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 from model.enums import ImageFormat, DType
+import os
 
 
 
@@ -105,6 +106,7 @@ class Command(BaseClass):
     response: str = None
     received_response_at: datetime = None
     response_message_id: int = None
+    timed_out_at: datetime = None
 
 
 @dataclass
@@ -210,3 +212,44 @@ class ImageData(BaseClass):
     size: int = None
 
 
+@dataclass
+class ImageMetadata(BaseClass):
+    """
+    An image datapoint without its image. Creating it from a DAO only looks at the path of the image file, the image
+    itself is not read.
+    """
+
+    # attributes
+    data_source_id: int = None
+    run_id: int = None
+    receiving_start: datetime = None
+    receiving_done: datetime = None
+    packets: int = None
+    packets_received: int = None
+    message_id: int = None
+    size: int = None
+    format: str = None
+
+    @classmethod
+    def create_from_dao(cls, dao):
+        dto = cls()
+        for key in dto.__dataclass_fields__.keys():
+            if key != "format":
+                setattr(dto, key, getattr(dao, key))
+        if dao._data is not None:
+            dto.format = os.path.splitext(dao._data)[1][1:]
+            if dto.size is None and os.path.exists(dao._data):
+                dto.size = os.path.getsize(dao._data)
+        return dto
+
+
+@dataclass
+class Aggregate:
+
+    # attributes
+    bucket_start: datetime = None
+    min: float = None
+    max: float = None
+    avg: float = None
+    count: int = None
+    last: float = None
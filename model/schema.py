@@ -1,5 +1,5 @@
 from model.data_transfer_objects import Tumbleweed, TumbleBase, Run, SubSystem, DataSource, IntData, LongData, FloatData, StringData, ByteData, Command, CommandType, ImageData
-from marshmallow import Schema, fields, post_load, post_dump, pre_dump, pre_load
+from marshmallow import Schema, fields, validate, post_load, post_dump, pre_dump, pre_load
 from marshmallow_enum import EnumField
 from datetime import datetime, timezone
 from model.enums import DType, ImageFormat
@@ -95,6 +95,7 @@ class CommandSchema(Schema):
     response = fields.String(allow_none=True, required=True)
     received_response_at = fields.DateTime(allow_none=True, required=True)
     response_message_id = fields.Int(allow_none=True, required=True)
+    timed_out_at = fields.DateTime(dump_only=True)
 
     @post_load
     def init_model(self, data):
@@ -102,6 +103,28 @@ class CommandSchema(Schema):
         return Command(**data)
 
 
+class CommandTargetSchema(Schema):
+
+    tumbleweed_id = fields.Int(allow_none=False, required=True)
+    tumblebase_id = fields.Int(allow_none=False, required=True)
+
+    @post_load
+    def init_model(self, data):
+        return data["tumbleweed_id"], data["tumblebase_id"]
+
+
+class CommandBroadcastSchema(Schema):
+    """A command sent to several tumbleweeds, each through its own tumblebase."""
+
+    args = fields.String(allow_none=True, required=True)
+    targets = fields.Nested(CommandTargetSchema, many=True, required=True, validate=validate.Length(min=1))
+
+    @post_load
+    def init_model(self, data):
+        return {"command": Command(created_at=datetime.now(timezone.utc), args=data["args"]),
+                "targets": data["targets"]}
+
+
 class DataSourceSchema(Schema):
 
     id = fields.Int(dump_only=True)
@@ -262,6 +285,7 @@ class ImageDataSchema(Schema):
             to_bytes = data["data"].encode()
             to_bytes = base64.b64decode(to_bytes)
             data["data"] = to_bytes
+            data["size"] = len(to_bytes)
         return ImageData(**data)
 
     @pre_dump
@@ -271,3 +295,40 @@ class ImageDataSchema(Schema):
             to_string = to_string.decode()
             data.data = to_string
         return data
+
+
+class ImageMetadataSchema(Schema):
+
+    id = fields.Int(dump_only=True)
+
+    data_source_id = fields.Int(dump_only=True)
+    run_id = fields.Int(dump_only=True)
+    receiving_start = fields.DateTime(dump_only=True)
+    receiving_done = fields.DateTime(dump_only=True)
+    packets = fields.Int(dump_only=True)
+    packets_received = fields.Int(dump_only=True)
+    message_id = fields.Int(dump_only=True)
+    size = fields.Int(dump_only=True)
+    format = fields.String(dump_only=True)
+    url = fields.Function(lambda image: f"/get-image/{image.id}" if image.format is not None else None)
+
+
+class AggregateSchema(Schema):
+
+    bucket_start = fields.DateTime(dump_only=True)
+    min = fields.Raw(dump_only=True)
+    max = fields.Raw(dump_only=True)
+    avg = fields.Float(dump_only=True)
+    count = fields.Int(dump_only=True)
+    last = fields.Raw(dump_only=True)
+
+
+class LongAggregateSchema(AggregateSchema):
+
+    @post_dump
+    def convert_long_to_str(self, data):
+        """javascript cannot handle large integers, so we must convert to a string"""
+        for key in ["min", "max", "last"]:
+            if data.get(key) is not None:
+                data[key] = str(data[key])
+        return data
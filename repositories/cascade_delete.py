@@ -0,0 +1,80 @@
+from model.data_access_objects import Tumbleweed, Run, Command, CommandType, DataSource, LongData, IntData, FloatData, StringData, ByteData, ImageData, tumbleweed_tumblebase, tumblebase_command
+from sqlalchemy import select, or_
+
+
+class CascadeDelete:
+    """
+    Deletes runs, data sources, tumbleweeds and command types together with all datapoints, commands and association
+    rows depending on them. Every table is cleaned up with one set based DELETE statement instead of loading each
+    row into the session, so even runs with millions of datapoints can be deleted in bounded memory.
+
+    Without a chunk size everything happens inside the transaction of the given session. With a chunk size the
+    dependent rows are deleted in chunks of at most chunk_size rows and the session is committed after every chunk,
+    so no lock is held for a long time. This also commits whatever the caller did in the session before.
+
+    The chunked deletion is not atomic: if it fails, e.g. because the connection is lost, the chunks committed so far
+    stay deleted and the parent is left half deleted, still there but missing some of its datapoints and commands.
+    Repeating the deletion removes the rest.
+    """
+
+    datapoint_models = [LongData, IntData, FloatData, StringData, ByteData, ImageData]
+
+    def __init__(self, session, chunk_size=None):
+        self._session = session
+        self._chunk_size = chunk_size
+        self.deleted_rows = dict()
+
+    def delete_run(self, run_id):
+        for datapoint_model in self.datapoint_models:
+            self._delete_datapoints(datapoint_model, datapoint_model.run_id == run_id)
+        self._delete_commands(Command.run_id == run_id)
+        self._delete(Run.__table__, Run.id == run_id)
+        return self.deleted_rows
+
+    def delete_dataSource(self, dataSource_id):
+        for datapoint_model in self.datapoint_models:
+            self._delete_datapoints(datapoint_model, datapoint_model.data_source_id == dataSource_id)
+        self._delete(DataSource.__table__, DataSource.id == dataSource_id)
+        return self.deleted_rows
+
+    def delete_tumbleweed(self, tumbleweed_id):
+        run_ids = select([Run.id]).where(Run.tumbleweed_id == tumbleweed_id)
+        for datapoint_model in self.datapoint_models:
+            self._delete_datapoints(datapoint_model, datapoint_model.run_id.in_(run_ids))
+        self._delete_commands(or_(Command.tumbleweed_id == tumbleweed_id, Command.run_id.in_(run_ids)))
+        self._delete(Run.__table__, Run.tumbleweed_id == tumbleweed_id)
+        self._delete(tumbleweed_tumblebase, tumbleweed_tumblebase.c.tumbleweed_id == tumbleweed_id)
+        self._delete(Tumbleweed.__table__, Tumbleweed.id == tumbleweed_id)
+        return self.deleted_rows
+
+    def delete_commandType(self, commandType_id):
+        self._delete_commands(Command.command_type_id == commandType_id)
+        self._delete(CommandType.__table__, CommandType.id == commandType_id)
+        return self.deleted_rows
+
+    def _delete_datapoints(self, datapoint_model, condition):
+        association_table = datapoint_model.tumblebases.property.secondary
+        association_column = association_table.c[f"{datapoint_model.__tablename__}_id"]
+        self._delete_with_associations(datapoint_model.__table__, condition, association_table, association_column)
+
+    def _delete_commands(self, condition):
+        self._delete_with_associations(Command.__table__, condition, tumblebase_command, tumblebase_command.c.command_id)
+
+    def _delete_with_associations(self, table, condition, association_table, association_column):
+        if self._chunk_size is None:
+            ids = select([table.c.id]).where(condition)
+            self._delete(association_table, association_column.in_(ids))
+            self._delete(table, condition)
+            return
+        while True:
+            query = select([table.c.id]).where(condition).limit(self._chunk_size)
+            ids = [row[0] for row in self._session.execute(query)]
+            if len(ids) == 0:
+                break
+            self._delete(association_table, association_column.in_(ids))
+            self._delete(table, table.c.id.in_(ids))
+            self._session.commit()
+
+    def _delete(self, table, condition):
+        result = self._session.execute(table.delete().where(condition))
+        self.deleted_rows[table.name] = self.deleted_rows.get(table.name, 0) + result.rowcount
@@ -1,8 +1,15 @@
 from model.data_access_objects import Tumbleweed, TumbleBase, Run, SubSystem, Command, CommandType, DataSource, LongData, IntData, FloatData, StringData, ByteData, ImageData
+from repositories.cascade_delete import CascadeDelete
+from sqlalchemy.dialects.postgresql import array_agg, aggregate_order_by, insert, array
+from sqlalchemy import Sequence, select, func, cast, collate, Float, tuple_, and_, literal, table, column
+from sqlalchemy.orm import joinedload
 from logger.logger import LoggerFactory
 from abc import abstractmethod
 from util.mode import Mode
+from datetime import datetime
 from re import findall
+import math
+import io
 
 
 class Repository:
@@ -23,6 +30,38 @@ class Repository:
         session.commit()
         return entity.id
 
+    def insert_entity(self, entity, session):
+        """
+        Add a new entity to the session and flush it to get its id. In contrast to save_entity nothing is committed,
+        so several inserts can share one transaction.
+        """
+        session.add(entity)
+        session.flush()
+        return entity.id
+
+    def insert_entities(self, entities, session):
+        """
+        Like insert_entity, but for several entities which are flushed together.
+        :return: The ids of the entities in their order.
+        """
+        session.add_all(entities)
+        session.flush()
+        return [entity.id for entity in entities]
+
+    def update_entity(self, entity_id, values, session):
+        """
+        Update the given columns of an entity with one UPDATE ... RETURNING statement, without loading the entity
+        first. Nothing is committed.
+        :param values: A dictionary which maps column keys to their new values, see to_update_values.
+        :return: The id of the entity or None if it does not exist.
+        """
+        table = self.entity_model.__table__
+        if len(values) == 0:
+            return session.execute(select([table.c.id]).where(table.c.id == entity_id)).scalar()
+        statement = table.update().where(table.c.id == entity_id).values(
+            {table.c[key]: value for key, value in values.items()}).returning(table.c.id)
+        return session.execute(statement).scalar()
+
     def get_entity(self, entity_id, session):
         return session.query(self.entity_model).filter(self.entity_model.id == entity_id).first()
 
@@ -53,6 +92,212 @@ class Repository:
         return cls(logger)
 
 
+class DataPointRepository(Repository):
+    """
+    A base repository for all kinds of datapoints. Besides the single row methods it offers bulk inserts which
+    write many datapoints and their links to the receiving tumblebase with one statement per table.
+    Datapoints are unique by data source, run and message id. Inserting a datapoint which is stored already, for
+    example because the tumblebase retransmitted it or because another tumblebase received it as well, only links
+    the tumblebase to the stored datapoint.
+    """
+
+    def __init__(self, logger, entity_model):
+        super().__init__(logger, entity_model)
+        self.association_table = entity_model.tumblebases.property.secondary
+        self.association_column = f"{entity_model.__tablename__}_id"
+        self.message_key = ["data_source_id", "run_id", "message_id"]
+
+    def reserve_ids(self, count, session):
+        """
+        Fetch the given number of ids from the sequence of the datapoint table in one round trip. With the ids known
+        in advance the datapoints and their tumblebase links can be inserted with executemany.
+        """
+        if count == 0:
+            return []
+        sequence = Sequence(f"{self.entity_model.__tablename__}_id_seq")
+        query = select([sequence.next_value()]).select_from(func.generate_series(1, count))
+        return [row[0] for row in session.execute(query)]
+
+    def insert_datapoint(self, row, tumblebase_id, session):
+        """
+        Insert a datapoint given as dictionary of column values unless it is stored already and link it to the
+        tumblebase. Nothing is committed.
+        :return: The id of the inserted or the already stored datapoint.
+        """
+        dataPoint_table = self.entity_model.__table__
+        row = {key: value for key, value in row.items() if key != "id" or value is not None}
+        statement = insert(dataPoint_table).values(row).on_conflict_do_nothing(
+            index_elements=self.message_key).returning(dataPoint_table.c.id)
+        dataPoint_id = session.execute(statement).scalar()
+        if dataPoint_id is None:
+            dataPoint_id = session.execute(select([dataPoint_table.c.id]).where(and_(
+                *[dataPoint_table.c[key] == row[key] for key in self.message_key]))).scalar()
+        session.execute(insert(self.association_table).values(
+            {"tumblebase_id": tumblebase_id, self.association_column: dataPoint_id}).on_conflict_do_nothing())
+        return dataPoint_id
+
+    def bulk_insert(self, rows, tumblebase_id, session):
+        """
+        Insert datapoints given as dictionaries of column values and link them to the tumblebase. Every row must
+        already have its id set, see reserve_ids. The rows are written to a staging table with executemany and
+        merged from there. Nothing is committed.
+        :return: The ids of the inserted or already stored datapoints, in the order of the rows.
+        """
+        if len(rows) == 0:
+            return []
+        staging_table = self._create_staging_table(session)
+        session.execute(staging_table.insert(), rows)
+        return self._merge_staging_table(staging_table, rows, tumblebase_id, session)
+
+    def _create_staging_table(self, session):
+        """Create a temporary table like the datapoint table, which is dropped at the end of the transaction."""
+        table_name = self.entity_model.__tablename__
+        session.execute(f"CREATE TEMPORARY TABLE staging_{table_name} (LIKE {table_name}) ON COMMIT DROP")
+        return table(f"staging_{table_name}",
+                     *[column(dataPoint_column.name) for dataPoint_column in self.entity_model.__table__.columns])
+
+    def _merge_staging_table(self, staging_table, rows, tumblebase_id, session):
+        """
+        Insert the staged datapoints which are not stored yet, link all of them to the tumblebase and drop the staging
+        table. A datapoint without data source or run can not be a duplicate and keeps its own id.
+        """
+        dataPoint_table = self.entity_model.__table__
+        column_names = [dataPoint_column.name for dataPoint_column in dataPoint_table.columns]
+        session.execute(insert(dataPoint_table).from_select(column_names, select(
+            [staging_table.c[name] for name in column_names])).on_conflict_do_nothing(
+            index_elements=self.message_key))
+        stored = staging_table.outerjoin(dataPoint_table, and_(
+            *[dataPoint_table.c[key] == staging_table.c[key] for key in self.message_key]))
+        stored_id = func.coalesce(dataPoint_table.c.id, staging_table.c.id)
+        session.execute(insert(self.association_table).from_select(
+            ["tumblebase_id", self.association_column],
+            select([literal(tumblebase_id), stored_id]).select_from(stored).distinct()).on_conflict_do_nothing())
+        stored_ids = dict(session.execute(select([staging_table.c.id, stored_id]).select_from(stored)).fetchall())
+        session.execute(f"DROP TABLE {staging_table.name}")
+        return [stored_ids[row["id"]] for row in rows]
+
+    def stream_by_dataSource_id_and_run_id(self, dataSource_id, run_id, session, chunk_size=1000):
+        """
+        Like get_by_dataSource_id_and_run_id, but the datapoints are fetched through a server side cursor in chunks
+        of chunk_size rows while the returned query is iterated.
+        """
+        return session.query(self.entity_model).filter(self.entity_model.data_source_id == dataSource_id).filter(
+            self.entity_model.run_id == run_id).order_by(self.entity_model.receiving_done).yield_per(chunk_size)
+
+    def stream_by_dataSource_id_and_run_id_interval(self, dataSource_id, run_id, start, end, session,
+                                                    chunk_size=1000):
+        return session.query(self.entity_model).filter(self.entity_model.data_source_id == dataSource_id).filter(
+            self.entity_model.run_id == run_id).filter(self.entity_model.receiving_start >= start).filter(
+            self.entity_model.receiving_start <= end).order_by(self.entity_model.receiving_start).yield_per(chunk_size)
+
+    def get_page_by_dataSource_id_and_run_id(self, dataSource_id, run_id, limit, after, session):
+        """
+        Return the next page of datapoints ordered by (receiving_start, id). The page starts after the given key
+        instead of skipping an offset, so every page is read from the index in the same time.
+        :param after: The (receiving_start, id) of the last datapoint of the previous page or None for the first page.
+        """
+        query = session.query(self.entity_model).filter(self.entity_model.data_source_id == dataSource_id).filter(
+            self.entity_model.run_id == run_id)
+        if after is not None:
+            query = query.filter(tuple_(self.entity_model.receiving_start, self.entity_model.id) > tuple_(*after))
+        return query.order_by(self.entity_model.receiving_start, self.entity_model.id).limit(limit).all()
+
+    def get_by_ids(self, ids, session):
+        return session.query(self.entity_model).filter(self.entity_model.id.in_(ids)).order_by(
+            self.entity_model.receiving_start).all()
+
+
+class NumericDataRepository(DataPointRepository):
+    """
+    A base repository for datapoints with numeric data, which can be aggregated by the database.
+    """
+
+    aggregate_functions = ["min", "max", "avg", "count", "last"]
+
+    def bulk_copy(self, rows, tumblebase_id, session):
+        """
+        Like bulk_insert, but the datapoints are streamed to the staging table with COPY, which skips parsing and
+        planning an insert statement per row. Rows without an id get one reserved. Nothing is committed.
+        :return: The ids of the inserted or already stored datapoints, in the order of the rows.
+        """
+        if len(rows) == 0:
+            return []
+        missing_ids = iter(self.reserve_ids(sum(1 for row in rows if row.get("id") is None), session))
+        for row in rows:
+            if row.get("id") is None:
+                row["id"] = next(missing_ids)
+        columns = self.entity_model.__table__.columns
+        dataPoints = io.StringIO()
+        for row in rows:
+            dataPoints.write("\t".join(self._to_copy_text(row.get(column.key)) for column in columns) + "\n")
+        staging_table = self._create_staging_table(session)
+        cursor = session.connection().connection.cursor()
+        try:
+            self._copy(cursor, staging_table.name, [column.name for column in columns], dataPoints)
+        finally:
+            cursor.close()
+        return self._merge_staging_table(staging_table, rows, tumblebase_id, session)
+
+    @staticmethod
+    def _copy(cursor, table_name, column_names, buffer):
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table_name} ({', '.join(column_names)}) FROM STDIN", buffer)
+
+    @staticmethod
+    def _to_copy_text(value):
+        """Format a numeric, datetime or null column value in the text format of COPY."""
+        if value is None:
+            return "\\N"
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, float) and not math.isfinite(value):
+            return "NaN" if math.isnan(value) else ("Infinity" if value > 0 else "-Infinity")
+        return str(value)
+
+    def get_aggregates_by_dataSource_id_and_run_id_interval(self, dataSource_id, run_id, start, end, bucket,
+                                                            functions, session):
+        """
+        Aggregate the datapoints received in the interval in buckets of the given number of seconds. The buckets are
+        aligned to the unix epoch, empty buckets are left out.
+        :param functions: The aggregate functions to compute, a subset of aggregate_functions.
+        :return: One row per bucket, ordered by bucket_start, with the bucket_start and one column per function.
+        """
+        receiving_start = self.entity_model.receiving_start
+        data = self.entity_model.data
+        bucket_start = func.to_timestamp(func.floor(func.extract("epoch", receiving_start) / bucket) * bucket)
+        columns = {
+            "min": func.min(data),
+            "max": func.max(data),
+            "avg": cast(func.avg(data), Float),
+            "count": func.count(data),
+            "last": array_agg(aggregate_order_by(data, receiving_start.desc()))[1]
+        }
+        query = session.query(bucket_start.label("bucket_start"),
+                              *[columns[function].label(function) for function in functions])
+        return query.filter(self.entity_model.data_source_id == dataSource_id).filter(
+            self.entity_model.run_id == run_id).filter(receiving_start >= start).filter(
+            receiving_start <= end).group_by("bucket_start").order_by("bucket_start").all()
+
+    def get_series_by_dataSource_id_and_run_id_interval(self, dataSource_id, run_id, start, end, session,
+                                                        chunk_size=10000):
+        """
+        Stream the datapoints received in the interval through a server side cursor, ordered by receiving_start.
+        Datapoints without data are left out.
+        :return: A generator of lists of at most chunk_size (id, receiving_start as epoch seconds, data) rows.
+        """
+        receiving_start = self.entity_model.receiving_start
+        query = select([self.entity_model.id, cast(func.extract("epoch", receiving_start), Float),
+                        self.entity_model.data]).where(self.entity_model.data_source_id == dataSource_id).where(
+            self.entity_model.run_id == run_id).where(receiving_start >= start).where(receiving_start <= end).where(
+            self.entity_model.data != None).order_by(receiving_start)
+        result = session.connection(execution_options={"stream_results": True}).execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            yield rows
+
+
 class TumbleweedRepository(Repository):
     """
     A repository for Tumbleweeds.
@@ -61,82 +306,14 @@ class TumbleweedRepository(Repository):
     def __init__(self, logger):
         super().__init__(logger, Tumbleweed)
 
-    def delete_entity(self, entity_id, session):
+    def delete_entity(self, entity_id, session, chunk_size=None):
         tumbleweed = session.query(self.entity_model).filter(self.entity_model.id == entity_id).first()
+        if tumbleweed is None:
+            return None
         if len(tumbleweed.subsystems) > 0 or len(tumbleweed.data_sources) > 0:
             return None
-        for run in tumbleweed.runs:
-            for datapoint in run.long_data_points:
-                datapoint.run = None
-                datapoint.run_id = None
-                datapoint.data_source = None
-                datapoint.data_source_id = None
-                datapoint.tumblebases = []
-                session.delete(datapoint)
-            for datapoint in run.int_data_points:
-                datapoint.run = None
-                datapoint.run_id = None
-                datapoint.data_source = None
-                datapoint.data_source_id = None
-                datapoint.tumblebases = []
-                session.delete(datapoint)
-            for datapoint in run.float_data_points:
-                datapoint.run = None
-                datapoint.run_id = None
-                datapoint.data_source = None
-                datapoint.data_source_id = None
-                datapoint.tumblebases = []
-                session.delete(datapoint)
-            for datapoint in run.string_data_points:
-                datapoint.run = None
-                datapoint.run_id = None
-                datapoint.data_source = None
-                datapoint.data_source_id = None
-                datapoint.tumblebases = []
-                session.delete(datapoint)
-            for datapoint in run.byte_data_points:
-                datapoint.run = None
-                datapoint.run_id = None
-                datapoint.data_source = None
-                datapoint.data_source_id = None
-                datapoint.tumblebases = []
-                session.delete(datapoint)
-            for datapoint in run.image_data_points:
-                datapoint.run = None
-                datapoint.run_id = None
-                datapoint.data_source = None
-                datapoint.data_source_id = None
-                datapoint.tumblebases = []
-                session.delete(datapoint)
-            for command in run.commands:
-                command.tumbleweed = None
-                command.tumbleweed_id = None
-                command.run_id = None
-                command.run = None
-                command.command_type_id = None
-                command.command_type = None
-                command.sender_base = None
-                command.sender_base_id = None
-                command.received_from_bases = []
-                session.delete(command)
-            run.tumbleweed = None
-            run.tumbleweed_id = None
-            session.delete(run)
-        tumbleweed.tumblebases = []
-        tumbleweed.data_sources = []
-        tumbleweed.subsystems = []
-        for command in tumbleweed.commands:
-            command.tumbleweed = None
-            command.tumbleweed_id = None
-            command.run_id = None
-            command.run = None
-            command.command_type_id = None
-            command.command_type = None
-            command.sender_base = None
-            command.sender_base_id = None
-            command.received_from_bases = []
-            session.delete(command)
-        session.delete(tumbleweed)
+        deleted_rows = CascadeDelete(session, chunk_size).delete_tumbleweed(entity_id)
+        self._logger.info(f"TumbleweedRepository.delete_entity(): deleted tumbleweed {entity_id}: {deleted_rows}")
         return entity_id
 
     def get_by_address(self, address, session):
@@ -155,8 +332,8 @@ class TumbleBaseRepository(Repository):
         tumblebase = session.query(self.entity_model).filter(self.entity_model.id == entity_id).first()
         if len(tumblebase.long_data_points) > 0 or len(tumblebase.int_data_points) > 0 or len(
                 tumblebase.float_data_points) > 0 or len(tumblebase.string_data_points) > 0 or len(
-                tumblebase.byte_data_points) > 0 or len(tumblebase.image_data_points) > 0 or len(
-                tumblebase.sent_commands) > 0 or len(tumblebase.received_commands) > 0:
+                tumblebase.byte_data_points) > 0 or len(tumblebase.image_data_points) > 0 or \
+                tumblebase.sent_commands.first() is not None or tumblebase.received_commands.first() is not None:
             return None
         tumblebase.tumbleweeds = []
         session.delete(tumblebase)
@@ -177,66 +354,37 @@ class RunRepository(Repository):
     def get_runs_by_tumbleweed_id(self, tumbleweed_id, session):
         return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).order_by(self.entity_model.id).all()
 
-    def delete_entity(self, entity_id, session):
+    def get_page_by_tumbleweed_id(self, tumbleweed_id, limit, after, session):
+        query = session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id)
+        if after is not None:
+            query = query.filter(self.entity_model.id > after)
+        return query.order_by(self.entity_model.id).limit(limit).all()
+
+    def get_active_run(self, tumbleweed_id, session):
+        """
+        Return the most recent run of the tumbleweed which has not ended yet. The query is served by the partial
+        index on run(tumbleweed_id) WHERE ended_at IS NULL, so its cost does not grow with the run history.
+        """
+        return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).filter(
+            self.entity_model.ended_at == None).order_by(self.entity_model.created_at.desc()).first()
+
+    def get_active_runs(self, tumbleweed_ids, session):
+        """
+        Return the active run of every given tumbleweed which has one, using a single DISTINCT ON query.
+        """
+        if len(tumbleweed_ids) == 0:
+            return []
+        return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id.in_(tumbleweed_ids)).filter(
+            self.entity_model.ended_at == None).order_by(self.entity_model.tumbleweed_id,
+                                                         self.entity_model.created_at.desc()).distinct(
+            self.entity_model.tumbleweed_id).all()
+
+    def delete_entity(self, entity_id, session, chunk_size=None):
         run = session.query(self.entity_model).filter(self.entity_model.id == entity_id).first()
         if run is None:
             return None
-        for datapoint in run.long_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in run.int_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in run.float_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in run.string_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in run.byte_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in run.image_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for command in run.commands:
-            command.tumbleweed = None
-            command.tumbleweed_id = None
-            command.run_id = None
-            command.run = None
-            command.command_type_id = None
-            command.command_type = None
-            command.sender_base = None
-            command.sender_base_id = None
-            command.received_from_bases = []
-            session.delete(command)
-        run.tumbleweed = None
-        run.tumbleweed_id = None
-        session.delete(run)
+        deleted_rows = CascadeDelete(session, chunk_size).delete_run(entity_id)
+        self._logger.info(f"RunRepository.delete_entity(): deleted run {entity_id}: {deleted_rows}")
         return entity_id
 
 
@@ -270,22 +418,12 @@ class CommandTypeRepository(Repository):
     def __init__(self, logger):
         super().__init__(logger, CommandType)
 
-    def delete_entity(self, entity_id, session):
+    def delete_entity(self, entity_id, session, chunk_size=None):
         commandType = session.query(self.entity_model).filter(self.entity_model.id == entity_id).first()
         if commandType is None:
             return None
-        for command in commandType.commands:
-            command.tumbleweed = None
-            command.tumbleweed_id = None
-            command.run_id = None
-            command.run = None
-            command.command_type_id = None
-            command.command_type = None
-            command.sender_base = None
-            command.sender_base_id = None
-            command.received_from_bases = []
-            session.delete(command)
-        session.delete(commandType)
+        deleted_rows = CascadeDelete(session, chunk_size).delete_commandType(entity_id)
+        self._logger.info(f"CommandTypeRepository.delete_entity(): deleted command type {entity_id}: {deleted_rows}")
         return entity_id
 
 
@@ -307,12 +445,97 @@ class CommandRepository(Repository):
         return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).filter(
             self.entity_model.run_id == run_id).order_by(self.entity_model.id).all()
 
+    def get_page_by_tumbleweed_id_and_run_id(self, tumbleweed_id, run_id, limit, after, session):
+        query = session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).filter(
+            self.entity_model.run_id == run_id)
+        if after is not None:
+            query = query.filter(self.entity_model.id > after)
+        return query.order_by(self.entity_model.id).limit(limit).all()
+
     def get_unanswered_by_tumbleweed_id_and_run_id(self, tumbleweed_id, run_id, session):
         return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).filter(
             self.entity_model.run_id == run_id).filter(self.entity_model.response == None).filter(
             self.entity_model.received_response_at == None).filter(
             self.entity_model.response_message_id == None).order_by(self.entity_model.id).all()
 
+    def get_targets(self, targets, session):
+        """
+        Look up everything needed to send a command to several targets with one query: the address of every
+        tumbleweed, its active run and the tumblebase. A column of a tumbleweed, run or tumblebase which does not exist
+        is None.
+        :param targets: A list of (tumbleweed_id, tumblebase_id) pairs.
+        :return: A row per distinct target with the columns tumbleweed_id, tumblebase_id, tumbleweed_exists,
+                 tumbleweed_address, run_id and tumblebase_exists.
+        """
+        targets = sorted(set(targets))
+        # unnest in the select list zips both arrays into (tumbleweed_id, tumblebase_id) rows
+        target = select([func.unnest(array([tumbleweed_id for tumbleweed_id, _ in targets])).label("tumbleweed_id"),
+                         func.unnest(array([tumblebase_id for _, tumblebase_id in targets])).label("tumblebase_id")]
+                        ).alias("target")
+        active_run = self._active_runs(Run.tumbleweed_id.in_([tumbleweed_id for tumbleweed_id, _ in targets]))
+        query = select([target.c.tumbleweed_id, target.c.tumblebase_id,
+                        (Tumbleweed.id != None).label("tumbleweed_exists"),
+                        Tumbleweed.address.label("tumbleweed_address"), active_run.c.id.label("run_id"),
+                        (TumbleBase.id != None).label("tumblebase_exists")]).select_from(
+            target.outerjoin(Tumbleweed, Tumbleweed.id == target.c.tumbleweed_id).outerjoin(
+                active_run, active_run.c.tumbleweed_id == target.c.tumbleweed_id).outerjoin(
+                TumbleBase, TumbleBase.id == target.c.tumblebase_id))
+        return session.execute(query).fetchall()
+
+    def get_untransmitted_of_active_runs(self, session):
+        """
+        Return the commands of active runs which have not been transmitted yet, with the tumbleweed and the command
+        type needed to send them.
+        """
+        return self._query_of_active_runs(session).filter(self.entity_model.transmitted == False).all()
+
+    def get_by_ids_of_active_runs(self, command_ids, session):
+        """Like get_untransmitted_of_active_runs, but for the given commands."""
+        return self._query_of_active_runs(session).filter(self.entity_model.id.in_(command_ids)).all()
+
+    def _query_of_active_runs(self, session):
+        return session.query(self.entity_model).join(Run, self.entity_model.run).filter(Run.ended_at == None).options(
+            joinedload(self.entity_model.tumbleweed), joinedload(self.entity_model.command_type)).order_by(
+            self.entity_model.id)
+
+    def mark_timed_out(self, created_before, timed_out_at, session):
+        """
+        Flag the commands created before created_before which have no response and were not flagged yet. Nothing is
+        committed.
+        :return: The ids of the flagged commands.
+        """
+        command_table = self.entity_model.__table__
+        statement = command_table.update().where(and_(
+            command_table.c.response == None, command_table.c.timed_out_at == None,
+            command_table.c.created_at < created_before)).values(timed_out_at=timed_out_at).returning(
+            command_table.c.id)
+        return [row[0] for row in session.execute(statement)]
+
+    def count_unanswered_of_active_runs(self, session):
+        """
+        Count the commands without response of the active run of every tumbleweed, served by the partial index on
+        unanswered commands.
+        :return: Rows of tumbleweed_id, run_id, unanswered and timed_out, one per active run.
+        """
+        active_run = self._active_runs()
+        return session.query(active_run.c.tumbleweed_id, active_run.c.id.label("run_id"),
+                             func.count(self.entity_model.id).label("unanswered"),
+                             func.count(self.entity_model.timed_out_at).label("timed_out")).select_from(
+            active_run).outerjoin(
+            self.entity_model, and_(self.entity_model.tumbleweed_id == active_run.c.tumbleweed_id,
+                                    self.entity_model.run_id == active_run.c.id,
+                                    self.entity_model.response == None)).group_by(
+            active_run.c.tumbleweed_id, active_run.c.id).order_by(active_run.c.tumbleweed_id).all()
+
+    @staticmethod
+    def _active_runs(*conditions):
+        """
+        Select the active run of every tumbleweed like RunRepository.get_active_runs, the most recent run which has
+        not ended, as a subquery with the columns id and tumbleweed_id.
+        """
+        return select([Run.id, Run.tumbleweed_id]).where(and_(Run.ended_at == None, *conditions)).order_by(
+            Run.tumbleweed_id, Run.created_at.desc()).distinct(Run.tumbleweed_id).alias("active_run")
+
 
 class DataSourceRepository(Repository):
     """
@@ -322,55 +545,12 @@ class DataSourceRepository(Repository):
     def __init__(self, logger):
         super().__init__(logger, DataSource)
 
-    def delete_entity(self, entity_id, session):
+    def delete_entity(self, entity_id, session, chunk_size=None):
         dataSource = session.query(self.entity_model).filter(self.entity_model.id == entity_id).first()
-        for datapoint in dataSource.long_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in dataSource.int_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in dataSource.float_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in dataSource.string_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in dataSource.byte_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        for datapoint in dataSource.image_data_points:
-            datapoint.run = None
-            datapoint.run_id = None
-            datapoint.data_source = None
-            datapoint.data_source_id = None
-            datapoint.tumblebases = []
-            session.delete(datapoint)
-        dataSource.subsystem_id = None
-        dataSource.subsystem = None
-        dataSource.tumbleweed_id = None
-        dataSource.tumbleweed = None
-        session.delete(dataSource)
+        if dataSource is None:
+            return None
+        deleted_rows = CascadeDelete(session, chunk_size).delete_dataSource(entity_id)
+        self._logger.info(f"DataSourceRepository.delete_entity(): deleted data source {entity_id}: {deleted_rows}")
         return entity_id
 
     def get_dataSources_by_tumbleweed_id(self, tumbleweed_id, session):
@@ -380,11 +560,15 @@ class DataSourceRepository(Repository):
         return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).filter(
             self.entity_model.short_key == short_key).first()
 
+    def get_dataSources_by_tumbleweed_id_and_short_keys(self, tumbleweed_id, short_keys, session):
+        return session.query(self.entity_model).filter(self.entity_model.tumbleweed_id == tumbleweed_id).filter(
+            self.entity_model.short_key.in_(short_keys)).all()
+
     def get_by_subSystem_id(self, subSystem_id, session):
         return session.query(self.entity_model).filter(self.entity_model.subsystem_id == subSystem_id).all()
 
 
-class LongDataRepository(Repository):
+class LongDataRepository(NumericDataRepository):
     """
     A repository for Long data.
     """
@@ -405,7 +589,7 @@ class LongDataRepository(Repository):
             self.entity_model.receiving_start <= end).order_by(self.entity_model.receiving_start).all()
 
 
-class IntDataRepository(Repository):
+class IntDataRepository(NumericDataRepository):
     """
     A repository for Int data.
     """
@@ -426,7 +610,7 @@ class IntDataRepository(Repository):
             self.entity_model.receiving_start <= end).order_by(self.entity_model.receiving_start).all()
 
 
-class FloatDataRepository(Repository):
+class FloatDataRepository(NumericDataRepository):
     """
     A repository for Float data.
     """
@@ -446,7 +630,7 @@ class FloatDataRepository(Repository):
             self.entity_model.run_id == run_id).filter(self.entity_model.receiving_start >= start).filter(
             self.entity_model.receiving_start <= end).order_by(self.entity_model.receiving_start).all()
 
-class StringDataRepository(Repository):
+class StringDataRepository(DataPointRepository):
     """
     A repository for String data.
     """
@@ -466,7 +650,7 @@ class StringDataRepository(Repository):
             self.entity_model.run_id == run_id).filter(self.entity_model.receiving_start >= start).filter(
             self.entity_model.receiving_start <= end).order_by(self.entity_model.receiving_start).all()
 
-class ByteDataRepository(Repository):
+class ByteDataRepository(DataPointRepository):
     """
     A repository for Byte data.
     """
@@ -487,7 +671,7 @@ class ByteDataRepository(Repository):
             self.entity_model.receiving_start <= end).order_by(self.entity_model.receiving_start).all()
 
 
-class ImageDataRepository(Repository):
+class ImageDataRepository(DataPointRepository):
     """
     A repository for Byte data.
     """
@@ -502,6 +686,22 @@ class ImageDataRepository(Repository):
         return session.query(self.entity_model).filter(self.entity_model.data_source_id == dataSource_id).filter(
             self.entity_model.run_id == run_id).order_by(self.entity_model.receiving_done).all()
 
+    def stream_path_stems(self, root_path, session, chunk_size=10000):
+        """
+        Stream the paths of all image files below root_path without their extension, sorted by code point,
+        through a server side cursor. Used to find image files which are not referenced anymore.
+        """
+        stem = func.regexp_replace(self.entity_model._data, r"\.[^./]*$", "")
+        query = select([stem.label("stem")]).where(
+            self.entity_model._data.startswith(root_path, autoescape=True)).order_by(collate(stem, "C"))
+        result = session.connection(execution_options={"stream_results": True}).execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row.stem
+
     def get_by_dataSource_id_and_run_id_interval(self, dataSource_id, run_id, start, end, session):
         return session.query(self.entity_model).filter(self.entity_model.data_source_id == dataSource_id).filter(
             self.entity_model.run_id == run_id).filter(self.entity_model.receiving_start >= start).filter(
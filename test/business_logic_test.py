@@ -0,0 +1,381 @@
+from businesslogic.resolution_cache import ResolutionCache, Resolution
+from businesslogic.image_garbage_collector import ImageGarbageCollector, get_image_stem
+from businesslogic.reassembly_buffer import ReassemblyBuffer, MessageKey
+from businesslogic.command_dispatcher import CommandDispatcher, Delivery
+from businesslogic.tumblebase_client import TumbleBaseClientRegistry
+from test.stub_tumblebase import StubTumbleBase
+from util.downsampling import lttb, series_from_chunks
+from util.image_store import ImageStore
+from util.thumbnails import ThumbnailGenerator, create_thumbnails, get_thumbnail_path, Image
+from model.data_transfer_objects import ByteData
+from model.enums import DType
+import numpy as np
+import unittest
+import tempfile
+import logging
+import base64
+import time
+import os
+
+
+class ResolutionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.resolution_cache = ResolutionCache(ttl=10, max_size=2, clock=lambda: self.now)
+        self.resolution = Resolution(tumbleweed_id=1, data_source_id=2, dtype=DType.Long, run_id=3)
+
+    def test_get_and_expire(self):
+        self.assertIsNone(self.resolution_cache.get("1234567890123456", "T1"))
+        self.resolution_cache.put("1234567890123456", "T1", self.resolution)
+        self.assertEqual(self.resolution_cache.get("1234567890123456", "T1"), self.resolution)
+        self.now = 10
+        self.assertIsNone(self.resolution_cache.get("1234567890123456", "T1"))
+        self.assertEqual(len(self.resolution_cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.resolution_cache.put("1234567890123456", "T1", self.resolution)
+        self.resolution_cache.put("1234567890123456", "T2", self.resolution)
+        self.resolution_cache.get("1234567890123456", "T1")
+        self.resolution_cache.put("1234567890123456", "T3", self.resolution)
+        self.assertIsNotNone(self.resolution_cache.get("1234567890123456", "T1"))
+        self.assertIsNone(self.resolution_cache.get("1234567890123456", "T2"))
+        self.assertIsNotNone(self.resolution_cache.get("1234567890123456", "T3"))
+
+    def test_invalidate(self):
+        other_resolution = Resolution(tumbleweed_id=4, data_source_id=5, dtype=DType.Float, run_id=6)
+        self.resolution_cache.put("1234567890123456", "T1", self.resolution)
+        self.resolution_cache.put("1234567890123457", "T1", other_resolution)
+        self.resolution_cache.invalidate_run(3)
+        self.assertIsNone(self.resolution_cache.get("1234567890123456", "T1"))
+        self.assertEqual(self.resolution_cache.get("1234567890123457", "T1"), other_resolution)
+        self.resolution_cache.invalidate_dataSource(5)
+        self.assertIsNone(self.resolution_cache.get("1234567890123457", "T1"))
+        self.resolution_cache.put("1234567890123456", "T1", self.resolution)
+        self.resolution_cache.invalidate_tumbleweed(1)
+        self.assertIsNone(self.resolution_cache.get("1234567890123456", "T1"))
+
+    def test_put_after_invalidation_is_ignored(self):
+        generation = self.resolution_cache.generation
+        self.resolution_cache.invalidate_tumbleweed(1)
+        self.resolution_cache.put("1234567890123456", "T1", self.resolution, generation=generation)
+        self.assertIsNone(self.resolution_cache.get("1234567890123456", "T1"))
+
+
+class ReassemblyBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.reassembly_buffer = ReassemblyBuffer(max_messages=2, max_bytes=10, timeout=10, clock=lambda: self.now)
+        self.resolution = Resolution(tumbleweed_id=1, data_source_id=2, dtype=DType.Byte, run_id=3)
+
+    def add(self, message_id, index, data, packets=3):
+        key = MessageKey("1234567890123456", "123456789123457", message_id)
+        dataPoint = ByteData(data=data, packets=packets, message_id=message_id)
+        return self.reassembly_buffer.add(key, "T1", self.resolution, index, dataPoint)
+
+    def test_reassemble(self):
+        self.assertIsNone(self.add(1, 2, b"c"))
+        self.assertIsNone(self.add(1, 0, b"a"))
+        self.assertIsNone(self.add(1, 0, b"a"))
+        message = self.add(1, 1, b"b")
+        self.assertEqual(message.assemble(), b"abc")
+        self.assertEqual(message.packets_received, 3)
+        self.assertEqual(self.reassembly_buffer.get_state()["messages"], 0)
+        self.assertEqual(self.reassembly_buffer.get_state()["bytes"], 0)
+
+    def test_expire(self):
+        self.add(1, 0, b"a")
+        self.now = 5
+        self.add(2, 0, b"b")
+        self.now = 10
+        self.assertEqual(self.reassembly_buffer.pop_expired()[0].key.message_id, 1)
+        state = self.reassembly_buffer.get_state()
+        self.assertEqual(state["messages"], 1)
+        self.assertEqual(state["in_flight"][0]["age"], 5)
+        self.now = 15
+        message = self.reassembly_buffer.pop_expired()[0]
+        self.assertFalse(message.complete)
+        self.assertEqual(message.assemble(), b"b")
+
+    def test_evict(self):
+        self.add(1, 0, b"a")
+        self.add(2, 0, b"b")
+        self.add(3, 0, b"c")
+        self.assertEqual([message.key.message_id for message in self.reassembly_buffer.pop_expired()], [1])
+        self.add(4, 0, b"0123456789")
+        self.assertEqual([message.key.message_id for message in self.reassembly_buffer.pop_expired()], [2, 3])
+        self.assertEqual(self.reassembly_buffer.get_state()["bytes"], 10)
+
+    def test_restore(self):
+        self.add(1, 0, b"a", packets=2)
+        message = self.add(1, 1, b"b", packets=2)
+        self.assertTrue(message.complete)
+        self.add(1, 0, b"a", packets=2)
+        self.reassembly_buffer.restore(message)
+        state = self.reassembly_buffer.get_state()
+        self.assertEqual(state["messages"], 1)
+        self.assertEqual(state["bytes"], 2)
+        self.assertEqual(state["in_flight"][0]["packets_received"], 2)
+        self.assertEqual(self.add(1, 1, b"b", packets=2).assemble(), b"ab")
+        self.assertEqual(self.reassembly_buffer.get_state()["bytes"], 0)
+
+
+class CommandDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.transmitted = list()
+        self.sleeps = list()
+        self.addresses = dict()
+        self.tumblebase_clients = TumbleBaseClientRegistry(self.addresses.get, pool_size=2)
+        self.command_dispatcher = CommandDispatcher(self.tumblebase_clients, self.transmitted.append, max_workers=4,
+                                                    max_in_flight=2, timeout=5, max_attempts=3, backoff=0.5,
+                                                    max_backoff=0.75, logger=logging.getLogger(__name__),
+                                                    sleep=self.sleeps.append)
+
+    def tearDown(self):
+        self.command_dispatcher.shutdown()
+
+    def dispatch(self, stub_tumblebase, command_id):
+        self.addresses[1] = (stub_tumblebase.host, stub_tumblebase.port, "send-command")
+        self.command_dispatcher.dispatch(Delivery(command_id, 1, {"address": "1234567890123456", "data": "ping"}))
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def wait_for_deliveries(self, count):
+        self.wait_for(lambda: self.command_dispatcher.get_state()["transmitted"] +
+                      self.command_dispatcher.get_state()["failed"] == count)
+
+    def test_deliver(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.dispatch(stub_tumblebase, 1)
+            self.wait_for_deliveries(1)
+        self.assertEqual(stub_tumblebase.commands, [{"address": "1234567890123456", "data": "ping"}])
+        self.assertEqual(self.transmitted, [1])
+        self.assertEqual(self.sleeps, [])
+
+    def test_retry_with_backoff(self):
+        with StubTumbleBase(status_codes=[503, 503]) as stub_tumblebase:
+            self.dispatch(stub_tumblebase, 1)
+            self.wait_for_deliveries(1)
+        self.assertEqual(len(stub_tumblebase.commands), 3)
+        self.assertEqual(self.transmitted, [1])
+        self.assertEqual(self.sleeps, [0.5, 0.75])
+
+    def test_rejected_command_is_not_retried(self):
+        with StubTumbleBase(status_codes=[400]) as stub_tumblebase:
+            self.dispatch(stub_tumblebase, 1)
+            self.wait_for_deliveries(1)
+        self.assertEqual(len(stub_tumblebase.commands), 1)
+        self.assertEqual(self.transmitted, [])
+        self.assertEqual(self.command_dispatcher.get_state()["failed"], 1)
+
+    def test_max_in_flight(self):
+        with StubTumbleBase() as stub_tumblebase:
+            stub_tumblebase.release.clear()
+            for command_id in range(1, 6):
+                self.dispatch(stub_tumblebase, command_id)
+            self.wait_for(lambda: stub_tumblebase.in_flight == 2)
+            state = self.command_dispatcher.get_state()
+            self.assertEqual(state["queued"], 3)
+            self.assertEqual(state["tumblebases"], [{"tumblebase_id": 1, "queued": 3, "in_flight": 2}])
+            stub_tumblebase.release.set()
+            self.wait_for_deliveries(5)
+        self.assertEqual(sorted(self.transmitted), [1, 2, 3, 4, 5])
+        self.assertEqual(stub_tumblebase.max_in_flight, 2)
+
+    def test_moved_tumblebase(self):
+        with StubTumbleBase() as stub_tumblebase, StubTumbleBase() as moved_tumblebase:
+            self.dispatch(stub_tumblebase, 1)
+            self.wait_for_deliveries(1)
+            self.dispatch(moved_tumblebase, 2)
+            self.wait_for_deliveries(2)
+            self.tumblebase_clients.invalidate(1)
+            self.dispatch(moved_tumblebase, 3)
+            self.wait_for_deliveries(3)
+        self.assertEqual(len(stub_tumblebase.commands), 2)
+        self.assertEqual(len(moved_tumblebase.commands), 1)
+        self.assertEqual(self.transmitted, [1, 2, 3])
+
+    def test_unknown_tumblebase(self):
+        self.command_dispatcher.dispatch(Delivery(1, 2, {"address": "1234567890123456", "data": "ping"}))
+        self.wait_for_deliveries(1)
+        self.assertEqual(self.transmitted, [])
+        self.assertEqual(self.command_dispatcher.get_state()["failed"], 1)
+
+
+class TumbleBaseClientRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.addresses = {1: ("127.0.0.1", 8002, "send-command"), 2: ("127.0.0.1", 8002, "send-command")}
+        self.tumblebase_clients = TumbleBaseClientRegistry(self.addresses.get, pool_size=2)
+
+    def tearDown(self):
+        self.tumblebase_clients.close()
+
+    def test_client_is_reused(self):
+        client = self.tumblebase_clients.get(1)
+        self.assertIs(self.tumblebase_clients.get(1), client)
+        self.assertIsNot(self.tumblebase_clients.get(2), client)
+        self.assertEqual(client.command_url, "http://127.0.0.1:8002/send-command")
+        self.assertIsNone(self.tumblebase_clients.get(3))
+
+    def test_client_is_rebuilt(self):
+        client = self.tumblebase_clients.get(1)
+        self.addresses[1] = ("127.0.0.1", 8003, "send-command")
+        self.assertIs(self.tumblebase_clients.get(1), client)
+        self.tumblebase_clients.invalidate(1)
+        moved_client = self.tumblebase_clients.get(1)
+        self.assertIsNot(moved_client, client)
+        self.assertEqual(moved_client.command_url, "http://127.0.0.1:8003/send-command")
+
+    def test_address_read_before_invalidate_is_not_kept(self):
+        def get_address(tumblebase_id):
+            address = self.addresses[tumblebase_id]
+            if address[1] == 8002:
+                # the tumblebase moves while its old address is being looked up
+                self.addresses[tumblebase_id] = ("127.0.0.1", 8003, "send-command")
+                self.tumblebase_clients.invalidate(tumblebase_id)
+            return address
+
+        self.tumblebase_clients = TumbleBaseClientRegistry(get_address, pool_size=2)
+        self.assertEqual(self.tumblebase_clients.get(1).command_url, "http://127.0.0.1:8003/send-command")
+
+
+class DownsamplingTest(unittest.TestCase):
+    def test_short_series_is_kept(self):
+        x = np.arange(5, dtype=np.float64)
+        self.assertEqual(lttb(x, x, 10).tolist(), [0, 1, 2, 3, 4])
+
+    def test_extremes_are_selected(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[123] = 50
+        y[877] = -50
+        selected = lttb(x, y, 10).tolist()
+        self.assertEqual(len(selected), 10)
+        self.assertEqual(selected[0], 0)
+        self.assertEqual(selected[-1], 999)
+        self.assertIn(123, selected)
+        self.assertIn(877, selected)
+        self.assertEqual(selected, sorted(selected))
+
+    def test_series_from_chunks(self):
+        series = series_from_chunks(iter([[(1, 0.0, 2.5), (2, 1.0, 3.5)], [(3, 2.0, 4.5)]]))
+        self.assertEqual(series.shape, (3, 3))
+        self.assertEqual(series[:, 0].tolist(), [1, 2, 3])
+        self.assertEqual(series_from_chunks(iter([])).shape, (0, 3))
+
+
+class ImageStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.image_store = ImageStore(self.directory.name)
+        self.image = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_is_content_addressed_and_sharded(self):
+        path = self.image_store.put(self.image)
+        name = os.path.basename(path)
+        self.assertTrue(name.endswith(".png"))
+        self.assertEqual(os.path.dirname(path), os.path.join(self.directory.name, name[0:2], name[2:4]))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.image)
+
+    def test_identical_images_are_stored_once(self):
+        path = self.image_store.put(self.image)
+        self.assertEqual(self.image_store.put(self.image), path)
+        self.assertNotEqual(self.image_store.put(self.image + b"\x00"), path)
+        files = [name for _, _, names in os.walk(self.directory.name) for name in names]
+        self.assertEqual(len(files), 2)
+
+    def test_unknown_format(self):
+        self.assertTrue(self.image_store.put(b"no image").endswith(".raw"))
+
+
+class ImageGarbageCollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root_path = self.directory.name + "/"
+        self.image_store = ImageStore(self.root_path)
+        self.now = 1000000
+        self.image_garbage_collector = ImageGarbageCollector(self.root_path, ["thumb", "preview"], 60,
+                                                             logging.getLogger(__name__), clock=lambda: self.now)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_file(self, path, content=b"image"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        os.utime(path, (self.now - 3600, self.now - 3600))
+        return path
+
+    def test_get_image_stem(self):
+        self.assertEqual(get_image_stem("abcd.png", ["thumb"]), "abcd")
+        self.assertEqual(get_image_stem("abcd.thumb.jpg", ["thumb"]), "abcd")
+        self.assertEqual(get_image_stem("abcd.other.jpg", ["thumb"]), "abcd.other")
+        self.assertEqual(get_image_stem("abcd", ["thumb"]), "abcd")
+
+    def test_collect(self):
+        referenced = self.create_file(self.image_store.get_path("ab" * 32, "png"))
+        referenced_thumbnail = self.create_file(get_thumbnail_path(referenced, "thumb"))
+        orphan = self.create_file(self.image_store.get_path("ab" * 31 + "cd", "png"), b"orphan")
+        orphan_thumbnail = self.create_file(get_thumbnail_path(orphan, "preview"), b"thumbnail")
+        legacy = self.create_file(os.path.join(self.root_path, "legacy.png"))
+        young_orphan = self.create_file(self.image_store.get_path("ef" * 32, "raw"))
+        os.utime(young_orphan, (self.now, self.now))
+        referenced_stems = sorted(os.path.splitext(path)[0] for path in [referenced, legacy])
+
+        report = self.image_garbage_collector.collect(iter(referenced_stems), dry_run=True)
+        self.assertEqual((report.files, report.orphans, report.bytes), (6, 2, 15))
+        self.assertTrue(os.path.exists(orphan))
+
+        report = self.image_garbage_collector.collect(iter(referenced_stems))
+        self.assertEqual((report.orphans, report.bytes, report.dry_run), (2, 15, False))
+        for path in [referenced, referenced_thumbnail, legacy, young_orphan]:
+            self.assertTrue(os.path.exists(path))
+        for path in [orphan, orphan_thumbnail]:
+            self.assertFalse(os.path.exists(path))
+
+    def test_collect_without_references(self):
+        self.create_file(self.image_store.get_path("ab" * 32, "png"))
+        self.assertEqual(self.image_garbage_collector.collect(iter([])).orphans, 1)
+        self.assertEqual(self.image_garbage_collector.collect(iter([])).files, 0)
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class ThumbnailTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "image.png")
+        Image.new("RGBA", (1000, 500), (255, 0, 0, 128)).save(self.path)
+        self.sizes = {"thumb": 128, "preview": 512}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_create_thumbnails(self):
+        created = create_thumbnails(self.path, self.sizes)
+        self.assertEqual(sorted(created), sorted(get_thumbnail_path(self.path, size) for size in self.sizes))
+        with Image.open(get_thumbnail_path(self.path, "thumb")) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 64))
+            self.assertEqual(thumbnail.format, "JPEG")
+        with Image.open(get_thumbnail_path(self.path, "preview")) as preview:
+            self.assertEqual(preview.size, (512, 256))
+        self.assertEqual(create_thumbnails(self.path, self.sizes), [])
+
+    def test_generate_in_background(self):
+        thumbnail_generator = ThumbnailGenerator(self.sizes, 1, logging.getLogger("thumbnail-test"))
+        try:
+            self.assertEqual(len(thumbnail_generator.submit(self.path).result(timeout=30)), 2)
+            self.assertTrue(os.path.exists(thumbnail_generator.get_thumbnail(self.path, "preview")))
+        finally:
+            thumbnail_generator.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
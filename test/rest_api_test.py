@@ -1,17 +1,26 @@
 from database.database import DatabaseConnector, DatabaseTools
 from model.schema import TumbleweedSchema, TumbleBaseSchema, SubSystemSchema, DataSourceSchema, CommandTypeSchema, \
-    CommandSchema, RunSchema, LongDataSchema, IntDataSchema, FloatDataSchema, StringDataSchema, ByteDataSchema, \
-    ImageDataSchema
+    CommandSchema, CommandBroadcastSchema, RunSchema, LongDataSchema, IntDataSchema, FloatDataSchema, StringDataSchema, ByteDataSchema, \
+    ImageDataSchema, ImageMetadataSchema
 from test.templates import tumbleweed_json_template, tumblebase_json_template, subSystem_json_template, \
     dataSource_json_template, run_json_template, longdatapoint_json_template, intdatapoint_json_template, \
     floatdatapoint_json_template, stringdatapoint_json_template, bytedatapoint_json_template, \
     commandType_json_template, command_json_template, imagedatapoint_json_template
 from businesslogic.busineslogic import TumbleWebLogic
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from logger.logger import LoggerFactory
+from test.stub_tumblebase import StubTumbleBase
+from model.data_access_objects import Tumbleweed, Run, Command, DataSource, LongData, ByteData, tumbleweed_tumblebase, \
+    tumblebase_longdata, tumblebase_bytedata, tumblebase_command
+from repositories.cascade_delete import CascadeDelete
+from sqlalchemy import select, func
 from tumbleweb_api import app
 from util.mode import Mode
+from unittest import mock
 import unittest
+import base64
+import json
+import time
 
 
 class RestApiTest(unittest.TestCase):
@@ -32,6 +41,7 @@ class RestApiTest(unittest.TestCase):
         self.app.application.config["TUMBLEWEB_TUMBLEBASE_SCHEMA"] = TumbleBaseSchema()
         self.app.application.config["TUMBLEWEB_RUN_SCHEMA"] = RunSchema()
         self.app.application.config["TUMBLEWEB_COMMAND_SCHEMA"] = CommandSchema()
+        self.app.application.config["TUMBLEWEB_COMMANDBROADCAST_SCHEMA"] = CommandBroadcastSchema()
         self.app.application.config["TUMBLEWEB_COMMANDTYPE_SCHEMA"] = CommandTypeSchema()
         self.app.application.config["TUMBLEWEB_SUBSYSTEM_SCHEMA"] = SubSystemSchema()
         self.app.application.config["TUMBLEWEB_DATASOURCE_SCHEMA"] = DataSourceSchema()
@@ -41,6 +51,7 @@ class RestApiTest(unittest.TestCase):
         self.app.application.config["TUMBLEWEB_STRINGDATA_SCHEMA"] = StringDataSchema()
         self.app.application.config["TUMBLEWEB_BYTEDATA_SCHEMA"] = ByteDataSchema()
         self.app.application.config["TUMBLEWEB_IMAGEDATA_SCHEMA"] = ImageDataSchema()
+        self.app.application.config["TUMBLEWEB_IMAGEMETADATA_SCHEMA"] = ImageMetadataSchema()
 
         self.tumbleweed_json = tumbleweed_json_template.copy()
         self.tumblebase_json = tumblebase_json_template.copy()
@@ -109,14 +120,164 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.status, "400 BAD REQUEST")
 
     def test_send_command(self):
-        self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
-        self.app.post("/add-tumblebase", json=self.tumblebase_json)
-        self.app.post("/add-commandType", json=self.commandType_json)
-        self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post("/send-command/1/1/1", json=self.command_json)
-        self.assertEqual(response.status, "200 OK")
-        self.assertIsInstance(response.json, dict)
-        self.assertEqual(response.json["info"], 1)
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            response = self.app.post("/send-command/1/1/1", json=self.command_json)
+            self.assertEqual(response.status, "202 ACCEPTED")
+            self.assertIsInstance(response.json, dict)
+            self.assertEqual(response.json["info"], 1)
+            self.assertEqual(response.json["status"], "queued")
+            deadline = time.monotonic() + 5
+            while not self.app.get("/get-command/1").json["transmitted"]:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        self.assertEqual(stub_tumblebase.commands, [{"address": self.tumbleweed_json["address"],
+                                                     "data": self.commandType_json["type"]}])
+        response = self.app.get("/get-command-dispatch")
+        self.assertEqual(response.json["info"]["transmitted"], 1)
+        response = self.app.post("/send-command/1/2/1", json=self.command_json)
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        self.assertEqual(response.json["info"], "The TumbleBase with id 2 does not exist.")
+        response = self.app.get("/get-command/1")
+        self.assertEqual(response.json["run_id"], 1)
+        self.assertEqual(response.json["command_type_id"], 1)
+
+    def test_send_command_to_moved_tumblebase(self):
+        with StubTumbleBase() as stub_tumblebase, StubTumbleBase() as moved_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            for command_id in [1, 2]:
+                response = self.app.post("/send-command/1/1/1", json=self.command_json)
+                self.assertEqual(response.json["info"], command_id)
+                deadline = time.monotonic() + 5
+                while not self.app.get(f"/get-command/{command_id}").json["transmitted"]:
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.01)
+                self.app.patch("/update-tumblebase/1", json=dict(self.tumblebase_json, host=moved_tumblebase.host,
+                                                                 port=moved_tumblebase.port))
+        self.assertEqual(len(stub_tumblebase.commands), 1)
+        self.assertEqual(len(moved_tumblebase.commands), 1)
+
+    def test_send_commands(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumbleweed", json=dict(self.tumbleweed_json, address="1234567890123458"))
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            targets = [{"tumbleweed_id": 1, "tumblebase_id": 1}, {"tumbleweed_id": 2, "tumblebase_id": 1},
+                       {"tumbleweed_id": 1, "tumblebase_id": 2}, {"tumbleweed_id": 3, "tumblebase_id": 1}]
+            response = self.app.post("/send-commands/1", json={"args": "now", "targets": targets})
+            self.assertEqual(response.status, "200 OK")
+            self.assertEqual(response.json["info"][0], {"status": 202, "info": 1})
+            self.assertEqual(response.json["info"][1]["status"], 400)
+            self.assertEqual(response.json["info"][2]["info"], "The TumbleBase with id 2 does not exist.")
+            self.assertEqual(response.json["info"][3]["info"], "The Tumbleweed with id 3 does not exist.")
+            deadline = time.monotonic() + 5
+            while not self.app.get("/get-command/1").json["transmitted"]:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        self.assertEqual(stub_tumblebase.commands, [{"address": self.tumbleweed_json["address"],
+                                                     "data": f"{self.commandType_json['type']}+now"}])
+        response = self.app.get("/get-command/1")
+        self.assertEqual(response.json["run_id"], 1)
+        self.assertEqual(response.json["sender_base_id"], 1)
+        response = self.app.post("/send-commands/2", json={"args": None, "targets": targets})
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        response = self.app.post("/send-commands/1", json={"args": None, "targets": []})
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
+    def test_send_commands_to_newest_active_run(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            older_run = self.app.application.config["TUMBLEWEB_RUN_SCHEMA"].load(self.run_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            # the api refuses a second active run, but two concurrent requests can both pass its check
+            self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"].start_run(older_run, 1)
+            response = self.app.post("/send-commands/1", json={"args": None,
+                                                               "targets": [{"tumbleweed_id": 1, "tumblebase_id": 1}]})
+            self.assertEqual(response.json["info"], [{"status": 202, "info": 1}])
+            response = self.app.post("/send-command/1/1/1", json=self.command_json)
+            self.assertEqual(response.json["info"], 2)
+        for command_id in [1, 2]:
+            response = self.app.get(f"/get-command/{command_id}")
+            self.assertEqual(response.json["run_id"], 1)
+
+    def test_get_unanswered_command_counts(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            self.app.post("/send-command/1/1/1", json=self.command_json)
+            self.app.post("/send-command/1/1/1", json=self.command_json)
+        self.app.patch("/update-command/2", json=dict(self.command_json, response="ok"))
+        business_logic = self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]
+        self.assertEqual(business_logic.sweep_timed_out_commands(deadline=3600), 0)
+        self.assertEqual(business_logic.sweep_timed_out_commands(deadline=0), 1)
+        self.assertEqual(business_logic.sweep_timed_out_commands(deadline=0), 0)
+        response = self.app.get("/get-unanswered-command-counts")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json, [{"tumbleweed_id": 1, "run_id": 1, "unanswered": 1, "timed_out": 1}])
+        response = self.app.get("/get-command/1")
+        self.assertIsInstance(datetime.fromisoformat(response.json["timed_out_at"]), datetime)
+
+    def test_sweep_timed_out_commands_with_retry(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumbleweed", json=dict(self.tumbleweed_json, address="1234567890123458"))
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            self.app.post("/start-run/2", json=self.run_json)
+            self.app.post("/send-command/1/1/1", json=self.command_json)
+            self.app.post("/send-command/2/1/1", json=self.command_json)
+            self.app.post("/stop-run/2")
+            business_logic = self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]
+            deadline = time.monotonic() + 5
+            while business_logic.get_command_dispatch_state()["transmitted"] < 2:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            self.assertEqual(business_logic.sweep_timed_out_commands(deadline=0, retry=True), 2)
+            while business_logic.get_command_dispatch_state()["transmitted"] < 3:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+            state = business_logic.get_command_dispatch_state()
+        self.assertEqual(state["queued"] + state["in_flight"], 0)
+        addresses = [command["address"] for command in stub_tumblebase.commands]
+        self.assertEqual(sorted(addresses[:2]), [self.tumbleweed_json["address"], "1234567890123458"])
+        # only the command of the active run is sent again
+        self.assertEqual(addresses[2:], [self.tumbleweed_json["address"]])
+
+    def test_get_unanswered_command_counts_with_two_open_runs(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            older_run = self.app.application.config["TUMBLEWEB_RUN_SCHEMA"].load(self.run_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            # the api refuses a second active run, but two concurrent requests can both pass its check
+            self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"].start_run(older_run, 1)
+            self.app.post("/send-command/1/1/1", json=self.command_json)
+        self.database_connector.engine.execute(Command.__table__.insert(), {
+            "command_type_id": 1, "sender_base_id": 1, "tumbleweed_id": 1, "run_id": 2,
+            "created_at": datetime.now(timezone.utc), "transmitted": True})
+        response = self.app.get("/get-unanswered-command-counts")
+        self.assertEqual(response.json, [{"tumbleweed_id": 1, "run_id": 1, "unanswered": 1, "timed_out": 0}])
 
     def test_add_datapoint_long(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -190,6 +351,171 @@ class RestApiTest(unittest.TestCase):
         self.assertIsInstance(response.json, dict)
         self.assertEqual(response.json["info"], 1)
 
+    def test_add_packets(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "B"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        self.bytedatapoint_json["packets"] = 2
+        second_packet = dict(self.bytedatapoint_json, packet=1, data=base64.b64encode(b"packet 2").decode())
+        first_packet = dict(self.bytedatapoint_json, packet=0, data=base64.b64encode(b"packet 1, ").decode())
+        response = self.app.post(f"/add-packet/1234567890123456/123456789123457/T1", json=second_packet)
+        self.assertEqual(response.status, "202 ACCEPTED")
+        response = self.app.get("/get-packet-reassembly")
+        self.assertEqual(response.json["info"]["messages"], 1)
+        self.assertEqual(response.json["info"]["in_flight"][0]["packets_received"], 1)
+        self.assertIsNotNone(self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]._packet_expiry)
+        response = self.app.post(f"/add-packet/1234567890123456/123456789123457/T1", json=first_packet)
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["info"], 1)
+        response = self.app.get("/get-datapoint-by-dataSource-id-and-datapoint-id/1/1")
+        self.assertEqual(base64.b64decode(response.json["data"]), b"packet 1, packet 2")
+        self.assertEqual(response.json["packets_received"], 2)
+        response = self.app.get("/get-packet-reassembly")
+        self.assertEqual(response.json["info"]["messages"], 0)
+        response = self.app.post(f"/add-packet/1234567890123456/123456789123457/T1", json=dict(first_packet, packet=2))
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
+    def test_add_packets_insert_fails(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "B"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        self.bytedatapoint_json["packets"] = 2
+        first_packet = dict(self.bytedatapoint_json, packet=0, data=base64.b64encode(b"packet 1, ").decode())
+        second_packet = dict(self.bytedatapoint_json, packet=1, data=base64.b64encode(b"packet 2").decode())
+        response = self.app.post(f"/add-packet/1234567890123456/123456789123457/T1", json=first_packet)
+        byteData_repository = self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"].byteData_repository
+        with mock.patch.object(byteData_repository, "insert_datapoint", side_effect=RuntimeError("connection lost")):
+            response = self.app.post(f"/add-packet/1234567890123456/123456789123457/T1", json=second_packet)
+        self.assertEqual(response.status, "500 INTERNAL SERVER ERROR")
+        response = self.app.get("/get-packet-reassembly")
+        self.assertEqual(response.json["info"]["messages"], 1)
+        self.assertEqual(response.json["info"]["in_flight"][0]["packets_received"], 2)
+        response = self.app.post(f"/add-packet/1234567890123456/123456789123457/T1", json=second_packet)
+        self.assertEqual(response.status, "200 OK")
+        response = self.app.get("/get-datapoint-by-dataSource-id-and-datapoint-id/1/1")
+        self.assertEqual(base64.b64decode(response.json["data"]), b"packet 1, packet 2")
+        response = self.app.get("/get-packet-reassembly")
+        self.assertEqual(response.json["info"]["messages"], 0)
+
+    def test_add_datapoint_without_active_run(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        response = self.app.post("/start-run/1", json=self.run_json)
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T2", json=self.longdatapoint_json)
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["info"], 1)
+        response = self.app.get("/get-tumblebase-by-address/123456789123457")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["name"], "Default TumbleBase")
+
+    def test_add_datapoints(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "L"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        self.dataSource_json["dtype"] = "F"
+        self.dataSource_json["short_key"] = "T2"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        datapoints_json = [
+            dict(self.longdatapoint_json, short_key="T1", message_id=1),
+            dict(self.floatdatapoint_json, short_key="T2", message_id=2),
+            dict(self.longdatapoint_json, short_key="T3", message_id=3),
+            dict(self.longdatapoint_json, short_key="T1", message_id=4, data="no number")
+        ]
+        response = self.app.post("/add-datapoints/1234567890123456/123456789123457", json=datapoints_json)
+        self.assertEqual(response.status, "200 OK")
+        self.assertIsInstance(response.json["info"], list)
+        self.assertEqual(response.json["info"][0], {"status": 200, "info": 1})
+        self.assertEqual(response.json["info"][1], {"status": 200, "info": 1})
+        self.assertEqual(response.json["info"][2]["status"], 400)
+        self.assertEqual(response.json["info"][3]["status"], 400)
+        response = self.app.get("/get-datapoints-by-dataSource-and-run/1/1")
+        self.assertEqual(len(response.json), 1)
+        self.assertEqual(response.json[0]["data"], str(self.longdatapoint_json["data"]))
+        response = self.app.get("/get-datapoints-by-dataSource-and-run/2/1")
+        self.assertEqual(len(response.json), 1)
+        self.assertEqual(response.json[0]["data"], self.floatdatapoint_json["data"])
+        response = self.app.post("/add-datapoints/1234567890123456/123456789123457", json=datapoints_json[:2])
+        self.assertEqual(response.json["info"][0], {"status": 200, "info": 1})
+        self.assertEqual(response.json["info"][1], {"status": 200, "info": 1})
+        response = self.app.get("/get-datapoints-by-dataSource-and-run/1/1")
+        self.assertEqual(len(response.json), 1)
+        response = self.app.post("/add-datapoints/1234567890123456/123456789123457", json=self.longdatapoint_json)
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
+    def test_add_datapoint_twice(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "L"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
+        self.assertEqual(response.json["info"], 1)
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["info"], 1)
+        self.assertEqual(self.count_rows(LongData.__table__), 1)
+        self.assertEqual(self.count_rows(tumblebase_longdata), 1)
+
+    def test_add_datapoint_from_two_tumblebases(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "L"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, address="123456789123458"))
+        response = self.app.post("/start-run/1", json=self.run_json)
+        for tumblebase_address in ["123456789123457", "123456789123458"]:
+            response = self.app.post(f"/add-datapoint/1234567890123456/{tumblebase_address}/T1",
+                                     json=self.longdatapoint_json)
+            self.assertEqual(response.json["info"], 1)
+        self.assertEqual(self.count_rows(LongData.__table__), 1)
+        links = self.database_connector.engine.execute(
+            select([tumblebase_longdata.c.tumblebase_id, tumblebase_longdata.c.longdata_id])).fetchall()
+        self.assertEqual(sorted(tuple(link) for link in links), [(1, 1), (2, 1)])
+
+    def test_migrate_database_merges_duplicate_datapoints(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "L"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, address="123456789123458"))
+        response = self.app.post("/start-run/1", json=self.run_json)
+        engine = self.database_connector.engine
+        # a database from before the unique index, in which a datapoint was stored once per tumblebase
+        engine.execute("DROP INDEX ix_longdata_data_source_id_run_id_message_id")
+        datapoint = {"data_source_id": 1, "run_id": 1, "receiving_start": datetime.now(timezone.utc), "data": 5,
+                     "packets": 1, "packets_received": 1}
+        engine.execute(LongData.__table__.insert(), [dict(datapoint, message_id=1), dict(datapoint, message_id=1),
+                                                     dict(datapoint, message_id=2)])
+        engine.execute(tumblebase_longdata.insert(), [{"tumblebase_id": 1, "longdata_id": 1},
+                                                      {"tumblebase_id": 2, "longdata_id": 2},
+                                                      {"tumblebase_id": 1, "longdata_id": 3}])
+        self.database_tools.migrate_database()
+        ids = engine.execute(select([LongData.__table__.c.id]).order_by(LongData.__table__.c.id)).fetchall()
+        self.assertEqual([row[0] for row in ids], [1, 3])
+        links = engine.execute(
+            select([tumblebase_longdata.c.tumblebase_id, tumblebase_longdata.c.longdata_id])).fetchall()
+        self.assertEqual(sorted(tuple(link) for link in links), [(1, 1), (1, 3), (2, 1)])
+        index_definition = engine.execute("SELECT indexdef FROM pg_indexes "
+                                          "WHERE indexname = 'ix_longdata_data_source_id_run_id_message_id'").scalar()
+        self.assertIn("UNIQUE", index_definition)
+
     def test_get_tumbleweed(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
         response = self.app.get(f"/get-tumbleweed/{response.json['info']}")
@@ -286,6 +612,9 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json["address"], "1234567890123456")
         self.assertEqual(response.json["name"], "New Name")
         self.assertIsInstance(datetime.fromisoformat(response.json["created_at"]), datetime)
+        response = self.app.patch("/update-tumbleweed/2", json=self.tumbleweed_json)
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        self.assertEqual(response.json["info"], "The Tumbleweed with ID 2 was not found.")
 
     def test_update_tumblebase(self):
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
@@ -629,6 +958,26 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json["data"], self.imagedatapoint_json["data"])
         self.assertEqual(response.json["message_id"], self.imagedatapoint_json["message_id"])
 
+    def test_update_imagedatapoint_keeps_image(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "M"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
+        response = self.app.patch(f"/update-datapoint/{self.dataSource_json['dtype']}/1",
+                                  json=dict(self.imagedatapoint_json, data=None, packets_received=3))
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["info"], 1)
+        response = self.app.get("/get-datapoint-by-dataSource-id-and-datapoint-id/1/1")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["packets_received"], 3)
+        self.assertEqual(response.json["data"], self.imagedatapoint_json["data"])
+        response = self.app.get("/get-image/1")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.data, base64.b64decode(self.imagedatapoint_json["data"]))
+
     def test_get_tumbleweed_by_address(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -745,11 +1094,9 @@ class RestApiTest(unittest.TestCase):
         response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
         response = self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
+        for message_id in range(5):
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=dict(self.floatdatapoint_json, message_id=message_id))
         response = self.app.post("/stop-run/1")
         response = self.app.post("/start-run/1", json=self.run_json)
         response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
@@ -763,7 +1110,7 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[0]["packets_received"], self.floatdatapoint_json["packets_received"])
         self.assertEqual(response.json[0]["packets"], self.floatdatapoint_json["packets"])
         self.assertEqual(response.json[0]["data"], self.floatdatapoint_json["data"])
-        self.assertEqual(response.json[0]["message_id"], self.floatdatapoint_json["message_id"])
+        self.assertEqual(sorted(datapoint["message_id"] for datapoint in response.json), list(range(5)))
 
     def test_get_intdatapoints_by_dataSource_and_run(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -772,11 +1119,9 @@ class RestApiTest(unittest.TestCase):
         response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
         response = self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.intdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.intdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.intdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.intdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.intdatapoint_json)
+        for message_id in range(5):
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=dict(self.intdatapoint_json, message_id=message_id))
         response = self.app.post("/stop-run/1")
         response = self.app.post("/start-run/1", json=self.run_json)
         response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.intdatapoint_json)
@@ -790,7 +1135,7 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[0]["packets_received"], self.intdatapoint_json["packets_received"])
         self.assertEqual(response.json[0]["packets"], self.intdatapoint_json["packets"])
         self.assertEqual(response.json[0]["data"], self.intdatapoint_json["data"])
-        self.assertEqual(response.json[0]["message_id"], self.intdatapoint_json["message_id"])
+        self.assertEqual(sorted(datapoint["message_id"] for datapoint in response.json), list(range(5)))
 
     def test_get_longdatapoints_by_dataSource_and_run(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -799,11 +1144,9 @@ class RestApiTest(unittest.TestCase):
         response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
         response = self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
+        for message_id in range(5):
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=dict(self.longdatapoint_json, message_id=message_id))
         response = self.app.post("/stop-run/1")
         response = self.app.post("/start-run/1", json=self.run_json)
         response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
@@ -817,7 +1160,7 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[0]["packets_received"], self.longdatapoint_json["packets_received"])
         self.assertEqual(response.json[0]["packets"], self.longdatapoint_json["packets"])
         self.assertEqual(response.json[0]["data"], str(self.longdatapoint_json["data"]))
-        self.assertEqual(response.json[0]["message_id"], self.longdatapoint_json["message_id"])
+        self.assertEqual(sorted(datapoint["message_id"] for datapoint in response.json), list(range(5)))
 
     def test_get_stringdatapoints_by_dataSource_and_run(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -826,11 +1169,9 @@ class RestApiTest(unittest.TestCase):
         response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
         response = self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.stringdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.stringdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.stringdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.stringdatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.stringdatapoint_json)
+        for message_id in range(5):
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=dict(self.stringdatapoint_json, message_id=message_id))
         response = self.app.post("/stop-run/1")
         response = self.app.post("/start-run/1", json=self.run_json)
         response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.stringdatapoint_json)
@@ -844,7 +1185,7 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[0]["packets_received"], self.stringdatapoint_json["packets_received"])
         self.assertEqual(response.json[0]["packets"], self.stringdatapoint_json["packets"])
         self.assertEqual(response.json[0]["data"], self.stringdatapoint_json["data"])
-        self.assertEqual(response.json[0]["message_id"], self.stringdatapoint_json["message_id"])
+        self.assertEqual(sorted(datapoint["message_id"] for datapoint in response.json), list(range(5)))
 
     def test_get_bytedatapoints_by_dataSource_and_run(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -853,11 +1194,9 @@ class RestApiTest(unittest.TestCase):
         response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
         response = self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.bytedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.bytedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.bytedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.bytedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.bytedatapoint_json)
+        for message_id in range(5):
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=dict(self.bytedatapoint_json, message_id=message_id))
         response = self.app.post("/stop-run/1")
         response = self.app.post("/start-run/1", json=self.run_json)
         response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.bytedatapoint_json)
@@ -871,7 +1210,7 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[0]["packets_received"], self.bytedatapoint_json["packets_received"])
         self.assertEqual(response.json[0]["packets"], self.bytedatapoint_json["packets"])
         self.assertEqual(response.json[0]["data"], self.bytedatapoint_json["data"])
-        self.assertEqual(response.json[0]["message_id"], self.bytedatapoint_json["message_id"])
+        self.assertEqual(sorted(datapoint["message_id"] for datapoint in response.json), list(range(5)))
 
     def test_get_imagedatapoints_by_dataSource_and_run(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -880,11 +1219,9 @@ class RestApiTest(unittest.TestCase):
         response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
         response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
         response = self.app.post("/start-run/1", json=self.run_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
-        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
+        for message_id in range(5):
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=dict(self.imagedatapoint_json, message_id=message_id))
         response = self.app.post("/stop-run/1")
         response = self.app.post("/start-run/1", json=self.run_json)
         response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
@@ -897,8 +1234,42 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[0]["receiving_done"], self.imagedatapoint_json["receiving_done"])
         self.assertEqual(response.json[0]["packets_received"], self.imagedatapoint_json["packets_received"])
         self.assertEqual(response.json[0]["packets"], self.imagedatapoint_json["packets"])
-        self.assertEqual(response.json[0]["data"], self.imagedatapoint_json["data"])
-        self.assertEqual(response.json[0]["message_id"], self.imagedatapoint_json["message_id"])
+        self.assertNotIn("data", response.json[0])
+        self.assertEqual(response.json[0]["format"], "jpg")
+        self.assertEqual(response.json[0]["size"], len(base64.b64decode(self.imagedatapoint_json["data"])))
+        self.assertEqual(sorted(datapoint["message_id"] for datapoint in response.json), list(range(5)))
+        response = self.app.get(response.json[0]["url"])
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.mimetype, "image/jpeg")
+        self.assertEqual(response.data, base64.b64decode(self.imagedatapoint_json["data"]))
+
+    def test_get_image(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "M"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.imagedatapoint_json)
+        image = base64.b64decode(self.imagedatapoint_json["data"])
+        response = self.app.get("/get-image/1")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.mimetype, "image/jpeg")
+        self.assertEqual(response.data, image)
+        etag = response.headers["ETag"]
+        response = self.app.get("/get-image/1", headers={"If-None-Match": etag})
+        self.assertEqual(response.status, "304 NOT MODIFIED")
+        response = self.app.get("/get-image/1", headers={"Range": "bytes=0-9"})
+        self.assertEqual(response.status, "206 PARTIAL CONTENT")
+        self.assertEqual(response.data, image[:10])
+        response = self.app.get("/get-image/1?size=thumb")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.mimetype, "image/jpeg")
+        self.assertLessEqual(len(response.data), len(image))
+        response = self.app.get("/get-image/1?size=huge")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        response = self.app.get("/get-image/2")
+        self.assertEqual(response.status, "400 BAD REQUEST")
 
     def test_get_datapoints_by_datasource_and_run_interval(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -962,6 +1333,61 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[1]["data"], self.floatdatapoint_json["data"])
         self.assertEqual(response.json[1]["message_id"], 5)
 
+    def test_get_aggregates(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "F"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        for message_id, data in enumerate([1.0, 3.0, 2.0, 10.0]):
+            seconds = 0 if message_id < 3 else 60
+            receiving_start = datetime(2019, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=seconds + message_id)
+            self.floatdatapoint_json["receiving_start"] = receiving_start.isoformat()
+            self.floatdatapoint_json["data"] = data
+            self.floatdatapoint_json["message_id"] = message_id
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
+        response = self.app.get(f"/get-aggregates/1/1?bucket=1m")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(len(response.json), 2)
+        self.assertEqual(response.json[0]["min"], 1.0)
+        self.assertEqual(response.json[0]["max"], 3.0)
+        self.assertEqual(response.json[0]["avg"], 2.0)
+        self.assertEqual(response.json[0]["count"], 3)
+        self.assertEqual(response.json[0]["last"], 2.0)
+        self.assertEqual(response.json[1]["count"], 1)
+        self.assertEqual(response.json[1]["last"], 10.0)
+        response = self.app.get(f"/get-aggregates/1/1?bucket=1h&fn=count")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(len(response.json), 1)
+        self.assertEqual(response.json[0]["count"], 4)
+        self.assertNotIn("min", response.json[0])
+        response = self.app.get(f"/get-aggregates/1/1?bucket=1h&fn=median")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        response = self.app.get(f"/get-aggregates/1/1?bucket=soon")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
+    def test_get_datapoints_by_datasource_and_run_interval_downsampled(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "F"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        for message_id in range(10):
+            self.floatdatapoint_json["receiving_start"] = datetime(2019, 1, 1, 0, 0, message_id, tzinfo=timezone.utc).isoformat()
+            self.floatdatapoint_json["data"] = 100.0 if message_id == 4 else 1.0
+            self.floatdatapoint_json["message_id"] = message_id
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.floatdatapoint_json)
+        response = self.app.get(f"/get-datapoints-by-dataSource-and-run-interval/1/1/null/null?max_points=3")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual([datapoint["message_id"] for datapoint in response.json], [0, 4, 9])
+        response = self.app.get(f"/get-datapoints-by-dataSource-and-run-interval/1/1/null/null?max_points=100")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(len(response.json), 10)
+        response = self.app.get(f"/get-datapoints-by-dataSource-and-run-interval/1/1/null/null?max_points=2")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
     def test_get_imagedatapoint_by_datasource_id_and_datapoint_id(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
         response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
@@ -1067,6 +1493,33 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json["name"], self.run_json["name"])
         self.assertEqual(response.json["description"], self.run_json["description"])
 
+    def test_get_active_run_with_newer_ended_run(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        business_logic = self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]
+        older_run = self.app.application.config["TUMBLEWEB_RUN_SCHEMA"].load(self.run_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        response = self.app.post("/stop-run/1")
+        # the api refuses a second active run, but two concurrent requests can both pass its check
+        business_logic.start_run(older_run, 1)
+        response = self.app.get("/get-active-run/1")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.json["id"], 2)
+        active_runs = business_logic.get_active_runs_by_tumbleweed_address(self.tumbleweed_json["address"])
+        self.assertEqual([active_run.id for active_run in active_runs], [2])
+        response = self.app.post("/start-run/1", json=self.run_json)
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        response = self.app.post("/stop-run/1")
+        self.assertEqual(response.json["info"], 2)
+        response = self.app.get("/get-active-run/1")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+        self.assertEqual(business_logic.get_active_runs_by_tumbleweed_address(self.tumbleweed_json["address"]), [])
+
+    def test_active_run_index_is_partial(self):
+        index_definition = self.database_connector.engine.execute(
+            "SELECT indexdef FROM pg_indexes WHERE indexname = 'ix_run_active_tumbleweed_id'").scalar()
+        self.assertIn("(tumbleweed_id)", index_definition)
+        self.assertIn("WHERE (ended_at IS NULL)", index_definition)
+
     def test_get_tumbleweeds(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
         self.tumbleweed_json2 = self.tumbleweed_json.copy()
@@ -1151,6 +1604,84 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.json[1]["description"], run_json2["description"])
         self.assertEqual(response.json[2]["name"], run_json3["name"])
         self.assertEqual(response.json[2]["description"], run_json3["description"])
+        response = self.app.get("/get-runs-by-tumbleweed-id/1?limit=2")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual([run["name"] for run in response.json["data"]], [self.run_json["name"], run_json2["name"]])
+        self.assertIsNotNone(response.json["next"])
+        response = self.app.get(f"/get-runs-by-tumbleweed-id/1?limit=2&after={response.json['next']}")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual([run["name"] for run in response.json["data"]], [run_json3["name"]])
+        self.assertIsNone(response.json["next"])
+
+    def test_get_commands_by_tumbleweed_id_and_run_id_paginated(self):
+        with StubTumbleBase() as stub_tumblebase:
+            response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            response = self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                                  port=stub_tumblebase.port))
+            response = self.app.post("/add-commandType", json=self.commandType_json)
+            response = self.app.post("/start-run/1", json=self.run_json)
+            for args in ["1", "2", "3"]:
+                response = self.app.post("/send-command/1/1/1", json=dict(self.command_json, args=args))
+        response = self.app.get("/get-commands-by-tumbleweed-id-and-run-id/1/1?limit=2")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual([command["args"] for command in response.json["data"]], ["1", "2"])
+        self.assertIsNotNone(response.json["next"])
+        response = self.app.get(f"/get-commands-by-tumbleweed-id-and-run-id/1/1?limit=2&after={response.json['next']}")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual([command["args"] for command in response.json["data"]], ["3"])
+        self.assertIsNone(response.json["next"])
+        response = self.app.get("/get-commands-by-tumbleweed-id-and-run-id/1/1?limit=0")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
+    def test_get_datapoints_by_dataSource_and_run_paginated(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        self.dataSource_json["dtype"] = "F"
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        for message_id in range(5):
+            receiving_start = datetime(2019, 1, 1, 0, 0, message_id // 2, tzinfo=timezone.utc)
+            self.floatdatapoint_json["receiving_start"] = receiving_start.isoformat()
+            self.floatdatapoint_json["message_id"] = message_id
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                                     json=self.floatdatapoint_json)
+        message_ids = list()
+        cursor = ""
+        while cursor is not None:
+            after = f"&after={cursor}" if cursor else ""
+            response = self.app.get(f"/get-datapoints-by-dataSource-and-run/1/1?limit=2{after}")
+            self.assertEqual(response.status, "200 OK")
+            self.assertLessEqual(len(response.json["data"]), 2)
+            message_ids += [datapoint["message_id"] for datapoint in response.json["data"]]
+            cursor = response.json["next"]
+        self.assertEqual(message_ids, [0, 1, 2, 3, 4])
+        response = self.app.get("/get-datapoints-by-dataSource-and-run/1/1?limit=2&after=invalid")
+        self.assertEqual(response.status, "400 BAD REQUEST")
+
+    def test_get_datapoints_by_dataSource_and_run_streamed(self):
+        response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+        response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
+        response = self.app.post("/add-dataSource/1", json=self.dataSource_json)
+        response = self.app.post("/add-tumblebase", json=self.tumblebase_json)
+        response = self.app.post("/start-run/1", json=self.run_json)
+        for message_id in range(3):
+            self.longdatapoint_json["receiving_start"] = datetime(2019, 1, 1, 0, 0, message_id, tzinfo=timezone.utc).isoformat()
+            self.longdatapoint_json["receiving_done"] = datetime(2019, 1, 1, 0, 0, message_id, tzinfo=timezone.utc).isoformat()
+            self.longdatapoint_json["message_id"] = message_id
+            response = self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1", json=self.longdatapoint_json)
+        response = self.app.get("/get-datapoints-by-dataSource-and-run/1/1", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["message_id"] for line in lines], [0, 1, 2])
+        self.assertEqual(json.loads(lines[0])["data"], str(self.longdatapoint_json["data"]))
+        response = self.app.get("/get-datapoints-by-dataSource-and-run/1/1?stream=true")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual([datapoint["message_id"] for datapoint in json.loads(response.get_data(as_text=True))], [0, 1, 2])
+        response = self.app.get(f"/get-datapoints-by-dataSource-and-run-interval/1/1/null/null?stream=true")
+        self.assertEqual(response.status, "200 OK")
+        self.assertEqual(len(json.loads(response.get_data(as_text=True))), 3)
 
     def test_delete_dataSource(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
@@ -1247,6 +1778,85 @@ class RestApiTest(unittest.TestCase):
         self.assertEqual(response.status, "200 OK")
         self.assertIsInstance(response.json, dict)
 
+    def add_run_with_datapoints_and_commands(self):
+        with StubTumbleBase() as stub_tumblebase:
+            self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
+            self.app.post("/add-subSystem/1", json=self.subSystem_json)
+            self.dataSource_json["dtype"] = "B"
+            self.app.post("/add-dataSource/1", json=self.dataSource_json)
+            self.app.post("/add-tumblebase", json=dict(self.tumblebase_json, host=stub_tumblebase.host,
+                                                       port=stub_tumblebase.port))
+            self.app.post("/add-commandType", json=self.commandType_json)
+            self.app.post("/start-run/1", json=self.run_json)
+            for message_id in range(3):
+                self.app.post(f"/add-datapoint/1234567890123456/123456789123457/T1",
+                              json=dict(self.bytedatapoint_json, message_id=message_id))
+                self.app.post("/send-command/1/1/1", json=self.command_json)
+            deadline = time.monotonic() + 5
+            while len(stub_tumblebase.commands) < 3:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        self.app.post("/stop-run/1")
+        engine = self.database_connector.engine
+        engine.execute(tumblebase_command.insert(), [{"tumblebase_id": 1, "command_id": command_id}
+                                                     for command_id in range(1, 4)])
+        engine.execute(tumbleweed_tumblebase.insert(), {"tumbleweed_id": 1, "tumblebase_id": 1})
+
+    def count_rows(self, table):
+        return self.database_connector.engine.execute(select([func.count()]).select_from(table)).scalar()
+
+    def test_delete_run_in_chunks(self):
+        self.add_run_with_datapoints_and_commands()
+        self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]._delete_chunk_size = 2
+        response = self.app.delete("/delete-run/1")
+        self.assertEqual(response.status, "200 OK")
+        for table in [ByteData.__table__, tumblebase_bytedata, Command.__table__, tumblebase_command, Run.__table__]:
+            self.assertEqual(self.count_rows(table), 0, table.name)
+        self.assertEqual(self.count_rows(tumbleweed_tumblebase), 1)
+        response = self.app.get("/get-tumblebase/1")
+        self.assertEqual(response.status, "200 OK")
+
+    def test_delete_dataSource_in_chunks(self):
+        self.add_run_with_datapoints_and_commands()
+        self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]._delete_chunk_size = 2
+        response = self.app.delete("/delete-dataSource/1")
+        self.assertEqual(response.status, "200 OK")
+        for table in [ByteData.__table__, tumblebase_bytedata, DataSource.__table__]:
+            self.assertEqual(self.count_rows(table), 0, table.name)
+        self.assertEqual(self.count_rows(Command.__table__), 3)
+        self.assertEqual(self.count_rows(Run.__table__), 1)
+
+    def test_delete_tumbleweed_in_chunks(self):
+        self.add_run_with_datapoints_and_commands()
+        self.app.application.config["TUMBLEWEB_BUSINESS_LOGIC"]._delete_chunk_size = 2
+        self.app.delete("/delete-dataSource/1")
+        self.app.delete("/delete-subSystem/1")
+        response = self.app.delete("/delete-tumbleweed/1")
+        self.assertEqual(response.status, "200 OK")
+        for table in [Command.__table__, tumblebase_command, Run.__table__, tumbleweed_tumblebase,
+                      Tumbleweed.__table__]:
+            self.assertEqual(self.count_rows(table), 0, table.name)
+        response = self.app.get("/get-tumblebase/1")
+        self.assertEqual(response.status, "200 OK")
+
+    def test_cascade_delete_row_counts(self):
+        self.add_run_with_datapoints_and_commands()
+        for chunk_size in [None, 2]:
+            with self.subTest(chunk_size=chunk_size):
+                session = self.database_connector.session
+                try:
+                    deleted_rows = CascadeDelete(session, chunk_size).delete_run(1)
+                    session.rollback()
+                finally:
+                    session.close()
+                self.assertEqual({table: rows for table, rows in deleted_rows.items() if rows > 0},
+                                 {"bytedata": 3, "tumblebase_bytedata": 3, "command": 3, "tumblebase_command": 3,
+                                  "run": 1})
+        # the chunks are committed one by one, only the deletion of the run itself was rolled back
+        self.assertEqual(self.count_rows(ByteData.__table__), 0)
+        self.assertEqual(self.count_rows(Command.__table__), 0)
+        self.assertEqual(self.count_rows(Run.__table__), 1)
+
     def test_delete_tumblebase(self):
         response = self.app.post("/add-tumbleweed", json=self.tumbleweed_json)
         response = self.app.post("/add-subSystem/1", json=self.subSystem_json)
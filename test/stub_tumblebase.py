@@ -0,0 +1,65 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Event, Lock
+import json
+
+
+class StubTumbleBase:
+    """
+    A local tumblebase for tests. It records the commands posted to it and answers with the given status codes, with
+    200 once they are used up. While release is cleared, requests are held, so deliveries stay in flight.
+    """
+
+    def __init__(self, status_codes=()):
+        self.commands = list()
+        self.status_codes = list(status_codes)
+        self.release = Event()
+        self.release.set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, request):
+        command = json.loads(request.rfile.read(int(request.headers["Content-Length"])))
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.release.wait()
+        with self._lock:
+            self.in_flight -= 1
+            self.commands.append(command)
+            status_code = self.status_codes.pop(0) if len(self.status_codes) > 0 else 200
+        body = json.dumps({"info": status_code}).encode()
+        request.send_response(status_code)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
@@ -1,16 +1,19 @@
 from util.utils import internal_server_error_message, invalid_format_message, endpoint_not_found_message, \
-    method_not_allowed_message, could_not_verify_message, invalid_token_message, no_admin_message
+    method_not_allowed_message, could_not_verify_message, invalid_token_message, no_admin_message, parse_duration, \
+    get_config_parser
 from exception.custom_exceptions import TumbleWebException, InternalServerError
-from model.schema import TumbleweedSchema, TumbleBaseSchema, RunSchema, CommandSchema, CommandTypeSchema, DataSourceSchema, SubSystemSchema, LongDataSchema, IntDataSchema, FloatDataSchema, StringDataSchema, ByteDataSchema, ImageDataSchema
+from model.schema import TumbleweedSchema, TumbleBaseSchema, RunSchema, CommandSchema, CommandBroadcastSchema, CommandTypeSchema, DataSourceSchema, SubSystemSchema, LongDataSchema, IntDataSchema, FloatDataSchema, StringDataSchema, ByteDataSchema, ImageDataSchema, ImageMetadataSchema, AggregateSchema, LongAggregateSchema
 from businesslogic.busineslogic import TumbleWebLogic
-from flask import Flask, request, jsonify
+from util.pagination import encode_cursor, decode_cursor
+from flask import Flask, Response, request, jsonify, stream_with_context, send_file
 from logger.logger import LoggerFactory
 from marshmallow import ValidationError
 from functools import wraps
 from model.enums import DType
 from flask_cors import CORS
 from datetime import datetime, timezone
-import requests
+import mimetypes
+import json
 
 
 """
@@ -27,6 +30,7 @@ app.config["TUMBLEWEB_TUMBLEWEED_SCHEMA"] = TumbleweedSchema()
 app.config["TUMBLEWEB_TUMBLEBASE_SCHEMA"] = TumbleBaseSchema()
 app.config["TUMBLEWEB_RUN_SCHEMA"] = RunSchema()
 app.config["TUMBLEWEB_COMMAND_SCHEMA"] = CommandSchema()
+app.config["TUMBLEWEB_COMMANDBROADCAST_SCHEMA"] = CommandBroadcastSchema()
 app.config["TUMBLEWEB_COMMANDTYPE_SCHEMA"] = CommandTypeSchema()
 app.config["TUMBLEWEB_SUBSYSTEM_SCHEMA"] = SubSystemSchema()
 app.config["TUMBLEWEB_DATASOURCE_SCHEMA"] = DataSourceSchema()
@@ -36,6 +40,10 @@ app.config["TUMBLEWEB_FLOATDATA_SCHEMA"] = FloatDataSchema()
 app.config["TUMBLEWEB_STRINGDATA_SCHEMA"] = StringDataSchema()
 app.config["TUMBLEWEB_BYTEDATA_SCHEMA"] = ByteDataSchema()
 app.config["TUMBLEWEB_IMAGEDATA_SCHEMA"] = ImageDataSchema()
+app.config["TUMBLEWEB_IMAGEMETADATA_SCHEMA"] = ImageMetadataSchema()
+app.config["USE_X_SENDFILE"] = get_config_parser("environment.ini").getboolean("images", "x_sendfile", fallback=False)
+
+default_page_size = 1000
 
 
 @app.errorhandler(404)
@@ -66,6 +74,77 @@ def handle_exception(func):
             return jsonify({"info": internal_server_error_message}), 500
     return wrapper
 
+
+def get_datapoint_schemas():
+    return {
+        DType.Long: app.config["TUMBLEWEB_LONGDATA_SCHEMA"],
+        DType.Int: app.config["TUMBlEWEB_INTDATA_SCHEMA"],
+        DType.Float: app.config["TUMBLEWEB_FLOATDATA_SCHEMA"],
+        DType.String: app.config["TUMBLEWEB_STRINGDATA_SCHEMA"],
+        DType.Byte: app.config["TUMBLEWEB_BYTEDATA_SCHEMA"],
+        DType.Image: app.config["TUMBLEWEB_IMAGEDATA_SCHEMA"]
+    }
+
+
+def get_datapoint_list_schemas():
+    """
+    Like get_datapoint_schemas, but with the schemas used to list datapoints. Images are listed without their image.
+    """
+    schemas = get_datapoint_schemas()
+    schemas[DType.Image] = app.config["TUMBLEWEB_IMAGEMETADATA_SCHEMA"]
+    return schemas
+
+
+def get_page_parameters(*cursor_types):
+    """
+    Read the keyset pagination parameters limit and after of the request. Without both of them the request is not
+    paginated and (None, None) is returned.
+    :param cursor_types: The types of the values encoded in the after cursor.
+    :return: The page size and the decoded cursor or None for the first page.
+    """
+    limit = request.args.get("limit")
+    after = request.args.get("after")
+    if limit is None and after is None:
+        return None, None
+    try:
+        limit = int(limit) if limit is not None else default_page_size
+        after = decode_cursor(after, *cursor_types) if after is not None else None
+    except ValueError:
+        raise TumbleWebException(invalid_format_message)
+    if limit < 1:
+        raise TumbleWebException(invalid_format_message)
+    return limit, after
+
+
+def get_stream_mimetype():
+    """
+    Decide whether a list of datapoints should be streamed. Clients which accept application/x-ndjson get one json
+    document per line, clients which ask for stream=true get a json array written element by element.
+    :return: The mimetype of the streamed response or None if the response should not be streamed.
+    """
+    if request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson":
+        return "application/x-ndjson"
+    if request.args.get("stream") == "true":
+        return "application/json"
+    return None
+
+
+def stream_datapoints(datapoints, schema, mimetype):
+    """
+    Serialize the datapoints one by one while they are generated and send them in a chunked response.
+    """
+    def generate():
+        if mimetype == "application/x-ndjson":
+            for datapoint in datapoints:
+                yield json.dumps(schema.dump(datapoint)) + "\n"
+        else:
+            separator = "["
+            for datapoint in datapoints:
+                yield separator + json.dumps(schema.dump(datapoint))
+                separator = ","
+            yield "[]" if separator == "[" else "]"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
 #
 #   Routes to add resources
 #
@@ -154,13 +233,12 @@ def start_run(tumbleweed_id):
     tumbleweed = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed(tumbleweed_id)
     if tumbleweed is None:
         return jsonify({"info": f"The Tumbleweed with id {tumbleweed_id} does not exist."}), 400
-    is_running = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_active_run(tumbleweed_id)
-    if is_running is not None:
-        return jsonify({"info": f"Tumbleweed {tumbleweed_id} is already active"}), 400
-    tumbleweeds_same_address = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed_by_address(tumbleweed.address)
-    for tumbleweed_same_address in tumbleweeds_same_address:
-        if app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_active_run(tumbleweed_same_address.id) is not None:
-            return jsonify({"info": f"A tumbleweed with the same address and id {tumbleweed_same_address.id} is already active"})
+    active_runs = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_active_runs_by_tumbleweed_address(tumbleweed.address)
+    for active_run in active_runs:
+        if active_run.tumbleweed_id == tumbleweed_id:
+            return jsonify({"info": f"Tumbleweed {tumbleweed_id} is already active"}), 400
+    if len(active_runs) > 0:
+        return jsonify({"info": f"A tumbleweed with the same address and id {active_runs[0].tumbleweed_id} is already active"})
     run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].start_run(run_to_insert, tumbleweed_id)
     if run_id is None:
         return jsonify({"info": f"The Run cannot be added."}), 400
@@ -174,13 +252,9 @@ def stop_run(tumbleweed_id):
     tumbleweed = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed(tumbleweed_id)
     if tumbleweed is None:
         return jsonify({"info": f"The Tumbleweed with id {tumbleweed_id} does not exist."}), 400
-    is_running = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_active_run(tumbleweed_id)
-    if is_running is None:
-        return jsonify({"info": f"Tumbleweed {tumbleweed_id} is not active"}), 400
-    is_running.ended_at = datetime.utcnow()
-    run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_run(is_running.id, is_running)
+    run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].stop_run(tumbleweed_id)
     if run_id is None:
-        return jsonify({"info": f"The Run cannot be stopped."}), 400
+        return jsonify({"info": f"Tumbleweed {tumbleweed_id} is not active"}), 400
     else:
         return jsonify({"info": run_id})
 
@@ -190,137 +264,76 @@ def stop_run(tumbleweed_id):
 def send_command(tumbleweed_id, tumblebase_id, commandType_id):
     command_json = request.get_json()
     command_to_insert = app.config["TUMBLEWEB_COMMAND_SCHEMA"].load(command_json)
-    tumbleweed = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed(tumbleweed_id)
-    if tumbleweed is None:
-        return jsonify({"info": f"The Tumbleweed with id {tumbleweed_id} does not exist."}), 400
-    if tumbleweed.address is None:
-        return jsonify({"info": f"The Tumbleweed with id {tumbleweed_id} has no address configured."}), 400
-    active_run = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_active_run(tumbleweed_id)
-    if active_run is None:
-        return jsonify({"info": f"The Tumbleweed {tumbleweed_id} is currently not active"}), 400
-    tumblebase = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumblebase(tumblebase_id)
-    if tumblebase is None:
-        return jsonify({"info": f"The TumbleBase with id {tumblebase_id} does not exist."}), 400
-    commandType = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_commandType(commandType_id)
-    if commandType is None:
-        return jsonify({"info": f"The CommandType with id {commandType_id} does not exist."}), 400
-    command_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_command(command_to_insert)
-    tumbleweed_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_command_to_tumbleweed(command_id, tumbleweed_id)
-    tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_command_to_tumblebase(command_id, tumblebase_id)
-    commandType_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_command_to_commandType(command_id, commandType_id)
-    active_run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_command_to_run(command_id, active_run.id)
-    data = commandType.type
-    if command_to_insert.args is not None:
-        data += f"+{command_to_insert.args}"
-    json_request = {
-        "address": tumbleweed.address,
-        "data": f"{data}"
-    }
-    response = requests.post(f"http://{tumblebase.host}:{tumblebase.port}/{tumblebase.command_route}", json=json_request)
-    if response.status_code == 200:
-        command = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_command(command_id)
-        command.transmitted = True
-        command_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_command(command)
-        return jsonify({"info": command_id})
-    else:
-        return jsonify({"info": f"Unable to send command {command_id} from tumblebase {tumblebase_id} to tumbleweed"
-        f" {tumbleweed_id}: {(response.json())['info']}"})
+    command_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].send_command(tumbleweed_id, tumblebase_id, commandType_id,
+                                                                     command_to_insert)
+    return jsonify({"info": command_id, "status": "queued"}), 202
+
+
+@app.route("/send-commands/<int:commandType_id>", methods=["POST"])
+@handle_exception
+def send_commands(commandType_id):
+    broadcast = app.config["TUMBLEWEB_COMMANDBROADCAST_SCHEMA"].load(request.get_json())
+    results = app.config["TUMBLEWEB_BUSINESS_LOGIC"].broadcast_command(commandType_id, broadcast["command"],
+                                                                       broadcast["targets"])
+    return jsonify({"info": results})
+
+
+@app.route("/get-command-dispatch", methods=["GET"])
+@handle_exception
+def get_command_dispatch():
+    return jsonify({"info": app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_command_dispatch_state()})
 
 
 @app.route("/add-datapoint/<string:tumbleweed_address>/<string:tumblebase_address>/<string:short_key>", methods=["POST"])
 @handle_exception
 def add_datapoint(tumbleweed_address, tumblebase_address, short_key):
     data_json = request.get_json()
-    tumbleweeds = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed_by_address(tumbleweed_address)
-    tumbleweed = None
-    run_id = None
-    for tw in tumbleweeds:
-        active_run = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_active_run(tw.id)
-        if active_run is not None:
-            if tumbleweed is not None:
-                return jsonify({"info": f"More than one tumbleweed with ID {tumbleweed_address} is active"}), 400
-            tumbleweed = tw
-            run_id = active_run.id
-    if tumbleweed is None:
-        return jsonify({"info": f"No Tumbleweed with address {tumbleweed_address} is active."}), 400
-    dataSource = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_dataSource_by_tumbleweed_id_and_short_key(tumbleweed.id, short_key)
-    if dataSource is None:
-        return jsonify({"info": f"The DataSource with short key {short_key} does not exist for tumbleweed with address {tumbleweed_address}."}), 400
-    tumblebase = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumblebase_by_address(tumblebase_address)
-    if tumblebase is None:
-        tumblebase_json = {
-            "address": tumblebase_address,
-            "host": request.headers.environ["REMOTE_ADDR"],
-            "name": "Default TumbleBase",
-            "port": None,
-            "command_route": None
-        }
-        tumblebase_to_insert = app.config["TUMBLEWEB_TUMBLEBASE_SCHEMA"].load(tumblebase_json)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_tumblebase(tumblebase_to_insert)
-    else:
-        tumblebase_id = tumblebase.id
-    if dataSource.dtype == DType.Long:
-        data_to_insert = app.config["TUMBLEWEB_LONGDATA_SCHEMA"].load(data_json)
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_LongData(data_to_insert)
-        if datapoint_id is None:
-            return jsonify({"info": f"The Run cannot be added."}), 400
-        dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_LongData_to_dataSource(datapoint_id, dataSource.id)
-        run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_LongData_to_run(datapoint_id, run_id)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_LongData_to_tumblebase(datapoint_id, tumblebase_id)
-        return jsonify({"info": datapoint_id})
-    elif dataSource.dtype == DType.Int:
-        data_to_insert = app.config["TUMBlEWEB_INTDATA_SCHEMA"].load(data_json)
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_IntData(data_to_insert)
-        if datapoint_id is None:
-            return jsonify({"info": f"The Run cannot be added."}), 400
-        dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_IntData_to_dataSource(datapoint_id, dataSource.id)
-        run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_IntData_to_run(datapoint_id, run_id)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_IntData_to_tumblebase(datapoint_id, tumblebase_id)
-        return jsonify({"info": datapoint_id})
-    elif dataSource.dtype == DType.Float:
-        data_to_insert = app.config["TUMBLEWEB_FLOATDATA_SCHEMA"].load(data_json)
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_FloatData(data_to_insert)
-        if datapoint_id is None:
-            return jsonify({"info": f"The Run cannot be added."}), 400
-        dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_FloatData_to_dataSource(datapoint_id, dataSource.id)
-        run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_FloatData_to_run(datapoint_id, run_id)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_FloatData_to_tumblebase(datapoint_id, tumblebase_id)
-        return jsonify({"info": datapoint_id})
-    elif dataSource.dtype == DType.String:
-        data_to_insert = app.config["TUMBLEWEB_STRINGDATA_SCHEMA"].load(data_json)
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_StringData(data_to_insert)
-        if datapoint_id is None:
-            return jsonify({"info": f"The Run cannot be added."}), 400
-        dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_StringData_to_dataSource(datapoint_id, dataSource.id)
-        run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_StringData_to_run(datapoint_id, run_id)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_StringData_to_tumblebase(datapoint_id, tumblebase_id)
-        return jsonify({"info": datapoint_id})
-    elif dataSource.dtype == DType.Byte:
-        data_to_insert = app.config["TUMBLEWEB_BYTEDATA_SCHEMA"].load(data_json)
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_ByteData(data_to_insert)
-        if datapoint_id is None:
-            return jsonify({"info": f"The Run cannot be added."}), 400
-        dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_ByteData_to_dataSource(datapoint_id, dataSource.id)
-        run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_ByteData_to_run(datapoint_id, run_id)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_ByteData_to_tumblebase(datapoint_id, tumblebase_id)
-        return jsonify({"info": datapoint_id})
-    elif dataSource.dtype == DType.Image:
-        data_to_insert = app.config["TUMBLEWEB_IMAGEDATA_SCHEMA"].load(data_json)
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].save_ImageData(data_to_insert)
-        if datapoint_id is None:
-            return jsonify({"info": f"The Run cannot be added."}), 400
-        dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_ImageData_to_dataSource(datapoint_id, dataSource.id)
-        run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_ImageData_to_run(datapoint_id, run_id)
-        tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].add_ImageData_to_tumblebase(datapoint_id, tumblebase_id)
+    datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].ingest_datapoint(
+        tumbleweed_address, tumblebase_address, short_key, data_json, get_datapoint_schemas(),
+        tumblebase_host=request.headers.environ["REMOTE_ADDR"])
+    if datapoint_id is None:
+        return jsonify({"info": f"The datapoint cannot be added."}), 400
+    else:
         return jsonify({"info": datapoint_id})
+
+
+@app.route("/add-datapoints/<string:tumbleweed_address>/<string:tumblebase_address>", methods=["POST"])
+@handle_exception
+def add_datapoints(tumbleweed_address, tumblebase_address):
+    data_json = request.get_json()
+    if not isinstance(data_json, list):
+        return jsonify({"info": invalid_format_message}), 400
+    results = app.config["TUMBLEWEB_BUSINESS_LOGIC"].ingest_datapoints(
+        tumbleweed_address, tumblebase_address, data_json, get_datapoint_schemas(),
+        tumblebase_host=request.headers.environ["REMOTE_ADDR"])
+    return jsonify({"info": results})
+
+
+@app.route("/add-packet/<string:tumbleweed_address>/<string:tumblebase_address>/<string:short_key>", methods=["POST"])
+@handle_exception
+def add_packet(tumbleweed_address, tumblebase_address, short_key):
+    packet_json = request.get_json()
+    datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].ingest_packet(
+        tumbleweed_address, tumblebase_address, short_key, packet_json, get_datapoint_schemas(),
+        tumblebase_host=request.headers.environ["REMOTE_ADDR"])
+    if datapoint_id is None:
+        return jsonify({"info": f"The packet {packet_json['packet']} of message {packet_json['message_id']} is "
+                                f"buffered."}), 202
     else:
-        return jsonify({"info": f"No data source found for tumbleweed {tumbleweed.id} with short key {short_key}."}), 400
+        return jsonify({"info": datapoint_id})
+
 
 #
 #   Routes to get resources
 #
 
 
+@app.route("/get-packet-reassembly", methods=["GET"])
+@handle_exception
+def get_packet_reassembly():
+    return jsonify({"info": app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_packet_reassembly_state()})
+
+
 @app.route("/get-tumbleweed/<int:tumbleweed_id>", methods=["GET"])
 @handle_exception
 def get_tumbleweed(tumbleweed_id):
@@ -412,6 +425,12 @@ def get_commands_by_commandType_id(commandType_id):
 @app.route("/get-commands-by-tumbleweed-id-and-run-id/<int:tumbleweed_id>/<int:run_id>", methods=["GET"])
 @handle_exception
 def get_commands_by_tumbleweed_id_and_run_id(tumbleweed_id, run_id):
+    limit, after = get_page_parameters(int)
+    if limit is not None:
+        found_commands, more = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_commands_page_by_tumbleweed_id_and_run_id(
+            tumbleweed_id, run_id, limit, after[0] if after is not None else None)
+        result = app.config["TUMBLEWEB_COMMAND_SCHEMA"].dump(found_commands, many=True)
+        return jsonify({"data": result, "next": encode_cursor(found_commands[-1].id) if more else None})
     found_commands = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_commands_by_tumbleweed_id_and_run_id(tumbleweed_id, run_id)
     if found_commands is None:
         return jsonify({"info": f"No commands for Tumbleweed with ID {tumbleweed_id} and run with id {run_id} exist."}), 400
@@ -431,6 +450,12 @@ def get_unanswered_commands_by_tumbleweed_id_and_run_id(tumbleweed_id, run_id):
         return jsonify(result)
 
 
+@app.route("/get-unanswered-command-counts", methods=["GET"])
+@handle_exception
+def get_unanswered_command_counts():
+    return jsonify(app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_unanswered_command_counts())
+
+
 @app.route("/get-tumbleweed-by-address/<string:tumbleweed_address>", methods=["GET"])
 @handle_exception
 def get_tumbleweed_by_address(tumbleweed_address):
@@ -484,6 +509,12 @@ def get_runs_by_tumbleweed_id(tumbleweed_id):
     tumbleweed = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed(tumbleweed_id)
     if tumbleweed is None:
         return jsonify({"info": f"No tumbleweed with id {tumbleweed_id} exists."}), 400
+    limit, after = get_page_parameters(int)
+    if limit is not None:
+        found_runs, more = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_runs_page_by_tumbleweed_id(
+            tumbleweed_id, limit, after[0] if after is not None else None)
+        result = app.config["TUMBLEWEB_RUN_SCHEMA"].dump(found_runs, many=True)
+        return jsonify({"data": result, "next": encode_cursor(found_runs[-1].id) if more else None})
     found_runs = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_runs_by_tumbleweed_id(tumbleweed_id)
     if found_runs is None:
         return jsonify({"info": f"No runs for tumbleweed with id {tumbleweed_id} exist."}), 400
@@ -573,6 +604,17 @@ def get_datapoints_by_dataSource_and_run(dataSource_id, run_id):
     run = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_run(run_id)
     if run is None:
         return jsonify({"info": f"No run with id {run_id} exists."}), 400
+    limit, after = get_page_parameters(datetime, int)
+    if limit is not None:
+        datapoints, more = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_datapoints_page_by_dataSource_and_run(
+            dataSource_id, run_id, limit, after)
+        result = get_datapoint_list_schemas()[dataSource.dtype].dump(datapoints, many=True)
+        cursor = encode_cursor(datapoints[-1].receiving_start, datapoints[-1].id) if more else None
+        return jsonify({"data": result, "next": cursor})
+    mimetype = get_stream_mimetype()
+    if mimetype is not None:
+        datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].stream_datapoints_by_dataSource_and_run(dataSource_id, run_id)
+        return stream_datapoints(datapoints, get_datapoint_list_schemas()[dataSource.dtype], mimetype)
     if dataSource.dtype == DType.Long:
         datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_longdatapoints_by_dataSource_and_run(dataSource_id, run_id)
         if datapoints is None:
@@ -607,7 +649,7 @@ def get_datapoints_by_dataSource_and_run(dataSource_id, run_id):
         datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_imagedatapoints_by_dataSource_and_run(dataSource_id, run_id)
         if datapoints is None:
             return jsonify({"info": f"No datapoints for data source {dataSource_id} and run {run_id} exist."}), 400
-        result = app.config["TUMBLEWEB_IMAGEDATA_SCHEMA"].dump(datapoints, many=True)
+        result = app.config["TUMBLEWEB_IMAGEMETADATA_SCHEMA"].dump(datapoints, many=True)
         return jsonify(result)
     else:
         return jsonify({"info": f"Data source {dataSource_id} has an invalid dtype."}), 400
@@ -630,6 +672,19 @@ def get_datapoints_by_dataSource_and_run_interval(dataSource_id, run_id, start,
     run = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_run(run_id)
     if run is None:
         return jsonify({"info": f"No run with id {run_id} exists."}), 400
+    max_points = request.args.get("max_points")
+    if max_points is not None:
+        if not max_points.isdigit() or int(max_points) < 3:
+            return jsonify({"info": invalid_format_message}), 400
+        datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_datapoints_by_dataSource_and_run_interval_downsampled(
+            dataSource_id, run_id, start, end, int(max_points))
+        result = get_datapoint_list_schemas()[dataSource.dtype].dump(datapoints, many=True)
+        return jsonify(result)
+    mimetype = get_stream_mimetype()
+    if mimetype is not None:
+        datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].stream_datapoints_by_dataSource_and_run(
+            dataSource_id, run_id, start, end)
+        return stream_datapoints(datapoints, get_datapoint_list_schemas()[dataSource.dtype], mimetype)
     if dataSource.dtype == DType.Long:
         datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_longdatapoints_by_dataSource_and_run_interval(dataSource_id, run_id, start, end)
         if datapoints is None:
@@ -664,12 +719,63 @@ def get_datapoints_by_dataSource_and_run_interval(dataSource_id, run_id, start,
         datapoints = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_imagedatapoints_by_dataSource_and_run_interval(dataSource_id, run_id, start, end)
         if datapoints is None:
             return jsonify({"info": f"No datapoints for data source {dataSource_id} and run {run_id} exist."}), 400
-        result = app.config["TUMBLEWEB_IMAGEDATA_SCHEMA"].dump(datapoints, many=True)
+        result = app.config["TUMBLEWEB_IMAGEMETADATA_SCHEMA"].dump(datapoints, many=True)
         return jsonify(result)
     else:
         return jsonify({"info": f"Data source {dataSource_id} has an invalid dtype."}), 400
 
 
+@app.route("/get-aggregates/<int:dataSource_id>/<int:run_id>", methods=["GET"])
+@handle_exception
+def get_aggregates(dataSource_id, run_id):
+    """
+    Aggregate the datapoints of a numeric data source in time buckets. Query parameters: bucket (a duration like 10s,
+    default 10s), start and end (iso format, default the whole run) and fn (comma separated list out of min, max, avg,
+    count and last, default all of them).
+    """
+    try:
+        bucket = parse_duration(request.args.get("bucket", "10s"))
+        start = datetime.fromisoformat(request.args.get("start", "1970-01-01T00:00:00+00:00"))
+        end = request.args.get("end")
+        end = datetime.fromisoformat(end) if end is not None else datetime.now(timezone.utc)
+    except ValueError:
+        return jsonify({"info": invalid_format_message}), 400
+    functions = request.args.get("fn")
+    functions = functions.split(",") if functions is not None else None
+    dataSource = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_dataSource(dataSource_id)
+    if dataSource is None:
+        return jsonify({"info": f"No dataSource with id {dataSource_id} exists."}), 400
+    run = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_run(run_id)
+    if run is None:
+        return jsonify({"info": f"No run with id {run_id} exists."}), 400
+    result = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_aggregates_by_dataSource_and_run_interval(
+        dataSource_id, run_id, start, end, bucket, functions)
+    if result is None:
+        return jsonify({"info": f"No dataSource with id {dataSource_id} exists."}), 400
+    aggregates, functions = result
+    if dataSource.dtype == DType.Long:
+        schema = LongAggregateSchema(only=["bucket_start"] + functions, many=True)
+    else:
+        schema = AggregateSchema(only=["bucket_start"] + functions, many=True)
+    return jsonify(schema.dump(aggregates))
+
+
+@app.route("/get-image/<int:datapoint_id>", methods=["GET"])
+@handle_exception
+def get_image(datapoint_id):
+    """
+    Send the image file of a datapoint, or with size=thumb or size=preview one of its thumbnails. Range requests and
+    revalidation with If-None-Match and If-Modified-Since are supported. With USE_X_SENDFILE the file is sent by the
+    web server in front of the application.
+    """
+    image = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_image_path(datapoint_id, request.args.get("size"))
+    if image is None:
+        return jsonify({"info": f"No image for datapoint with id {datapoint_id} exists."}), 400
+    path, image_format = image
+    mimetype = mimetypes.types_map.get(f".{image_format}", "application/octet-stream")
+    return send_file(path, mimetype=mimetype, conditional=True, cache_timeout=0)
+
+
 @app.route("/get-tumbleweeds", methods=["GET"])
 @handle_exception
 def get_tumbleweeds():
@@ -711,11 +817,10 @@ def get_commandTypes():
 def update_tumbleweed(tumbleweed_id):
     tumbleweed_json = request.get_json()
     tumbleweed_to_update = app.config["TUMBLEWEB_TUMBLEWEED_SCHEMA"].load(tumbleweed_json)
-    tumbleweed = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumbleweed(tumbleweed_id)
-    if tumbleweed is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_tumbleweed(tumbleweed_id, tumbleweed_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The Tumbleweed with ID {tumbleweed_id} was not found."}), 400
-    tumbleweed_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_tumbleweed(tumbleweed_id, tumbleweed_to_update)
-    return jsonify({"info": tumbleweed_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-tumblebase/<int:tumblebase_id>", methods=["PATCH"])
@@ -723,11 +828,10 @@ def update_tumbleweed(tumbleweed_id):
 def update_tumblebase(tumblebase_id):
     tumblebase_json = request.get_json()
     tumblebase_to_update = app.config["TUMBLEWEB_TUMBLEBASE_SCHEMA"].load(tumblebase_json)
-    tumblebase = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_tumblebase(tumblebase_id)
-    if tumblebase is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_tumblebase(tumblebase_id, tumblebase_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The Tumblebase with ID {tumblebase_id} was not found."}), 400
-    tumblebase_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_tumblebase(tumblebase_id, tumblebase_to_update)
-    return jsonify({"info": tumblebase_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-subSystem/<int:subSystem_id>", methods=["PATCH"])
@@ -735,11 +839,10 @@ def update_tumblebase(tumblebase_id):
 def update_subSystem(subSystem_id):
     subSystem_json = request.get_json()
     subSystem_to_update = app.config["TUMBLEWEB_SUBSYSTEM_SCHEMA"].load(subSystem_json)
-    subSystem = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_subSystem(subSystem_id)
-    if subSystem is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_subSystem(subSystem_id, subSystem_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The SubSystem with ID {subSystem_id} was not found."}), 400
-    subSystem_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_subSystem(subSystem_id, subSystem_to_update)
-    return jsonify({"info": subSystem_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-dataSource/<int:dataSource_id>", methods=["PATCH"])
@@ -747,11 +850,10 @@ def update_subSystem(subSystem_id):
 def update_dataSource(dataSource_id):
     dataSource_json = request.get_json()
     dataSource_to_update = app.config["TUMBLEWEB_DATASOURCE_SCHEMA"].load(dataSource_json)
-    dataSource = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_dataSource(dataSource_id)
-    if dataSource is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_dataSource(dataSource_id, dataSource_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The Data Source with ID {dataSource_id} was not found."}), 400
-    dataSource_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_dataSource(dataSource_id, dataSource_to_update)
-    return jsonify({"info": dataSource_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-commandType/<int:commandType_id>", methods=["PATCH"])
@@ -759,11 +861,10 @@ def update_dataSource(dataSource_id):
 def update_commandType(commandType_id):
     commandType_json = request.get_json()
     commandType_to_update = app.config["TUMBLEWEB_COMMANDTYPE_SCHEMA"].load(commandType_json)
-    commandType = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_commandType(commandType_id)
-    if commandType is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_commandType(commandType_id, commandType_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The Command Type with ID {commandType_id} was not found."}), 400
-    commandType_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_commandType(commandType_id, commandType_to_update)
-    return jsonify({"info": commandType_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-run/<int:run_id>", methods=["PATCH"])
@@ -771,11 +872,10 @@ def update_commandType(commandType_id):
 def update_run(run_id):
     run_json = request.get_json()
     run_to_update = app.config["TUMBLEWEB_RUN_SCHEMA"].load(run_json)
-    run = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_run(run_id)
-    if run is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_run(run_id, run_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The run with ID {run_id} was not found."}), 400
-    run_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_run(run_id, run_to_update)
-    return jsonify({"info": run_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-command/<int:command_id>", methods=["PATCH"])
@@ -783,11 +883,10 @@ def update_run(run_id):
 def update_command(command_id):
     command_json = request.get_json()
     command_to_update = app.config["TUMBLEWEB_COMMAND_SCHEMA"].load(command_json)
-    command = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_command(command_id)
-    if command is None:
+    updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_command(command_id, command_to_update)
+    if updated_id is None:
         return jsonify({"info": f"The command with ID {command_id} was not found."}), 400
-    command_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_command(command_id, command_to_update)
-    return jsonify({"info": command_id})
+    return jsonify({"info": updated_id})
 
 
 @app.route("/update-datapoint/<string:dtype>/<int:datapoint_id>", methods=["PATCH"])
@@ -796,46 +895,40 @@ def update_datapoint(dtype, datapoint_id):
     datapoint_json = request.get_json()
     if dtype == DType.Long.value:
         datapoint_to_update = app.config["TUMBLEWEB_LONGDATA_SCHEMA"].load(datapoint_json)
-        datapoint = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_longdatapoint(datapoint_id)
-        if datapoint is None:
+        updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_longdatapoint(datapoint_id, datapoint_to_update)
+        if updated_id is None:
             return jsonify({"info": f"No long datapoint with ID {datapoint_id} was found."}), 400
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_longdatapoint(datapoint_id, datapoint_to_update)
-        return jsonify({"info": datapoint_id})
+        return jsonify({"info": updated_id})
     elif dtype == DType.Int.value:
         datapoint_to_update = app.config["TUMBlEWEB_INTDATA_SCHEMA"].load(datapoint_json)
-        datapoint = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_intdatapoint(datapoint_id)
-        if datapoint is None:
+        updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_intdatapoint(datapoint_id, datapoint_to_update)
+        if updated_id is None:
             return jsonify({"info": f"No int datapoint with ID {datapoint_id} was found."}), 400
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_intdatapoint(datapoint_id, datapoint_to_update)
-        return jsonify({"info": datapoint_id})
+        return jsonify({"info": updated_id})
     elif dtype == DType.Float.value:
         datapoint_to_update = app.config["TUMBLEWEB_FLOATDATA_SCHEMA"].load(datapoint_json)
-        datapoint = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_floatdatapoint(datapoint_id)
-        if datapoint is None:
+        updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_floatdatapoint(datapoint_id, datapoint_to_update)
+        if updated_id is None:
             return jsonify({"info": f"No float datapoint with ID {datapoint_id} was found."}), 400
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_floatdatapoint(datapoint_id, datapoint_to_update)
-        return jsonify({"info": datapoint_id})
+        return jsonify({"info": updated_id})
     elif dtype == DType.String.value:
         datapoint_to_update = app.config["TUMBLEWEB_STRINGDATA_SCHEMA"].load(datapoint_json)
-        datapoint = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_stringdatapoint(datapoint_id)
-        if datapoint is None:
+        updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_stringdatapoint(datapoint_id, datapoint_to_update)
+        if updated_id is None:
             return jsonify({"info": f"No string datapoint with ID {datapoint_id} was found."}), 400
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_stringdatapoint(datapoint_id, datapoint_to_update)
-        return jsonify({"info": datapoint_id})
+        return jsonify({"info": updated_id})
     elif dtype == DType.Byte.value:
         datapoint_to_update = app.config["TUMBLEWEB_BYTEDATA_SCHEMA"].load(datapoint_json)
-        datapoint = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_bytedatapoint(datapoint_id)
-        if datapoint is None:
+        updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_bytedatapoint(datapoint_id, datapoint_to_update)
+        if updated_id is None:
             return jsonify({"info": f"No byte datapoint with ID {datapoint_id} was found."}), 400
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_bytedatapoint(datapoint_id, datapoint_to_update)
-        return jsonify({"info": datapoint_id})
+        return jsonify({"info": updated_id})
     elif dtype == DType.Image.value:
         datapoint_to_update = app.config["TUMBLEWEB_IMAGEDATA_SCHEMA"].load(datapoint_json)
-        datapoint = app.config["TUMBLEWEB_BUSINESS_LOGIC"].get_imagedatapoint(datapoint_id)
-        if datapoint is None:
+        updated_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_imagedatapoint(datapoint_id, datapoint_to_update)
+        if updated_id is None:
             return jsonify({"info": f"No image datapoint with ID {datapoint_id} was found."}), 400
-        datapoint_id = app.config["TUMBLEWEB_BUSINESS_LOGIC"].update_imagedatapoint(datapoint_id, datapoint_to_update)
-        return jsonify({"info": datapoint_id})
+        return jsonify({"info": updated_id})
     else:
         return jsonify({"info": f"Invalid data type {dtype}."}), 400
 
@@ -921,4 +1014,8 @@ def delete_tumblebase(tumblebase_id):
 
 
 if __name__ == "__main__":
+    app.config["TUMBLEWEB_BUSINESS_LOGIC"].start_image_garbage_collection()
+    app.config["TUMBLEWEB_BUSINESS_LOGIC"].start_packet_reassembly()
+    app.config["TUMBLEWEB_BUSINESS_LOGIC"].start_command_dispatch()
+    app.config["TUMBLEWEB_BUSINESS_LOGIC"].start_command_timeout_sweep()
     app.run(host="0.0.0.0", port="8006")
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def series_from_chunks(chunks):
+    """
+    Collect a streamed series into one array without holding all rows as python objects at once.
+    :param chunks: An iterable of lists of (id, x, y) rows.
+    :return: An array with one row per datapoint and the columns id, x and y.
+    """
+    arrays = [np.array(rows, dtype=np.float64) for rows in chunks]
+    if len(arrays) == 0:
+        return np.empty((0, 3), dtype=np.float64)
+    return np.concatenate(arrays)
+
+
+def lttb(x, y, max_points):
+    """
+    Select at most max_points points of the series with the Largest-Triangle-Three-Buckets algorithm by Sveinn
+    Steinarsson. The first and last point are always kept, every bucket in between contributes the point spanning the
+    largest triangle with the previously selected point and the average of the next bucket.
+    :param x: The x values, sorted ascending.
+    :param y: The y values.
+    :param max_points: The maximum number of points to select, at least 3.
+    :return: The indices of the selected points, sorted ascending.
+    """
+    length = len(x)
+    if max_points >= length or max_points < 3:
+        return np.arange(length)
+    # bucket i covers the points bounds[i] to bounds[i + 1], the first and the last point form buckets on their own
+    bounds = (np.arange(max_points - 1) * (length - 2) / (max_points - 2)).astype(np.int64) + 1
+    bounds[-1] = length - 1
+    sizes = np.diff(bounds)
+    averages_x = np.add.reduceat(x[:-1], bounds[:-1]) / sizes
+    averages_y = np.add.reduceat(y[:-1], bounds[:-1]) / sizes
+    averages_x = np.append(averages_x, x[-1])
+    averages_y = np.append(averages_y, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = bounds[i], bounds[i + 1]
+        areas = np.abs((x[a] - averages_x[i + 1]) * (y[start:end] - y[a])
+                       - (x[a] - x[start:end]) * (averages_y[i + 1] - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
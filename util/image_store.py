@@ -0,0 +1,78 @@
+from util.utils import get_config_parser
+from threading import Lock
+import tempfile
+import hashlib
+import fleep
+import os
+
+
+class ImageStore:
+    """
+    Stores images content addressed: the name of an image file is the SHA-256 hash of the image, so identical images,
+    for example frames resent by a camera, are stored only once. The files are sharded into two levels of
+    subdirectories named after the first two pairs of hex digits of the hash, which keeps every directory small.
+    Files are written to a temporary file in the target directory first and renamed, so a file with its final name is
+    always complete.
+    """
+
+    header_size = 128
+    default_format = "raw"
+
+    def __init__(self, root_path):
+        self._root_path = root_path
+
+    @property
+    def root_path(self):
+        return self._root_path
+
+    def put(self, image):
+        """
+        Store the image unless an identical image is stored already.
+        :param image: The image as bytes.
+        :return: The path of the image file.
+        """
+        digest = hashlib.sha256(image).hexdigest()
+        path = self.get_path(digest, self.detect_format(image))
+        try:
+            # refresh the modification time, so the garbage collector does not remove a file which is referenced again
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as f:
+                f.write(image)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        return path
+
+    def get_path(self, digest, image_format):
+        return os.path.join(self._root_path, digest[0:2], digest[2:4], f"{digest}.{image_format}")
+
+    @classmethod
+    def detect_format(cls, image):
+        """Detect the format from the header of the image, fleep only needs its first bytes."""
+        extensions = fleep.get(image[:cls.header_size]).extension
+        return extensions[0] if len(extensions) > 0 else cls.default_format
+
+
+_image_store = None
+_image_store_lock = Lock()
+
+
+def get_image_store():
+    """
+    Return the image store configured in environment.ini. The configuration is read once per process.
+    """
+    global _image_store
+    if _image_store is None:
+        with _image_store_lock:
+            if _image_store is None:
+                config_parser = get_config_parser("environment.ini")
+                _image_store = ImageStore(config_parser["paths"]["images"])
+    return _image_store
@@ -0,0 +1,31 @@
+from datetime import datetime
+import base64
+import json
+
+
+def encode_cursor(*values):
+    """
+    Encode the sort key of the last entity of a page as an opaque cursor, which can be handed out to clients.
+    :param values: The values of the sort key, integers, strings or datetimes.
+    :return: The cursor as url safe string.
+    """
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decode a cursor created by encode_cursor.
+    :param cursor: The cursor as string.
+    :param types: The types of the values of the sort key, int, str or datetime.
+    :return: A tuple of the values of the sort key.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode((cursor + padding).encode()).decode())
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(f"Invalid cursor {cursor}")
+        return tuple(datetime.fromisoformat(value) if value_type is datetime else value_type(value)
+                     for value, value_type in zip(values, types))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor {cursor}")
@@ -0,0 +1,30 @@
+from threading import Thread, Event
+
+
+class PeriodicTask:
+    """
+    Calls a function every interval seconds in a daemon thread. Exceptions are logged and do not stop the task.
+    """
+
+    def __init__(self, name, function, interval, logger):
+        self._name = name
+        self._function = function
+        self._interval = interval
+        self._logger = logger
+        self._thread = None
+        self._stopped = Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._function()
+            except Exception as e:
+                self._logger.error(f"PeriodicTask {self._name}: {e}")
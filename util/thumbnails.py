@@ -0,0 +1,113 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import tempfile
+import os
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is optional, without it no thumbnails are generated and the original images are served instead
+    Image = None
+
+
+def get_thumbnail_path(path, size_name):
+    """
+    Thumbnails are stored next to their image, named after the image and the size, for example abcd.thumb.jpg.
+    """
+    return f"{os.path.splitext(path)[0]}.{size_name}.jpg"
+
+
+def create_thumbnails(path, sizes):
+    """
+    Create the missing thumbnails of an image. The largest thumbnail is scaled down from the image, every smaller one
+    from the previous thumbnail. This function runs in the worker processes of the ThumbnailGenerator.
+    :param path: The path of the image file.
+    :param sizes: A dictionary which maps the name of every size to the maximum width and height in pixels.
+    :return: The paths of the created thumbnails.
+    """
+    missing = [(size_name, pixels) for size_name, pixels in sizes.items()
+               if not os.path.exists(get_thumbnail_path(path, size_name))]
+    if len(missing) == 0:
+        return []
+    created = list()
+    with Image.open(path) as image:
+        largest = max(pixels for _, pixels in missing)
+        image.draft("RGB", (largest, largest))
+        thumbnail = image.convert("RGB")
+    for size_name, pixels in sorted(missing, key=lambda size: size[1], reverse=True):
+        thumbnail.thumbnail((pixels, pixels))
+        thumbnail_path = get_thumbnail_path(path, size_name)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(thumbnail_path), prefix=".",
+                                                           suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as f:
+                thumbnail.save(f, format="JPEG", quality=85)
+            os.replace(temporary_path, thumbnail_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        created.append(thumbnail_path)
+    return created
+
+
+class ThumbnailGenerator:
+    """
+    Generates thumbnails of stored images in a pool of worker processes, so neither the request storing an image nor
+    other requests wait for the scaling.
+    """
+
+    def __init__(self, sizes, max_workers, logger):
+        self._sizes = sizes
+        self._max_workers = max_workers
+        self._logger = logger
+        self._executor = None
+        self._lock = Lock()
+
+    @property
+    def sizes(self):
+        return self._sizes
+
+    @property
+    def available(self):
+        return Image is not None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+        return self._executor
+
+    def submit(self, path):
+        """
+        Generate the thumbnails of the image in the background.
+        :return: The future of the generation or None if Pillow is not installed.
+        """
+        if not self.available:
+            return None
+        future = self.executor.submit(create_thumbnails, path, self._sizes)
+        future.add_done_callback(lambda done: self._log_failure(path, done))
+        return future
+
+    def get_thumbnail(self, path, size_name):
+        """
+        Return the path of a thumbnail of the image. A thumbnail which has not been generated yet, for example of an
+        image stored before thumbnails existed, is generated right away.
+        :return: The path of the thumbnail or None if Pillow is not installed.
+        """
+        if not self.available:
+            return None
+        thumbnail_path = get_thumbnail_path(path, size_name)
+        if not os.path.exists(thumbnail_path):
+            create_thumbnails(path, {size_name: self._sizes[size_name]})
+        return thumbnail_path
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _log_failure(self, path, future):
+        if future.exception() is not None:
+            self._logger.error(f"ThumbnailGenerator.submit(): could not create thumbnails of {path}: "
+                               f"{future.exception()}")
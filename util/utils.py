@@ -1,6 +1,7 @@
 from configparser import ExtendedInterpolation, ConfigParser
 from config import config_path
 import os
+import re
 
 
 def get_config_parser(file_name):
@@ -14,6 +15,22 @@ def get_config_parser(file_name):
     return config_parser
 
 
+duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(duration):
+    """
+    Parse a duration given as a number followed by a unit, for example 500ms, 10s, 5m, 1h or 1d.
+    :param duration: The duration as string.
+    :return: The duration in seconds.
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)(ms|s|m|h|d)", duration.strip())
+    if match is None:
+        raise ValueError(f"Invalid duration {duration}")
+    value, unit = match.groups()
+    return float(value) * duration_units[unit]
+
+
 # Define constants for messages that will be presented to the user.
 message_config_parser = get_config_parser("messages.ini")
 internal_server_error_message = message_config_parser["errors"]["server_error"]